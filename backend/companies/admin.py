@@ -2,8 +2,12 @@
 Django Admin configuration for Companies app
 """
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
+from core import versions
+from queues.index import queue_index
 from .models import Company
+from .token_cache import company_tokens
 
 
 @admin.register(Company)
@@ -47,9 +51,15 @@ class CompanyAdmin(admin.ModelAdmin):
     @admin.action(description='Pause selected companies')
     def pause_companies(self, request, queryset):
         queryset.update(status='paused')
+        transaction.on_commit(queue_index.invalidate)
+        transaction.on_commit(company_tokens.clear)
+        transaction.on_commit(versions.bump_epoch)
         self.message_user(request, f"Paused {queryset.count()} companies")
     
     @admin.action(description='Resume recruiting for selected companies')
     def resume_companies(self, request, queryset):
         queryset.update(status='recruiting')
+        transaction.on_commit(queue_index.invalidate)
+        transaction.on_commit(company_tokens.clear)
+        transaction.on_commit(versions.bump_epoch)
         self.message_user(request, f"Resumed {queryset.count()} companies")
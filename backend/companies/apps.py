@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CompaniesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'companies'
+
+    def ready(self):
+        # Invalidate cached token lookups on company changes
+        from . import signals  # noqa: F401
@@ -0,0 +1,237 @@
+"""
+Company dashboard state and incremental deltas
+The dashboard (in_interview / waiting / completed sections) is built here
+for CompanyDashboardView and for the delta stream: after a request that
+touched a company's queue, its new state is diffed against the last one
+pushed and only the changes go out on company_{token} as a
+'dashboard_delta':
+
+    {'seq': 8, 'base': 7, 'ops': [
+        {'op': 'added' | 'moved' | 'updated', 'section': 'waiting', 'row': {...}},
+        {'op': 'removed', 'id': 42},
+        {'op': 'company', 'company': {...}, 'stats': {...}}
+    ]}
+
+Ops carry whole rows, so applying one twice is harmless. A client applies
+a delta when its base is the seq it holds (the GET returns one) and
+refetches otherwise.
+
+Deltas are computed after the response (buffer.DeferredRunner). The last
+state pushed stays in this process (at most MAX_STATES dashboards, least
+recently pushed dropped); only its seq is shared in the cache, so a
+worker whose copy is stale, missing or evicted sends an empty delta from
+an unknown base instead (clients refetch). Dashboards without a socket
+are not built at all: their state is dropped and reseeded by the next GET.
+
+The shared seq is one of the GET's ETag versions (core.versions), so a
+dropped or reseeded state is never answered with a 304 carrying the
+seq it replaced.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Q
+
+SECTIONS = ('in_interview', 'waiting', 'completed')
+COMPLETED_LIMIT = 20
+EVENT_TYPE = 'dashboard_delta'
+# Dashboard states kept by a process
+MAX_STATES = 500
+# Locks shared by company ids (read-diff-write of one dashboard)
+LOCK_STRIPES = 64
+
+
+def seq_key(company_id):
+    return f'dashboard_seq:{company_id}'
+
+
+def _seed():
+    # A state reseeded after eviction must not reuse a seq clients hold
+    return time.time_ns() // 1000
+
+
+def build_dashboard(company):
+    """
+    CompanyDashboardView payload (one query for the three sections)
+    """
+    from queues.serializers import QueueCompanySerializer
+    from queues.services import QueueService
+    from .serializers import CompanyDashboardSerializer
+
+    # Use service for queue status (one query, completed limited in SQL)
+    queue_status = QueueService.get_queue_status(company, completed_limit=COMPLETED_LIMIT)
+    # Same rows give the interview count: no extra COUNT in the serializer
+    company.current_interview_count = queue_status['current_interview_count']
+
+    return {
+        'company': CompanyDashboardSerializer(company).data,
+        'in_interview': QueueCompanySerializer(queue_status['in_interview'], many=True).data,
+        'waiting': QueueCompanySerializer(queue_status['waiting'], many=True).data,
+        'completed': QueueCompanySerializer(queue_status['completed'], many=True).data,
+        'stats': {
+            'total_waiting': queue_status['total_waiting'],
+            'available_now': queue_status['available_count']
+        }
+    }
+
+
+def _state(payload, seq):
+    return {
+        'seq': seq,
+        'company': payload['company'],
+        'stats': payload['stats'],
+        'rows': {
+            row['id']: (section, row)
+            for section in SECTIONS
+            for row in payload[section]
+        }
+    }
+
+
+def diff(previous, current):
+    """Ops turning the previous state into the current one"""
+    ops = []
+    old_rows, new_rows = previous['rows'], current['rows']
+    for queue_id, (section, row) in new_rows.items():
+        if queue_id not in old_rows:
+            ops.append({'op': 'added', 'section': section, 'row': row})
+        elif old_rows[queue_id][0] != section:
+            ops.append({'op': 'moved', 'section': section, 'row': row})
+        elif old_rows[queue_id][1] != row:
+            ops.append({'op': 'updated', 'section': section, 'row': row})
+    ops += [{'op': 'removed', 'id': queue_id} for queue_id in old_rows if queue_id not in new_rows]
+    if previous['company'] != current['company'] or previous['stats'] != current['stats']:
+        ops.append({'op': 'company', 'company': current['company'], 'stats': current['stats']})
+    return ops
+
+
+class DashboardStream:
+    """Last pushed state of each company dashboard (this process), seq in the cache"""
+
+    def __init__(self, max_states=MAX_STATES):
+        self.max_states = max_states
+        self._locks = tuple(threading.Lock() for _ in range(LOCK_STRIPES))
+        self._states_lock = threading.Lock()
+        # company_id -> last state pushed, least recently pushed first
+        self._states = OrderedDict()
+
+    def _lock(self, company_id):
+        return self._locks[company_id % LOCK_STRIPES]
+
+    def _get(self, company_id):
+        """State of this process, None if missing or another worker pushed since"""
+        with self._states_lock:
+            state = self._states.get(company_id)
+        if state is not None and cache.get(seq_key(company_id)) == state['seq']:
+            return state
+        return None
+
+    def _store(self, company_id, state):
+        cache.set(seq_key(company_id), state['seq'], timeout=None)
+        with self._states_lock:
+            self._states[company_id] = state
+            self._states.move_to_end(company_id)
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+
+    def _drop(self, company_id):
+        with self._states_lock:
+            self._states.pop(company_id, None)
+
+    def _forget(self, company_id):
+        """Drop the state and its seq: the next GET (new ETag) reseeds both"""
+        self._drop(company_id)
+        cache.delete(seq_key(company_id))
+
+    def _seed_state(self, company):
+        state = _state(build_dashboard(company), seq=_seed())
+        self._store(company.id, state)
+        return state
+
+    def current_seq(self, company):
+        """
+        Seq the dashboard GET returns, read before its query: any later
+        delta applies on top of it (seeds the state on first use)
+        """
+        with self._lock(company.id):
+            state = self._get(company.id) or self._seed_state(company)
+            return state['seq']
+
+    def push(self, companies):
+        """
+        Send a delta to each company whose dashboard changed
+
+        Returns:
+            dict: {company_id: delta} for the deltas sent
+        """
+        from notifications.presence import presence
+        from notifications.services import NotificationService
+
+        offline = presence.offline([f"company_{company.access_token}" for company in companies])
+        sends, deltas = [], {}
+        for company in companies:
+            group_name = f"company_{company.access_token}"
+            with self._lock(company.id):
+                if group_name in offline:
+                    self._forget(company.id)
+                    continue
+                previous = self._get(company.id)
+                if previous is None:
+                    # No usable state: an empty delta from an unknown base
+                    # makes connected clients refetch (their GET reseeds it)
+                    self._drop(company.id)
+                    seq = _seed()
+                    cache.set(seq_key(company.id), seq, timeout=None)
+                    delta = {'seq': seq, 'base': None, 'ops': []}
+                else:
+                    current = _state(build_dashboard(company), seq=previous['seq'] + 1)
+                    delta = {'seq': current['seq'], 'base': previous['seq'], 'ops': diff(previous, current)}
+                    if not delta['ops']:
+                        continue
+                    self._store(company.id, current)
+            deltas[company.id] = delta
+            sends.append((group_name, EVENT_TYPE, delta))
+        NotificationService._send_many(sends)
+        return deltas
+
+
+dashboard_stream = DashboardStream()
+
+
+def push(targets):
+    """
+    Deferred once per request (notifications.buffer) with the companies
+    and students the request touched
+
+    A student change shows up in the dashboards listing them
+    (listing_company_ids).
+    """
+    from .models import Company
+
+    company_ids = {target[1] for target in targets if target[0] in ('company', 'queue')}
+    student_ids = {target[1] for target in targets if target[0] == 'student'}
+    if student_ids:
+        company_ids |= listing_company_ids(student_ids)
+    if not company_ids:
+        return {}
+    return dashboard_stream.push(Company.objects.filter(id__in=company_ids))
+
+
+def listing_company_ids(student_ids):
+    """
+    Companies whose dashboard lists one of these students (greyed, in
+    interview elsewhere): where they queue, and where one of their
+    completions is among the COMPLETED_LIMIT latest shown
+    """
+    from queues.models import Queue
+    from queues.services import _count
+
+    later_completions = _count(Queue.objects.filter(
+        company=OuterRef('company'), is_completed=True, completed_at__gt=OuterRef('completed_at')
+    ))
+    listed = Queue.objects.filter(student_id__in=student_ids).annotate(
+        later_completions=later_completions
+    ).filter(Q(is_completed=False) | Q(later_completions__lt=COMPLETED_LIMIT))
+    return set(listed.values_list('company_id', flat=True))
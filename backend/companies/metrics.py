@@ -0,0 +1,149 @@
+"""
+Live company queue metrics for the student company list
+Students browsing the list subscribe to the companies they see
+({"type": "subscribe", "companies": [ids]}) and get their queue_length,
+available_slots and status as they change, instead of refetching
+CompanyListView after every event.
+
+After a request that touched some companies' queues, their metrics are
+computed once (one query) and compared with the last values sent; only
+the changed fields go out, once per tick (COMPANY_METRICS_INTERVAL), on
+the shared group metrics_company_{id}:
+
+    {'type': 'company_metrics', 'data': {'company_id': 3, 'queue_length': 7}}
+
+Every subscriber of a company receives the same message. Metrics are not
+replayed on reconnect: the client refetches the list and resubscribes.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+
+from notifications.dispatcher import notification_dispatcher
+
+EVENT_TYPE = 'company_metrics'
+# Companies one socket may follow
+MAX_SUBSCRIPTIONS = 200
+
+
+def group_name(company_id):
+    # Not company_*: those are the replayed dashboard groups (outbox)
+    return f"metrics_company_{company_id}"
+
+
+def company_metrics(company):
+    """Metrics of a company annotated by with_queue_stats()"""
+    return {
+        'status': company.status,
+        'queue_length': company.get_queue_length(),
+        'available_slots': company.get_available_slots()
+    }
+
+
+class CompanyMetricsStream:
+    """Pending metric changes per company, published once per tick"""
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'COMPANY_METRICS_INTERVAL', 1.0)
+        self._loop = None
+        self._task = None
+        self._lock = threading.Lock()
+        # company_id -> latest metrics not published yet
+        self._pending = {}
+        # company_id -> metrics last published
+        self._sent = {}
+
+    # ==========================================
+    # Lifecycle
+    # ==========================================
+
+    def bind(self, loop):
+        """Start ticking on the ASGI loop (idempotent)"""
+        if self._loop is loop:
+            return
+        with self._lock:
+            if self._loop is loop:
+                return
+            self._task = loop.create_task(self._tick())
+            self._loop = loop
+
+    def unbind(self):
+        with self._lock:
+            if self._task:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            self._loop = self._task = None
+
+    @property
+    def is_bound(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    # ==========================================
+    # Publishing
+    # ==========================================
+
+    def update(self, metrics):
+        """
+        Record the current metrics of some companies ({company_id: metrics});
+        the next tick publishes what differs from the last values sent
+        """
+        with self._lock:
+            self._pending.update(metrics)
+        if not self.is_bound:
+            self.flush()
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Company metrics tick error: {e}")
+
+    def flush(self):
+        """
+        Publish the changed fields of every pending company
+
+        Returns:
+            int: number of companies published
+        """
+        messages = []
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for company_id, metrics in pending.items():
+                last = self._sent.get(company_id, {})
+                changed = {key: value for key, value in metrics.items() if last.get(key) != value}
+                if not changed:
+                    continue
+                self._sent[company_id] = metrics
+                messages.append((group_name(company_id), {
+                    'type': EVENT_TYPE,
+                    'data': {'company_id': company_id, **changed}
+                }))
+        if messages:
+            notification_dispatcher.submit_many(messages)
+        return len(messages)
+
+
+company_metrics_stream = CompanyMetricsStream()
+
+
+def push(targets):
+    """
+    Deferred once per request (notifications.buffer) with the companies
+    and students the request touched
+
+    Interviews started or ended come as company targets (slots), queue
+    targets move queue_length; a student's own changes show nowhere here.
+    """
+    from .models import Company
+
+    company_ids = {target[1] for target in targets if target[0] in ('company', 'queue')}
+    if not company_ids:
+        return {}
+    metrics = {
+        company.id: company_metrics(company)
+        for company in Company.objects.filter(id__in=company_ids).with_queue_stats()
+    }
+    company_metrics_stream.update(metrics)
+    return metrics
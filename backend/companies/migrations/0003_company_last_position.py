@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+def init_last_position(apps, schema_editor):
+    """Start each company's counter at its current highest position"""
+    Company = apps.get_model('companies', 'Company')
+    Queue = apps.get_model('queues', 'Queue')
+    
+    max_positions = Queue.objects.values('company').annotate(
+        max_pos=models.Max('position')
+    ).values_list('company', 'max_pos')
+    for company_id, max_pos in max_positions:
+        Company.objects.filter(pk=company_id).update(last_position=max_pos)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0002_company_max_queue_size'),
+        ('queues', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='last_position',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(init_last_position, migrations.RunPython.noop),
+    ]
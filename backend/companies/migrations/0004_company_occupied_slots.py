@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def init_occupied_slots(apps, schema_editor):
+    """Start each company's slot counter at its current interview count"""
+    Company = apps.get_model('companies', 'Company')
+    Queue = apps.get_model('queues', 'Queue')
+    
+    for company in Company.objects.all():
+        company.occupied_slots = Queue.objects.filter(
+            company=company,
+            is_completed=False,
+            student__current_company=company
+        ).count()
+        company.save(update_fields=['occupied_slots'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0003_company_last_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='occupied_slots',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(init_occupied_slots, migrations.RunPython.noop),
+    ]
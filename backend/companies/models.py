@@ -4,7 +4,11 @@ Companies access via unique token URL, no user account needed
 Implements status and slots management per business rules R9-R12, R17-R20
 """
 import secrets
-from django.db import models
+from functools import partial
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
 
 
 def generate_access_token():
@@ -12,6 +16,30 @@ def generate_access_token():
     return secrets.token_urlsafe(24)  # 32 chars base64
 
 
+class CompanyQuerySet(models.QuerySet):
+    """QuerySet helpers for company listings"""
+    
+    def with_queue_stats(self):
+        """
+        Annotate queue stats in the same query (no COUNT per company)
+        - current_interview_count: R11 students interviewing here
+        - queue_length: non-completed inscriptions
+        """
+        return self.annotate(
+            current_interview_count=Count(
+                'queue_entries',
+                filter=Q(
+                    queue_entries__is_completed=False,
+                    queue_entries__student__current_company=F('pk')
+                )
+            ),
+            queue_length=Count(
+                'queue_entries',
+                filter=Q(queue_entries__is_completed=False)
+            )
+        )
+
+
 class Company(models.Model):
     """
     Company participating in job fair
@@ -41,8 +69,14 @@ class Company(models.Model):
     max_concurrent_interviews = models.PositiveIntegerField(default=1)
     # Optional: limit number of students in queue
     max_queue_size = models.PositiveIntegerField(null=True, blank=True, default=None)
+    # R1: Per-company position counter, last position handed out
+    last_position = models.PositiveIntegerField(default=0, editable=False)
+    # R11: Slots currently taken, claimed/released atomically (see claim_interview_slot)
+    occupied_slots = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = CompanyQuerySet.as_manager()
+    
     class Meta:
         db_table = 'companies'
         verbose_name = 'Company'
@@ -51,17 +85,125 @@ class Company(models.Model):
     def __str__(self):
         return self.name
     
+    # Maintained by atomic UPDATEs only, never written back from an instance
+    COUNTER_FIELDS = ('last_position', 'occupied_slots')
+    
+    def save(self, *args, **kwargs):
+        """Save without overwriting counters with possibly stale values"""
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     def regenerate_token(self):
         """Generate new access token (used if token is compromised)"""
+        from .token_cache import company_tokens
+        
+        old_token = self.access_token
         self.access_token = generate_access_token()
         self.save()
+        # The old token must stop resolving everywhere, not after the TTL
+        transaction.on_commit(partial(company_tokens.invalidate, old_token))
         return self.access_token
     
+    def allocate_queue_position(self):
+        """
+        R1: Atomically reserve the next queue position
+        
+        Single UPDATE ... RETURNING on the company row. The row stays locked
+        until the surrounding transaction ends, which serializes concurrent
+        inscriptions at this company. Also refreshes max_queue_size from the
+        locked row for the capacity check.
+        """
+        table = connection.ops.quote_name(self._meta.db_table)
+        with connection.cursor() as cursor:
+            if connection.vendor in ('postgresql', 'sqlite'):
+                cursor.execute(
+                    f"UPDATE {table} SET last_position = last_position + 1 "
+                    f"WHERE id = %s RETURNING last_position, max_queue_size",
+                    [self.pk]
+                )
+            else:
+                cursor.execute(
+                    f"UPDATE {table} SET last_position = last_position + 1 WHERE id = %s",
+                    [self.pk]
+                )
+                cursor.execute(
+                    f"SELECT last_position, max_queue_size FROM {table} WHERE id = %s",
+                    [self.pk]
+                )
+            self.last_position, self.max_queue_size = cursor.fetchone()
+        return self.last_position
+    
+    def claim_interview_slot(self):
+        """
+        R10-R11: Atomically take one interview slot
+        
+        Conditional UPDATE on the company row, only succeeds while recruiting
+        and below max_concurrent_interviews. The row stays locked until the
+        transaction ends. Lock order for slot changes: company row, then
+        student row (shared with release_interview_slot callers).
+        
+        Returns:
+            bool: True if a slot was taken
+        """
+        claimed = self._claim_slot()
+        # Counter may sit above the real count (e.g. student deleted mid-interview)
+        if not claimed and self.sync_occupied_slots():
+            claimed = self._claim_slot()
+        self._reload_slots()
+        return claimed
+    
+    def _claim_slot(self):
+        return Company.objects.filter(
+            pk=self.pk,
+            status='recruiting',
+            occupied_slots__lt=F('max_concurrent_interviews')
+        ).update(occupied_slots=F('occupied_slots') + 1) == 1
+    
+    def occupy_interview_slot(self):
+        """Take a slot without checks (admin/legacy paths that force an interview)"""
+        Company.objects.filter(pk=self.pk).update(occupied_slots=F('occupied_slots') + 1)
+        self._reload_slots()
+    
+    def release_interview_slot(self):
+        """R12: Free one slot, locking the company row first"""
+        Company.objects.filter(pk=self.pk).update(
+            occupied_slots=Greatest(F('occupied_slots') - 1, 0)
+        )
+        self._reload_slots()
+    
+    def _reload_slots(self):
+        # has_available_slots reads the counter from this instance
+        self.refresh_from_db(fields=['occupied_slots'])
+    
+    def sync_occupied_slots(self):
+        """
+        Reset the slot counter to the real interview count
+        
+        Returns:
+            bool: True if the counter had drifted and was corrected
+        """
+        with transaction.atomic():
+            list(Company.objects.select_for_update().filter(pk=self.pk).values_list('pk'))
+            actual = self.get_current_interview_count()
+            drifted = Company.objects.filter(pk=self.pk).exclude(
+                occupied_slots=actual
+            ).update(occupied_slots=actual) == 1
+            self.occupied_slots = actual
+            return drifted
+    
     def get_current_interview_count(self):
         """
         R11: Count students currently in interview with this company
         slots_occupés = COUNT(étudiants WHERE current_company = X AND is_completed = False)
         """
+        # Annotated by Company.objects.with_queue_stats()
+        if hasattr(self, 'current_interview_count'):
+            return self.current_interview_count
+        
         from queues.models import Queue
         # Students in interview at this company and not yet marked complete
         return Queue.objects.filter(
@@ -70,13 +212,23 @@ class Company(models.Model):
             student__current_company=self
         ).count()
     
+    def get_queue_length(self):
+        """Count non-completed inscriptions in this company's queue"""
+        # Annotated by Company.objects.with_queue_stats()
+        if hasattr(self, 'queue_length'):
+            return self.queue_length
+        return self.queue_entries.filter(is_completed=False).count()
+    
     def get_available_slots(self):
         """Calculate number of available interview slots"""
         return max(0, self.max_concurrent_interviews - self.get_current_interview_count())
     
     def has_available_slots(self):
-        """Check if company can accept new interviews (R10)"""
-        return self.get_available_slots() > 0 and self.status == 'recruiting'
+        """
+        Check if company can accept new interviews (R10)
+        Same condition (slot counter) claim_interview_slot updates on
+        """
+        return self.status == 'recruiting' and self.occupied_slots < self.max_concurrent_interviews
     
     def is_recruiting(self):
         """R17: Check if company appears in public list"""
@@ -22,7 +22,7 @@ class CompanyPublicSerializer(serializers.ModelSerializer):
         return obj.get_available_slots()
     
     def get_queue_length(self, obj):
-        return obj.queue_entries.filter(is_completed=False).count()
+        return obj.get_queue_length()
 
 
 class CompanyDashboardSerializer(serializers.ModelSerializer):
@@ -95,7 +95,7 @@ class CompanyAdminSerializer(serializers.ModelSerializer):
         return obj.get_current_interview_count()
     
     def get_queue_length(self, obj):
-        return obj.queue_entries.filter(is_completed=False).count()
+        return obj.get_queue_length()
 
 
 class CompanyCreateSerializer(serializers.ModelSerializer):
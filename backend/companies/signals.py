@@ -0,0 +1,18 @@
+"""
+Signal handlers keeping the company token cache current
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Company
+from .token_cache import company_tokens
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def company_changed(sender, instance, **kwargs):
+    # Status/settings are read from the cached instance: drop it once committed
+    transaction.on_commit(partial(company_tokens.invalidate, instance.access_token))
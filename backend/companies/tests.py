@@ -1,3 +1,310 @@
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+from students.models import Student
+from companies import dashboard, metrics
+from companies.models import Company
+from companies.token_cache import company_tokens
+from notifications.consumers import NotificationConsumer
+from notifications.middleware import WebSocketAuthMiddleware
+from notifications.models import OutboxEvent
+from queues.models import Queue
+from core import versions
+from users.serializers import JobFairTokenObtainPairSerializer
+
+User = get_user_model()
+
+
+class CompanyListQueryCountTest(TestCase):
+    """Company list is served from one annotated query (no N+1)"""
+
+    def setUp(self):
+        self.students = []
+        for i in range(3):
+            user = User.objects.create(email=f'list{i}@test.com', role='student')
+            self.students.append(
+                Student.objects.create(user=user, first_name=f'S{i}', last_name='Test')
+            )
+        self.admin = User.objects.create(email='admin@test.com', role='admin')
+
+    def _add_companies(self, count):
+        offset = Company.objects.count()
+        for i in range(count):
+            company = Company.objects.create(name=f'List Company {offset + i}')
+            for student in self.students[:i % 3 + 1]:
+                Queue.objects.create(company=company, student=student)
+
+    def _count_queries(self, user, url):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_student_list_constant_queries(self):
+        """Query count does not grow with the number of companies"""
+        student_user = self.students[0].user
+        self._add_companies(2)
+        small = self._count_queries(student_user, '/api/companies/')
+        self._add_companies(12)
+        large = self._count_queries(student_user, '/api/companies/')
+        self.assertEqual(small, large)
+
+    def test_admin_list_constant_queries(self):
+        """Admin serializer reuses the same annotation"""
+        self._add_companies(2)
+        small = self._count_queries(self.admin, '/api/companies/admin/companies/')
+        self._add_companies(12)
+        large = self._count_queries(self.admin, '/api/companies/admin/companies/')
+        self.assertEqual(small, large)
+
+    def test_annotations_match_model_counts(self):
+        """Annotated stats equal the per-company COUNT queries"""
+        self._add_companies(4)
+        first = Company.objects.order_by('name').first()
+        self.students[0].start_interview(first)
+
+        for company in Company.objects.with_queue_stats():
+            plain = Company.objects.get(pk=company.pk)
+            self.assertEqual(company.current_interview_count, plain.get_current_interview_count())
+            self.assertEqual(company.queue_length, plain.get_queue_length())
+            self.assertEqual(company.get_available_slots(), plain.get_available_slots())
+
+
+class CompanyTokenCacheTest(TestCase):
+    """Token lookups are cached and invalidated on company changes"""
+
+    def setUp(self):
+        company_tokens.clear()
+        company_tokens.reset_stats()
+        self.company = Company.objects.create(name='Token Corp')
+
+    def test_hits_after_first_lookup(self):
+        with self.assertNumQueries(1):
+            company_tokens.get_company(self.company.access_token)
+        with self.assertNumQueries(0):
+            cached = company_tokens.get_company(self.company.access_token)
+        self.assertEqual(cached.id, self.company.id)
+        self.assertEqual(company_tokens.stats()['hits'], 1)
+        self.assertEqual(company_tokens.stats()['misses'], 1)
+        self.assertIsNone(company_tokens.get_company('unknown-token'))
+
+    def test_pause_invalidates(self):
+        company_tokens.get_company(self.company.access_token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.pause()
+        cached = company_tokens.get_company(self.company.access_token)
+        self.assertEqual(cached.status, 'paused')
+
+    def test_regenerated_token_stops_resolving(self):
+        old_token = self.company.access_token
+        company_tokens.get_company(old_token)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_token = self.company.regenerate_token()
+        self.assertIsNone(company_tokens.get_company(old_token))
+        self.assertEqual(company_tokens.get_company(new_token).id, self.company.id)
+
+    def test_bulk_update_clears(self):
+        company_tokens.get_company(self.company.access_token)
+        Company.objects.update(status='paused')
+        company_tokens.clear()
+        self.assertEqual(company_tokens.get_company(self.company.access_token).status, 'paused')
+
+
+class DashboardDeltaTest(TestCase):
+    """Dashboard changes are pushed as patches on top of the GET's seq"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Delta Corp')
+        self.stream = dashboard.dashboard_stream
+        self.stream._states.clear()
+        dashboard.cache.delete(dashboard.seq_key(self.company.id))
+        user = User.objects.create(email='delta@test.com', role='student')
+        self.student = Student.objects.create(user=user, first_name='Del', last_name='Ta', status='available')
+
+    def _get_seq(self):
+        response = APIClient().get(f'/api/companies/{self.company.access_token}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['seq']
+
+    def _push(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return dashboard.push({('company', self.company.id)})
+
+    def test_deltas_chain_from_get_seq(self):
+        seq = self._get_seq()
+        entry = Queue.objects.create(company=self.company, student=self.student)
+
+        added = self._push()[self.company.id]
+        self.assertEqual((added['base'], added['seq']), (seq, seq + 1))
+        self.assertEqual([(op['op'], op.get('section')) for op in added['ops']], [('added', 'waiting'), ('company', None)])
+
+        Student.objects.filter(pk=self.student.pk).update(status='paused')
+        with self.captureOnCommitCallbacks(execute=True):
+            greyed = dashboard.push({('student', self.student.id)})[self.company.id]
+        self.assertEqual(greyed['base'], seq + 1)
+        self.assertEqual(greyed['ops'][0]['op'], 'updated')
+        self.assertTrue(greyed['ops'][0]['row']['is_greyed'])
+
+        entry_id = entry.id
+        entry.delete()
+        removed = self._push()[self.company.id]
+        self.assertEqual(removed['ops'][0], {'op': 'removed', 'id': entry_id})
+
+        # Sent on the company group, through the outbox
+        events = OutboxEvent.objects.filter(group=f'company_{self.company.access_token}', event_type='dashboard_delta')
+        self.assertEqual([e.data['seq'] for e in events], [seq + 1, seq + 2, seq + 3])
+
+    def test_unchanged_dashboard_sends_nothing(self):
+        self._get_seq()
+        self.assertEqual(self._push(), {})
+
+    def test_missing_state_asks_clients_to_refetch(self):
+        delta = self._push()[self.company.id]
+        self.assertEqual((delta['base'], delta['ops']), (None, []))
+        # Nothing built for a dashboard nobody loaded
+        self.assertEqual(self.stream._states, {})
+
+    def test_stale_copy_asks_clients_to_refetch(self):
+        seq = self._get_seq()
+        Queue.objects.create(company=self.company, student=self.student)
+        # Another worker pushed in between
+        dashboard.cache.set(dashboard.seq_key(self.company.id), seq + 5)
+        delta = self._push()[self.company.id]
+        self.assertEqual((delta['base'], delta['ops']), (None, []))
+        self.assertGreater(delta['seq'], seq + 5)
+
+    def test_offline_dashboard_is_not_built(self):
+        self._get_seq()
+        Queue.objects.create(company=self.company, student=self.student)
+        group = f'company_{self.company.access_token}'
+        with mock.patch('notifications.presence.presence.offline', return_value={group}):
+            self.assertEqual(self._push(), {})
+        self.assertNotIn(self.company.id, self.stream._states)
+
+    def test_dropped_state_is_not_revalidated(self):
+        client = APIClient()
+        url = f'/api/companies/{self.company.access_token}/'
+        first = client.get(url)
+        # The dashboard went offline: its state and seq are dropped
+        group = f'company_{self.company.access_token}'
+        with mock.patch('notifications.presence.presence.offline', return_value={group}):
+            self._push()
+        response = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['seq'], first.data['seq'])
+
+    def test_student_change_bumps_dashboards_listing_them(self):
+        other = Company.objects.create(name='Past Corp')
+        Queue.objects.create(company=other, student=self.student, is_completed=True, completed_at=timezone.now())
+        before = versions.get_versions([versions.company_key(other.id)])
+        versions.bump_student(self.student.id)
+        self.assertNotEqual(versions.get_versions([versions.company_key(other.id)]), before)
+
+    def test_states_and_locks_are_bounded(self):
+        self.stream = dashboard.DashboardStream(max_states=2)
+        companies = [Company.objects.create(name=f'Bounded {i}') for i in range(5)]
+        for company in companies:
+            self.stream.current_seq(company)
+        self.assertEqual(list(self.stream._states), [companies[3].id, companies[4].id])
+        self.assertEqual(len(self.stream._locks), dashboard.LOCK_STRIPES)
+
+    def test_student_change_reaches_dashboards_listing_them(self):
+        other = Company.objects.create(name='Past Corp')
+        Queue.objects.create(company=self.company, student=self.student)
+        Queue.objects.create(company=other, student=self.student, is_completed=True, completed_at=timezone.now())
+        with mock.patch.object(self.stream, 'push', return_value={}) as push:
+            dashboard.push({('student', self.student.id)})
+            self.assertEqual({c.id for c in push.call_args.args[0]}, {self.company.id, other.id})
+
+            # A later completion pushes the student's out of the shown ones
+            user = User.objects.create(email='later@test.com', role='student')
+            later = Student.objects.create(user=user, first_name='La', last_name='Ter')
+            Queue.objects.create(company=other, student=later, is_completed=True,
+                                 completed_at=timezone.now() + timedelta(minutes=1))
+            with mock.patch.object(dashboard, 'COMPLETED_LIMIT', 1):
+                dashboard.push({('student', self.student.id)})
+            self.assertEqual({c.id for c in push.call_args.args[0]}, {self.company.id})
+
+
+class CompanyMetricsTest(TestCase):
+    """Subscribed sockets get the changed metrics of their companies"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Metrics Corp', max_concurrent_interviews=2)
+        user = User.objects.create_user(email='metrics@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Me', last_name='Trics')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        self.stream = metrics.CompanyMetricsStream()
+        patcher = mock.patch.object(metrics, 'company_metrics_stream', self.stream)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _push(self, *targets):
+        with mock.patch.object(metrics, 'notification_dispatcher') as dispatcher:
+            metrics.push(set(targets))
+        return [message for call in dispatcher.submit_many.call_args_list for message in call.args[0]]
+
+    def test_only_changed_fields_are_sent(self):
+        group = metrics.group_name(self.company.id)
+        first = self._push(('company', self.company.id))
+        self.assertEqual(first, [(group, {'type': 'company_metrics', 'data': {
+            'company_id': self.company.id, 'status': 'recruiting', 'queue_length': 0, 'available_slots': 2
+        }})])
+
+        entry = Queue.objects.create(company=self.company, student=self.student)
+        joined = self._push(('queue', self.company.id, entry.position))
+        self.assertEqual(joined[0][1]['data'], {'company_id': self.company.id, 'queue_length': 1})
+
+        self.assertEqual(self._push(('company', self.company.id)), [])
+
+    def test_changes_between_ticks_are_published_once(self):
+        self.stream._loop = mock.Mock(is_closed=mock.Mock(return_value=False))
+        with mock.patch.object(metrics, 'notification_dispatcher') as dispatcher:
+            self.stream.update({self.company.id: {'queue_length': 1}})
+            self.stream.update({self.company.id: {'queue_length': 2}})
+            self.assertEqual(self.stream.flush(), 1)
+        dispatcher.submit_many.assert_called_once_with([(metrics.group_name(self.company.id), {
+            'type': 'company_metrics', 'data': {'company_id': self.company.id, 'queue_length': 2}
+        })])
+
+    def test_socket_follows_subscribed_companies(self):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+        layer = get_channel_layer()
+        message = {'type': 'company_metrics', 'data': {'company_id': self.company.id, 'queue_length': 3}}
+
+        async def follow():
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+            await communicator.connect()
+            # connection_established, catch_up
+            [await communicator.receive_json_from() for _ in range(2)]
+            await communicator.send_json_to({'type': 'subscribe', 'companies': [self.company.id]})
+            subscribed = await communicator.receive_json_from()
+            await layer.group_send(metrics.group_name(self.company.id), message)
+            received = await communicator.receive_json_from()
+
+            await communicator.send_json_to({'type': 'subscribe', 'companies': []})
+            await communicator.receive_json_from()
+            await layer.group_send(metrics.group_name(self.company.id), message)
+            silent = await communicator.receive_nothing()
+
+            await communicator.send_json_to({'type': 'subscribe', 'companies': ['all']})
+            error = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return subscribed, received, silent, error
 
-# Create your tests here.
+        subscribed, received, silent, error = async_to_sync(follow)()
+        self.assertEqual(subscribed, {'type': 'subscribed', 'companies': [self.company.id]})
+        self.assertEqual(received, message)
+        self.assertTrue(silent)
+        self.assertEqual(error['type'], 'error')
@@ -0,0 +1,95 @@
+"""
+Company access-token resolution cache
+Company tablets reconnect and refetch constantly: each dashboard request
+(IsCompanyToken) and company WebSocket resolves its token through here
+instead of querying the companies table every time.
+
+Entries live in the 'company_tokens' cache alias (bounded size and TTL,
+shared through Redis when configured, so every worker sees invalidations).
+Any company save or delete invalidates its token after commit; bulk
+updates bump a generation that every key includes (cache.clear() would
+flush the whole Redis database, channel layer included).
+"""
+import threading
+
+from django.core.cache import caches
+
+CACHE_ALIAS = 'company_tokens'
+GENERATION_KEY = 'company_token_generation'
+
+
+class CompanyTokenCache:
+    """token -> Company lookups with per-process hit/miss counters"""
+
+    def __init__(self, alias=CACHE_ALIAS):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _generation(self):
+        generation = self.cache.get(GENERATION_KEY)
+        if generation is None:
+            self.cache.add(GENERATION_KEY, 0, timeout=None)
+            generation = self.cache.get(GENERATION_KEY, 0)
+        return generation
+
+    def _key(self, token):
+        return f'company_token:{self._generation()}:{token}'
+
+    def get_company(self, token):
+        """
+        Resolve a company access token
+
+        Returns:
+            Company or None if the token is unknown (unknown tokens are not cached)
+        """
+        from companies.models import Company
+
+        key = self._key(token)
+        company = self.cache.get(key)
+        if company is not None:
+            with self._lock:
+                self.hits += 1
+            return company
+
+        with self._lock:
+            self.misses += 1
+        try:
+            company = Company.objects.get(access_token=token)
+        except Company.DoesNotExist:
+            return None
+        self.cache.set(key, company)
+        return company
+
+    def invalidate(self, *tokens):
+        """Drop cached companies for these tokens"""
+        self.cache.delete_many([self._key(token) for token in tokens])
+
+    def clear(self):
+        """Drop every cached company (bulk updates)"""
+        try:
+            self.cache.incr(GENERATION_KEY)
+        except ValueError:
+            self.cache.add(GENERATION_KEY, 1, timeout=None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+company_tokens = CompanyTokenCache()
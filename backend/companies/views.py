@@ -5,22 +5,25 @@ from rest_framework import status, viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from core import versions
 from core.permissions import IsStudent, IsCompanyToken, IsAdmin
+from .dashboard import build_dashboard, dashboard_stream
 from .models import Company
+from .token_cache import company_tokens
 from .serializers import (
     CompanyPublicSerializer,
-    CompanyDashboardSerializer,
     CompanySettingsSerializer,
     CompanyStatusSerializer,
     CompanyAdminSerializer,
     CompanyCreateSerializer
 )
+from queues.index import queue_index
 from queues.models import Queue
 from queues.services import QueueService
 from queues.serializers import QueueCompanySerializer
 from notifications.services import NotificationService
 
-from django.db import models
+from django.db import models, transaction
 from students.models import Student
 from queues.serializers import QueueCreateSerializer
 from django.shortcuts import get_object_or_404
@@ -30,12 +33,16 @@ class CompanyListView(APIView):
     """
     List companies for students
     R17: Only shows companies in 'recruiting' status
+    Queue stats are annotated in a single query, skipped on 304
     """
     
     permission_classes = [IsStudent]
     
+    @versions.versioned(versions.company_list_keys)
     def get(self, request):
-        companies = Company.objects.filter(status='recruiting').order_by('name')
+        companies = Company.objects.filter(
+            status='recruiting'
+        ).with_queue_stats().order_by('name')
         serializer = CompanyPublicSerializer(companies, many=True)
         return Response(serializer.data)
 
@@ -43,27 +50,19 @@ class CompanyListView(APIView):
 class CompanyDashboardView(APIView):
     """
     Company dashboard accessed via token
-    Returns company info + queue sections using QueueService
+    Returns company info + queue sections using QueueService, and the seq
+    of the dashboard_delta stream it is current with (companies.dashboard)
     """
     
     permission_classes = [IsCompanyToken]
     
+    @versions.versioned(versions.company_dashboard_keys)
     def get(self, request, token):
         company = request.company
+        # Read first: deltas after this seq apply on top of the payload
+        seq = dashboard_stream.current_seq(company)
         
-        # Use service for queue status
-        queue_status = QueueService.get_queue_status(company)
-        
-        return Response({
-            'company': CompanyDashboardSerializer(company).data,
-            'in_interview': QueueCompanySerializer(queue_status['in_interview'], many=True).data,
-            'waiting': QueueCompanySerializer(queue_status['waiting'], many=True).data,
-            'completed': QueueCompanySerializer(queue_status['completed'][:20], many=True).data,  # Limit completed
-            'stats': {
-                'total_waiting': queue_status['total_waiting'],
-                'available_now': queue_status['available_count']
-            }
-        })
+        return Response({**build_dashboard(company), 'seq': seq})
 
 
 class CompanySettingsView(APIView):
@@ -92,12 +91,13 @@ class CompanyStatusView(APIView):
         
         serializer = CompanyStatusSerializer(company, data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            new_status = company.status
-            
-            # Trigger notification if status changed
-            if old_status != new_status:
-                NotificationService.on_company_status_change(company, new_status)
+            with transaction.atomic():
+                serializer.save()
+                new_status = company.status
+                
+                # Trigger notification if status changed
+                if old_status != new_status:
+                    NotificationService.on_company_status_change(company, new_status)
             
             return Response({
                 'message': f"Status changed to '{company.status}'",
@@ -111,7 +111,7 @@ class CompanyAdminViewSet(viewsets.ModelViewSet):
     """Admin CRUD for companies"""
     
     permission_classes = [IsAdmin]
-    queryset = Company.objects.all().order_by('name')
+    queryset = Company.objects.with_queue_stats().order_by('name')
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -134,8 +134,9 @@ class CompanyAdminViewSet(viewsets.ModelViewSet):
         """Admin action to pause company"""
         company = self.get_object()
         if company.status != 'paused':
-            company.pause()
-            NotificationService.on_company_status_change(company, 'paused')
+            with transaction.atomic():
+                company.pause()
+                NotificationService.on_company_status_change(company, 'paused')
         return Response({'status': 'paused'})
     
     @action(detail=True, methods=['post'])
@@ -143,15 +144,17 @@ class CompanyAdminViewSet(viewsets.ModelViewSet):
         """Admin action to resume company"""
         company = self.get_object()
         if company.status != 'recruiting':
-            company.resume()
-            NotificationService.on_company_status_change(company, 'recruiting')
+            with transaction.atomic():
+                company.resume()
+                NotificationService.on_company_status_change(company, 'recruiting')
         return Response({'status': 'recruiting'})
 
     @action(detail=True, methods=['get'])
     def queue(self, request, pk=None):
         """Get company queue for admin"""
         company = self.get_object()
-        status = QueueService.get_queue_status(company)
+        # Admin detail shows the full history
+        status = QueueService.get_queue_status(company, completed_limit=None)
         return Response({
             'in_interview': QueueCompanySerializer(status['in_interview'], many=True).data,
             'waiting': QueueCompanySerializer(status['waiting'], many=True).data,
@@ -198,6 +201,9 @@ class CompanyAdminViewSet(viewsets.ModelViewSet):
                 
             queue_item.position = new_position
             queue_item.save()
+            # Shifted positions were bulk updated without signals
+            transaction.on_commit(queue_index.invalidate)
+            transaction.on_commit(versions.bump_epoch)
             
             return Response({'status': 'reordered'})
         except Queue.DoesNotExist:
@@ -228,6 +234,9 @@ class CompanyAdminViewSet(viewsets.ModelViewSet):
     def bulk_resume(self, request):
         """Set all companies to 'recruiting' status"""
         updated_count = Company.objects.all().update(status='recruiting')
+        transaction.on_commit(queue_index.invalidate)
+        transaction.on_commit(company_tokens.clear)
+        transaction.on_commit(versions.bump_epoch)
         return Response({
             'message': f'Updated {updated_count} companies to recruiting',
             'updated': updated_count
@@ -16,10 +16,21 @@ django_asgi_app = get_asgi_application()
 # Import after Django setup
 from notifications.routing import websocket_urlpatterns
 from notifications.middleware import WebSocketAuthMiddleware
+from notifications.dispatcher import DispatcherLoopMiddleware
+from notifications.admin_stream import admin_stream
+from notifications.buffer import deferred_runner
+from notifications.presence import presence
+from companies.metrics import company_metrics_stream
+from queues.index import queue_index
 
-application = ProtocolTypeRouter({
+# Notifications are sent by a background task on this loop (see dispatcher)
+# and pushes computed after the response (see buffer); admin summaries and
+# company metrics are published, silent sockets reaped and the queue index
+# reconciled by tick tasks (see admin_stream, companies.metrics, presence,
+# queues.index)
+application = DispatcherLoopMiddleware(ProtocolTypeRouter({
     'http': django_asgi_app,
     'websocket': WebSocketAuthMiddleware(
         URLRouter(websocket_urlpatterns)
     ),
-})
+}), deferred_runner, admin_stream, company_metrics_stream, presence, queue_index)
@@ -2,7 +2,7 @@
 Custom permissions for JobFair Platform
 """
 from rest_framework import permissions
-from companies.models import Company
+from companies.token_cache import company_tokens
 
 
 class IsStudent(permissions.BasePermission):
@@ -40,13 +40,12 @@ class IsCompanyToken(permissions.BasePermission):
         if not token:
             return False
         
-        try:
-            company = Company.objects.get(access_token=token)
-            # Attach company to request for use in views
-            request.company = company
-            return True
-        except Company.DoesNotExist:
+        company = company_tokens.get_company(token)
+        if company is None:
             return False
+        # Attach company to request for use in views
+        request.company = company
+        return True
 
 
 class IsOwnerOrAdmin(permissions.BasePermission):
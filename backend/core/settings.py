@@ -56,6 +56,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # One coalesced WebSocket message per recipient and request
+    'notifications.buffer.NotificationBufferMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -103,6 +105,11 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Wait for the write lock instead of failing under concurrent inscriptions
+            'OPTIONS': {'timeout': 20},
+            # File-based test DB: in-memory shared cache fails concurrent writers
+            # with "table is locked" instead of waiting, breaking threaded tests
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -129,6 +136,84 @@ else:
         },
     }
 
+# Notification dispatcher (notifications/dispatcher.py): priority lanes drained
+# on the ASGI loop; normal/low messages beyond capacity are dropped and counted
+# (urgent ones never are)
+NOTIFICATION_QUEUE_SIZE = config('NOTIFICATION_QUEUE_SIZE', default=10000, cast=int)
+NOTIFICATION_LOW_QUEUE_SIZE = config('NOTIFICATION_LOW_QUEUE_SIZE', default=1000, cast=int)
+NOTIFICATION_BATCH_SIZE = config('NOTIFICATION_BATCH_SIZE', default=100, cast=int)
+
+# Deferred pushes (notifications/buffer.py): snapshots, dashboard deltas and
+# company metrics run after the response; targets handled per run
+NOTIFICATION_PUSH_BATCH_SIZE = config('NOTIFICATION_PUSH_BATCH_SIZE', default=200, cast=int)
+
+# Worker lag (notifications/backlog.py): seconds behind after which a socket
+# gets a single resync instead of its stale non-urgent events, refetched
+# after a random delay up to WEBSOCKET_RESYNC_JITTER seconds
+WEBSOCKET_MAX_LAG = config('WEBSOCKET_MAX_LAG', default=10.0, cast=float)
+WEBSOCKET_RESYNC_JITTER = config('WEBSOCKET_RESYNC_JITTER', default=5.0, cast=float)
+
+# Handshake admission (notifications/admission.py): concurrent handshakes per
+# worker, how many of them only company tablets and admins may use, and the
+# base retry delay (seconds) suggested to refused sockets
+WEBSOCKET_MAX_HANDSHAKES = config('WEBSOCKET_MAX_HANDSHAKES', default=50, cast=int)
+WEBSOCKET_PRIORITY_HANDSHAKES = config('WEBSOCKET_PRIORITY_HANDSHAKES', default=10, cast=int)
+WEBSOCKET_RETRY_AFTER = config('WEBSOCKET_RETRY_AFTER', default=1.0, cast=float)
+
+# Presence (notifications/presence.py): client ping interval and the silence
+# after which a socket is reaped (seconds; background tabs ping late)
+WEBSOCKET_HEARTBEAT_INTERVAL = config('WEBSOCKET_HEARTBEAT_INTERVAL', default=20.0, cast=float)
+WEBSOCKET_HEARTBEAT_TIMEOUT = config('WEBSOCKET_HEARTBEAT_TIMEOUT', default=90.0, cast=float)
+
+# Admin event stream (notifications/admin_stream.py): summary tick in seconds,
+# activity entries kept per summary
+ADMIN_STREAM_INTERVAL = config('ADMIN_STREAM_INTERVAL', default=1.0, cast=float)
+ADMIN_STREAM_MAX_ACTIVITY = config('ADMIN_STREAM_MAX_ACTIVITY', default=50, cast=int)
+
+# Live company metrics for students (companies/metrics.py): publish tick in seconds
+COMPANY_METRICS_INTERVAL = config('COMPANY_METRICS_INTERVAL', default=1.0, cast=float)
+
+# Notification outbox (notifications/models.py): replay window on reconnect,
+# pruned by `manage.py prune_outbox` (age in seconds, events kept per group)
+NOTIFICATION_OUTBOX_RETENTION = config('NOTIFICATION_OUTBOX_RETENTION', default=7200, cast=int)
+NOTIFICATION_OUTBOX_KEEP = config('NOTIFICATION_OUTBOX_KEEP', default=200, cast=int)
+
+# =============================================================================
+# CACHE
+# default: read versions for ETags (core/versions.py)
+# company_tokens: token -> company lookups (companies/token_cache.py)
+# =============================================================================
+COMPANY_TOKEN_CACHE_TTL = config('COMPANY_TOKEN_CACHE_TTL', default=60, cast=int)
+
+if REDIS_URL:
+    # Shared by all workers, so invalidations are seen everywhere
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'company_tokens': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'company_tokens',
+            'TIMEOUT': COMPANY_TOKEN_CACHE_TTL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # One version per student/company: avoid culling during the fair
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+        'company_tokens': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'company_tokens',
+            'TIMEOUT': COMPANY_TOKEN_CACHE_TTL,
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        },
+    }
+
 # =============================================================================
 # AUTHENTICATION
 # =============================================================================
@@ -169,6 +254,8 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    # Adds role/student_id claims used by stateless WebSocket auth
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.JobFairTokenObtainPairSerializer',
 }
 
 # =============================================================================
@@ -6,7 +6,7 @@ from django.urls import path, include
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from .views import AdminDashboardView
+from .views import AdminDashboardView, AdminIdleStudentsView, AdminMetricsView
 
 
 class HealthCheckView(APIView):
@@ -32,6 +32,8 @@ urlpatterns = [
     
     # Admin custom dashboard
     path('api/admin/dashboard/', AdminDashboardView.as_view(), name='admin_dashboard'),
+    path('api/admin/dashboard/idle-students/', AdminIdleStudentsView.as_view(), name='admin_idle_students'),
+    path('api/admin/metrics/', AdminMetricsView.as_view(), name='admin_metrics'),
     
     # Company token-based queue operations (complete endpoint)
     path('api/company/<str:token>/queues/', include('queues.urls')),
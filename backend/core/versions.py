@@ -0,0 +1,194 @@
+"""
+Read versions for conditional GETs (ETag / If-None-Match)
+
+Every company and student has a version in the cache, bumped after commit
+whenever something they display changes (see queues.signals). Hot read
+views build their ETag from the versions they depend on, so a refetch of
+unchanged data is answered with 304 before any query or serializer runs.
+
+Keys:
+- epoch: bumped by bulk updates and company profile changes (invalidates all)
+- companies: bumped on any queue/student change (student company list)
+- company:<id> / student:<id>: per-dashboard / per-student views
+
+Reconnecting sockets get the same versions as tokens per client query
+(client_versions), so a client that missed events refetches only the
+views that changed.
+"""
+import time
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+EPOCH = 'version:epoch'
+COMPANIES = 'version:companies'
+
+
+def company_key(company_id):
+    return f'version:company:{company_id}'
+
+
+def student_key(student_id):
+    return f'version:student:{student_id}'
+
+
+def _seed():
+    # A key reseeded after eviction must not reuse an old value
+    return time.time_ns() // 1000
+
+
+# ==========================================
+# Bumps (call after commit)
+# ==========================================
+
+def bump(*keys):
+    """Increment versions, seeding missing ones"""
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, _seed(), timeout=None):
+                cache.incr(key)
+
+
+def bump_epoch():
+    """Invalidate every ETag (bulk updates bypassing model signals)"""
+    bump(EPOCH)
+
+
+def bump_queue_entry(company_id, student_id):
+    """An inscription changed: its company, its student and the company list"""
+    bump(company_key(company_id), student_key(student_id), COMPANIES)
+
+
+def bump_student(student_id):
+    """
+    A student changed: their own views, and every company whose dashboard
+    lists them (open inscriptions, for the ahead counts too, and recent
+    completions), the same set the dashboard deltas go to
+    """
+    from companies.dashboard import listing_company_ids
+
+    keys = [student_key(student_id), COMPANIES]
+    keys += [company_key(company_id) for company_id in listing_company_ids([student_id])]
+    bump(*keys)
+
+
+def _student_company_ids(student_id):
+    from queues.index import queue_index
+    from queues.models import Queue
+
+    if queue_index.is_usable():
+        return queue_index.student_companies(student_id)
+    return set(
+        Queue.objects.filter(student_id=student_id, is_completed=False)
+        .values_list('company_id', flat=True)
+    )
+
+
+# ==========================================
+# Version sets per view
+# ==========================================
+
+def get_versions(keys):
+    """Current value of each key, seeding missing ones"""
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        for key in missing:
+            cache.add(key, _seed(), timeout=None)
+        values.update(cache.get_many(missing))
+    return [values.get(key) for key in keys]
+
+
+def company_list_keys(request):
+    return [EPOCH, COMPANIES]
+
+
+def company_dashboard_keys(request, token):
+    from companies.dashboard import seq_key
+
+    # IsCompanyToken already resolved request.company; the delta seq the
+    # payload carries changes when its stream state is dropped or reseeded
+    company_id = request.company.id
+    return [EPOCH, company_key(company_id), seq_key(company_id)]
+
+
+def student_profile_keys(request):
+    return [EPOCH, student_key(request.user.student.id)]
+
+
+def student_keys(request, *args, **kwargs):
+    """Student views also depend on the companies they queue at (R15 ahead counts)"""
+    student_id = request.user.student.id
+    company_ids = sorted(_student_company_ids(student_id))
+    return [EPOCH, student_key(student_id)] + [company_key(i) for i in company_ids]
+
+
+def client_versions(student_id=None, company_id=None):
+    """
+    Version token of each cached client query (frontend query keys)
+
+    Cache reads only: views depending on the student's companies are left
+    out while the queue index isn't built or misses another process's
+    writes (the client refetches them).
+    """
+    from queues.index import queue_index
+
+    queries = {}
+    if student_id is not None:
+        queries['profile'] = [EPOCH, student_key(student_id)]
+        queries['companies'] = [EPOCH, COMPANIES]
+        if queue_index.is_current():
+            company_ids = sorted(queue_index.student_companies(student_id))
+            queries['queues'] = queries['opportunities'] = (
+                [EPOCH, student_key(student_id)] + [company_key(i) for i in company_ids]
+            )
+    if company_id is not None:
+        from companies.dashboard import seq_key
+
+        queries['company-dashboard'] = [EPOCH, company_key(company_id), seq_key(company_id)]
+
+    keys = sorted({key for query_keys in queries.values() for key in query_keys})
+    values = dict(zip(keys, get_versions(keys)))
+    return {
+        name: hashlib.md5(
+            '|'.join(f'{key}={values[key]}' for key in query_keys).encode(), usedforsecurity=False
+        ).hexdigest()[:16]
+        for name, query_keys in queries.items()
+    }
+
+
+def make_etag(request, keys):
+    """Quoted ETag for the given version keys and response format"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [getattr(renderer, 'format', '')]
+    parts += [f'{key}={value}' for key, value in zip(keys, get_versions(keys))]
+    digest = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'"{digest}"'
+
+
+def versioned(keys_func):
+    """
+    Decorator for APIView GET handlers: answer If-None-Match with 304
+    before the handler runs
+
+    Args:
+        keys_func: (request, *args, **kwargs) -> version keys the response depends on
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            etag = make_etag(request, keys_func(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+            # Browsers revalidate on every fetch instead of reusing blindly
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
@@ -1,53 +1,66 @@
 """
 Core views
 """
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.db.models import Count
 from core.permissions import IsAdmin
+from companies.token_cache import company_tokens
+from notifications.admission import admission_gate
+from notifications.backlog import socket_backlog
+from notifications.dispatcher import notification_dispatcher
+from notifications.presence import presence
 from students.models import Student
-from companies.models import Company
-from queues.models import Queue
+from students.serializers import StudentListSerializer
+from queues.index import queue_index
 
 class AdminDashboardView(APIView):
     """
     Global statistics for Admin Dashboard
+    Served from aggregates the queue index maintains on every transition
+    (no table scan); idle student details are paginated separately.
+    'presence' counts the connected students and companies (this worker)
     """
     permission_classes = [IsAdmin]
-    
+
     def get(self, request):
-        total_students = Student.objects.count()
-        total_companies = Company.objects.count()
-        
-        # Queue stats
-        total_interviews = Queue.objects.filter(is_completed=True).count()
-        current_interviews = Student.objects.filter(status='in_interview').count()
-        waiting_count = Queue.objects.filter(is_completed=False).count() - current_interviews
-        if waiting_count < 0: waiting_count = 0
-        
-        # Idle detection
-        # Companies recruiting, WITH waiting students, but NO person sitting in interview currently
-        idle_companies = Company.objects.filter(
-            status='recruiting',
-            queue_entries__is_completed=False
-        ).annotate(
-            active_interviews=Count('current_students')
-        ).filter(
-            active_interviews=0
-        ).distinct().values('id', 'name', 'status')
-        
-        # Idle Students: No active queue entries (not waiting, not in interview)
-        # Assuming they are not 'in_interview' and have no IS_COMPLETED=False queue entries
-        idle_students = Student.objects.exclude(
-            queue_entries__is_completed=False
-        ).values('id', 'first_name', 'last_name', 'status')
+        return Response({**queue_index.stats(), 'presence': presence.counts()})
 
+
+class AdminMetricsView(APIView):
+    """
+    Runtime metrics for this worker
+    GET /api/admin/metrics/
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
         return Response({
-            'total_students': total_students,
-            'total_companies': total_companies,
-            'total_interviews': total_interviews,
-            'current_interviews': current_interviews,
-            'waiting_count': waiting_count,
-            'idle_companies': idle_companies,
-            'idle_students': idle_students
+            'notifications': notification_dispatcher.metrics(),
+            'sockets': socket_backlog.metrics(),
+            'handshakes': admission_gate.metrics(),
+            'presence': presence.metrics(),
+            'company_token_cache': company_tokens.stats()
         })
+
+
+class IdleStudentPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class AdminIdleStudentsView(ListAPIView):
+    """
+    Idle Students: No active queue entries (not waiting, not in interview)
+    GET /api/admin/dashboard/idle-students/?page=N
+    """
+    permission_classes = [IsAdmin]
+    serializer_class = StudentListSerializer
+    pagination_class = IdleStudentPagination
+
+    def get_queryset(self):
+        return Student.objects.exclude(
+            queue_entries__is_completed=False
+        ).order_by('last_name', 'first_name', 'id')
@@ -0,0 +1,158 @@
+"""
+Aggregated admin event stream
+Every state change of the fair is an admin event (~40/s at peak). Admin
+sockets subscribe at one of two levels:
+
+- summary (default, group 'admin'): one 'admin_summary' message per tick
+  (ADMIN_STREAM_INTERVAL seconds, only when something happened) carrying
+  the dashboard counters, their deltas since the last tick and a compact
+  activity list, plus the connected students and companies when they
+  changed (presence). Clients update their stats in place, no refetch.
+- firehose (group 'admin_firehose'): every event, as individual
+  'notification' messages.
+
+Ticks run on the dispatcher's ASGI loop; the counters come from the queue
+index (in memory). Without a bound loop each event is summarized and sent
+on its own.
+"""
+import asyncio
+import threading
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from . import buffer
+from .dispatcher import notification_dispatcher
+
+SUMMARY_GROUP = 'admin'
+FIREHOSE_GROUP = 'admin_firehose'
+LEVELS = {'summary': SUMMARY_GROUP, 'firehose': FIREHOSE_GROUP}
+
+# Event fields kept in the activity list
+ACTIVITY_FIELDS = ('notification_type', 'action', 'message', 'student_name', 'company_name', 'status')
+
+
+def _activity(data):
+    return {field: data[field] for field in ACTIVITY_FIELDS if field in data}
+
+
+class AdminEventStream:
+    """Collects admin events and publishes a summary per tick"""
+
+    def __init__(self, interval=None, max_activity=None):
+        self.interval = interval or getattr(settings, 'ADMIN_STREAM_INTERVAL', 1.0)
+        self.max_activity = max_activity or getattr(settings, 'ADMIN_STREAM_MAX_ACTIVITY', 50)
+        self._loop = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._activity = deque(maxlen=self.max_activity)
+        self._events = 0
+        self._counters = None
+        self._idle_companies = None
+        # Presence counts: latest reported, last published
+        self._presence = None
+        self._published_presence = None
+
+    # ==========================================
+    # Lifecycle
+    # ==========================================
+
+    def bind(self, loop):
+        """Start ticking on the ASGI loop (idempotent)"""
+        if self._loop is loop:
+            return
+        with self._lock:
+            if self._loop is loop:
+                return
+            self._task = loop.create_task(self._tick())
+            self._loop = loop
+
+    def unbind(self):
+        with self._lock:
+            if self._task:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            self._loop = self._task = None
+
+    @property
+    def is_bound(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    # ==========================================
+    # Publishing (after commit, any thread)
+    # ==========================================
+
+    def publish(self, data):
+        """Send one admin event to firehose subscribers and add it to the next summary"""
+        buffer.dispatch([(FIREHOSE_GROUP, {'type': 'notification', 'data': data})])
+        with self._lock:
+            self._activity.append(_activity(data))
+            self._events += 1
+        if not self.is_bound:
+            self.flush_now()
+
+    def set_presence(self, counts):
+        """Connected sockets counts (presence tick); published with the next summary if changed"""
+        with self._lock:
+            self._presence = counts
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Admin stream tick error: {e}")
+
+    def _take(self):
+        with self._lock:
+            if not self._events and self._presence == self._published_presence:
+                return None
+            pending = (self._events, list(self._activity))
+            self._events = 0
+            self._activity.clear()
+            return pending
+
+    async def flush(self):
+        """Publish the pending summary, if any event happened since the last one"""
+        pending = self._take()
+        if pending:
+            # May build the index from the DB: keep it off the loop
+            stats = await database_sync_to_async(self._stats)()
+            self._publish(stats, *pending)
+
+    def flush_now(self):
+        """Synchronous flush (no loop bound)"""
+        pending = self._take()
+        if pending:
+            self._publish(self._stats(), *pending)
+
+    @staticmethod
+    def _stats():
+        from queues.index import queue_index
+        return queue_index.stats()
+
+    def _publish(self, stats, events, activity):
+        counters = {key: value for key, value in stats.items() if isinstance(value, int)}
+        previous = self._counters or counters
+        summary = {
+            'events': events,
+            'counters': counters,
+            'deltas': {key: value - previous.get(key, 0) for key, value in counters.items()
+                       if value != previous.get(key, 0)},
+            'activity': activity,
+            'dropped_activity': max(events - len(activity), 0)
+        }
+        # The idle companies list only travels when it changed
+        if stats['idle_companies'] != self._idle_companies:
+            summary['idle_companies'] = stats['idle_companies']
+        if self._presence != self._published_presence:
+            summary['presence'] = self._presence
+            self._published_presence = self._presence
+        self._counters = counters
+        self._idle_companies = stats['idle_companies']
+
+        notification_dispatcher.submit(SUMMARY_GROUP, {'type': 'admin_summary', 'data': summary})
+
+
+admin_stream = AdminEventStream()
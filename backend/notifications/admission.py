@@ -0,0 +1,90 @@
+"""
+Admission control for WebSocket handshakes
+When a worker restarts mid-fair, every phone and tablet reconnects within
+a second. At most WEBSOCKET_MAX_HANDSHAKES connections per worker are set
+up at a time (authentication, group joins, replay); the last
+WEBSOCKET_PRIORITY_HANDSHAKES of them are kept for company tablets and
+admins.
+
+A refused socket is accepted, sent {"type": "retry", "retry_after": s}
+and closed with code 4429. The hint grows with the load and carries
+random jitter, so that refused clients come back spread out.
+"""
+import random
+import threading
+
+from django.conf import settings
+
+CLOSE_CODE = 4429
+
+
+class Ticket:
+    """An admitted handshake; release() when the connection is set up (idempotent)"""
+
+    def __init__(self, gate):
+        self._gate = gate
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._gate._release()
+
+
+class AdmissionGate:
+    """Counts the handshakes in progress in this worker"""
+
+    def __init__(self, max_handshakes=None, reserved=None, retry_after=None):
+        self.max_handshakes = max_handshakes or getattr(settings, 'WEBSOCKET_MAX_HANDSHAKES', 50)
+        self.reserved = reserved if reserved is not None else getattr(settings, 'WEBSOCKET_PRIORITY_HANDSHAKES', 10)
+        self.base_retry_after = retry_after or getattr(settings, 'WEBSOCKET_RETRY_AFTER', 1.0)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.reset_metrics()
+
+    def admit(self, priority=False):
+        """
+        Start a handshake if there is room
+
+        Args:
+            priority: company tablet or admin (may use the reserved slots)
+
+        Returns:
+            Ticket, or None if the socket must retry later
+        """
+        limit = self.max_handshakes if priority else self.max_handshakes - self.reserved
+        with self._lock:
+            if self.active >= limit:
+                self.refused += 1
+                return None
+            self.active += 1
+            self.admitted += 1
+            self.max_active = max(self.max_active, self.active)
+        return Ticket(self)
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+
+    def retry_after(self):
+        """Seconds before retrying: longer when busy, with jitter"""
+        load = min(self.active / self.max_handshakes, 1)
+        return round(self.base_retry_after * (1 + load + random.random() * 2), 2)
+
+    def reset_metrics(self):
+        with self._lock:
+            self.admitted = self.refused = self.max_active = 0
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'max_active': self.max_active,
+                'capacity': self.max_handshakes,
+                'reserved': self.reserved,
+                'admitted': self.admitted,
+                'refused': self.refused
+            }
+
+
+admission_gate = AdmissionGate()
@@ -0,0 +1,148 @@
+"""
+Socket backlog tracking
+Two ways a socket falls behind:
+
+- its worker is overloaded: group messages pile up in the channel layer
+  and every socket would get each stale event late, until the layer's
+  capacity silently drops some of them. The dispatcher stamps each group
+  message with its send time ('sent_at'); the consumer measures how long
+  the message took to reach it ('lag'), and all the worker's sockets
+  cross the threshold together;
+- the client itself is slow (backgrounded tab, bad network) on a healthy
+  worker: the consumer times each frame it writes to its own socket
+  ('delivery', until the send completes). Its events wait behind those
+  writes in its own channel, the other sockets are not affected.
+
+Once a non-urgent event is more than WEBSOCKET_MAX_LAG seconds old, or
+the socket's last frame took longer than that to go out, the consumer
+drops it and every other one sent before, and sends the client a single
+resync 'catch_up' instead: the version tokens of its views
+(core.versions), so it refetches only those that changed, and a random
+'delay' up to WEBSOCKET_RESYNC_JITTER seconds to wait first, so the
+sockets of an overloaded worker do not all refetch at once. The
+catch_up is timed like any frame: a socket that is still slow gets one
+per slow write, never the events piled up behind it. Urgent events
+(can_start) are always delivered.
+
+Lag, slow sockets, drops and resyncs are exported per worker
+(AdminMetricsView).
+"""
+import time
+import random
+import threading
+from collections import deque
+
+from django.conf import settings
+
+DELIVER = 'deliver'
+DROP = 'drop'
+RESYNC = 'resync'
+
+
+class ConnectionBacklog:
+    """Lag and delivery time of one socket, and the last resync sent to it"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.lag = 0.0
+        # Seconds the last frame took to be written to the client
+        self.delivery = 0.0
+        self.dropped = 0
+        self.resynced_at = None
+
+    def check(self, event, urgent=False):
+        """
+        What to do with a group event: DELIVER it, DROP it (covered by the
+        last resync) or send a RESYNC instead (first stale event)
+        """
+        sent_at = event.get('sent_at')
+        if sent_at is None:
+            # Replayed from the outbox or sent directly: not queued
+            return DELIVER
+        now = time.time()
+        self.lag = max(now - sent_at, 0.0)
+        self.registry.record_lag(self.lag)
+        if urgent:
+            return DELIVER
+        if self.resynced_at is not None and sent_at <= self.resynced_at:
+            action = DROP
+        elif max(self.lag, self.delivery) > self.registry.max_lag:
+            self.resynced_at = now
+            action = RESYNC
+        else:
+            return DELIVER
+        self.dropped += 1
+        self.registry.record_drop(resync=action == RESYNC)
+        return action
+
+    def record_send(self, seconds):
+        """A frame took this long to go out on the socket"""
+        self.delivery = seconds
+
+
+class BacklogRegistry:
+    """Connections of this worker and their backlog counters"""
+
+    def __init__(self, max_lag=None, resync_jitter=None):
+        self.max_lag = max_lag or getattr(settings, 'WEBSOCKET_MAX_LAG', 10.0)
+        self.resync_jitter = resync_jitter if resync_jitter is not None else getattr(
+            settings, 'WEBSOCKET_RESYNC_JITTER', 5.0
+        )
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._lags = deque(maxlen=1000)
+        self.reset_metrics()
+
+    def connect(self, channel_name):
+        backlog = ConnectionBacklog(self)
+        with self._lock:
+            self._connections[channel_name] = backlog
+        return backlog
+
+    def disconnect(self, channel_name):
+        with self._lock:
+            self._connections.pop(channel_name, None)
+
+    def resync_delay(self):
+        """Seconds a resynced client waits before refetching (spread over the jitter)"""
+        return round(random.uniform(0, self.resync_jitter), 2)
+
+    def record_lag(self, lag):
+        with self._lock:
+            self._lags.append(lag)
+
+    def record_drop(self, resync):
+        with self._lock:
+            self.dropped += 1
+            self.resyncs += resync
+
+    def reset_metrics(self):
+        with self._lock:
+            self.dropped = self.resyncs = 0
+            self._lags.clear()
+
+    def metrics(self):
+        """Connections, how far behind they are, how slow, and what was dropped for them"""
+        with self._lock:
+            lags = sorted(self._lags)
+            current = [backlog.lag for backlog in self._connections.values()]
+            deliveries = [backlog.delivery for backlog in self._connections.values()]
+
+            def percentile(p):
+                if not lags:
+                    return None
+                return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000, 2)
+
+            return {
+                'connections': len(current),
+                'lagging': sum(lag > self.max_lag for lag in current),
+                'max_lag_ms': round(max(current, default=0) * 1000, 2),
+                'slow': sum(delivery > self.max_lag for delivery in deliveries),
+                'max_delivery_ms': round(max(deliveries, default=0) * 1000, 2),
+                'dropped': self.dropped,
+                'resyncs': self.resyncs,
+                'lag_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1)}
+            }
+
+
+socket_backlog = BacklogRegistry()
@@ -0,0 +1,206 @@
+"""
+Request-scoped notification coalescing
+A single request often sends one recipient several events (status_change
+then can_start, company_status then can_start...), and every WebSocket
+frame makes the client refetch. During an HTTP request, committed
+notifications are collected here instead of being dispatched one by one;
+when the request ends, each group gets a single message: the event
+itself, or a 'batch' envelope holding its events in order.
+
+Work that should happen once per request (computing pushed snapshots)
+can be deferred to the end of it as well. Once the ASGI loop is bound,
+deferred work runs after the response in a worker thread (DeferredRunner),
+merged across requests and in bounded batches.
+
+Outside a request (management commands, tests, WebSocket consumers)
+committed notifications are dispatched immediately, as before.
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .dispatcher import notification_dispatcher
+
+_pending = ContextVar('notification_buffer', default=None)
+
+
+def coalesce(messages):
+    """
+    Merge (group, message) pairs into one message per group
+
+    Groups keep the order in which they were first addressed; events keep
+    their order within a group.
+    """
+    by_group = {}
+    for group_name, message in messages:
+        by_group.setdefault(group_name, []).append(message)
+    return [
+        (group_name, events[0] if len(events) == 1 else {'type': 'batch', 'events': events})
+        for group_name, events in by_group.items()
+    ]
+
+
+class _RequestBuffer:
+
+    def __init__(self):
+        self.messages = []
+        self.deferred = {}
+
+
+def _run(func, items):
+    try:
+        return func(items)
+    except Exception as e:
+        print(f"Deferred notification error in {func.__name__}: {e}")
+
+
+class DeferredRunner:
+    """
+    Runs deferred work off the request path, in a worker thread of the ASGI loop
+
+    Items handed to the same function are merged while they wait, so a
+    burst of requests touching the same companies costs one computation;
+    a run takes at most batch_size items per function, the rest waits for
+    the next one. Without a bound loop (tests, management commands, WSGI)
+    work runs right away in the caller's thread.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or getattr(settings, 'NOTIFICATION_PUSH_BATCH_SIZE', 200)
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._lock = threading.Lock()
+        # func -> items waiting for the next run
+        self._pending = {}
+
+    # ==========================================
+    # Lifecycle
+    # ==========================================
+
+    def bind(self, loop):
+        """Start the runner task on the ASGI loop (idempotent)"""
+        if self._loop is loop:
+            return
+        with self._lock:
+            if self._loop is loop:
+                return
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._tick())
+            self._loop = loop
+
+    def unbind(self):
+        with self._lock:
+            if self._task:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            self._loop = self._task = None
+
+    @property
+    def is_bound(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    # ==========================================
+    # Submitting (any thread)
+    # ==========================================
+
+    def submit(self, func, items):
+        """Run func(items) after the response (right away when not bound)"""
+        if not self.is_bound:
+            return _run(func, set(items))
+        with self._lock:
+            self._pending.setdefault(func, set()).update(items)
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self):
+        with self._lock:
+            return sum(len(items) for items in self._pending.values())
+
+    # ==========================================
+    # Running (ASGI loop, worker thread)
+    # ==========================================
+
+    async def _tick(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while batch := self._take():
+                # Own thread: pushes query the DB, request handlers must not wait on them
+                await sync_to_async(self._run_batch, thread_sensitive=False)(batch)
+
+    def _take(self):
+        with self._lock:
+            batch = {}
+            for func, items in list(self._pending.items()):
+                if len(items) <= self.batch_size:
+                    batch[func] = self._pending.pop(func)
+                else:
+                    batch[func] = {items.pop() for _ in range(self.batch_size)}
+            return batch
+
+    def _run_batch(self, batch):
+        close_old_connections()
+        try:
+            for func, items in batch.items():
+                _run(func, items)
+        finally:
+            close_old_connections()
+
+
+deferred_runner = DeferredRunner()
+
+
+def dispatch(messages):
+    """Committed messages: buffer them for the current request, or send now"""
+    pending = _pending.get()
+    if pending is None:
+        return notification_dispatcher.submit_many(messages)
+    pending.messages.extend(messages)
+    return True
+
+
+def defer(func, *items):
+    """
+    Call func(items) once after the request, with the items of every
+    defer(func, ...) call of that request (right away outside one), on
+    the DeferredRunner
+    """
+    pending = _pending.get()
+    if pending is None:
+        return deferred_runner.submit(func, items)
+    pending.deferred.setdefault(func, set()).update(items)
+
+
+@contextmanager
+def collect():
+    """Buffer committed notifications until the block exits (nested blocks share it)"""
+    if _pending.get() is not None:
+        yield
+        return
+    pending = _RequestBuffer()
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        # Run now (no bound loop), deferred work may dispatch more
+        # messages into this buffer; otherwise it runs after the response
+        for func, items in list(pending.deferred.items()):
+            deferred_runner.submit(func, items)
+        _pending.reset(token)
+        if pending.messages:
+            notification_dispatcher.submit_many(coalesce(pending.messages))
+
+
+class NotificationBufferMiddleware:
+    """Django middleware: one coalesced flush of notifications per request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect():
+            return self.get_response(request)
@@ -0,0 +1,145 @@
+"""
+Interview actions over the WebSocket
+The "it's your turn -> I'm in" path used to be an HTTP request (JWT
+check, permission checks, connection checkout) answered by an event on
+the socket anyway. Connected clients can send the action on the socket
+itself and get an ack carrying the HTTP view's response:
+
+    {"type": "start_interview", "request_id": "r1", "queue_id": 12}
+    {"type": "ack", "request_id": "r1", "ok": true, "data": {...}}
+    {"type": "ack", "request_id": "r1", "ok": false, "error": "..."}
+    {"type": "ack", "request_id": "r1", "ok": false, "error": "...", "code": "session_expired"}
+
+- start_interview (student): QueueStartInterviewView
+- complete_interview (company): QueueCompleteView
+- set_status (student or company): StudentStatusView / CompanyStatusView
+
+Same services, rules (R5, R10, R17...) and transaction as the views; the
+resulting notifications are coalesced as for an HTTP request
+(notifications.buffer). The ack is sent once the change is committed.
+
+The socket outlives the JWT it was opened with: once it expires, student
+commands are refused with code 'session_expired'; the client then sends
+the action over HTTP (which refreshes the token) and reopens the socket
+with the new one.
+"""
+from django.db import transaction
+
+from . import buffer
+from .services import NotificationService
+
+COMMANDS = ('start_interview', 'complete_interview', 'set_status')
+# Ack code of commands refused because the socket's JWT expired
+SESSION_EXPIRED = 'session_expired'
+
+
+class CommandError(Exception):
+    """Refused command: the message (and code, if any) goes back in the ack"""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+def _first_error(errors):
+    """First message of serializer errors"""
+    for messages in errors.values():
+        return str(messages[0])
+    return "Requête invalide"
+
+
+def start_interview(student_id, queue_id):
+    from queues.models import Queue
+    from queues.services import QueueService
+
+    try:
+        queue_entry = Queue.objects.select_related('student', 'company').get(
+            pk=queue_id, student_id=student_id
+        )
+    except (Queue.DoesNotExist, ValueError, TypeError):
+        raise CommandError("Inscription introuvable")
+
+    with buffer.collect():
+        try:
+            with transaction.atomic():
+                QueueService.start_interview(queue_entry)
+                NotificationService.on_interview_started(queue_entry)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    return {
+        'message': f"Entretien commencé chez {queue_entry.company.name}",
+        'status': queue_entry.student.status,
+        'company': queue_entry.company.name
+    }
+
+
+def complete_interview(company, queue_id):
+    from queues.models import Queue
+    from queues.services import QueueService
+
+    try:
+        queue_entry = Queue.objects.select_related('student').get(pk=queue_id, company=company)
+    except (Queue.DoesNotExist, ValueError, TypeError):
+        raise CommandError("Inscription introuvable")
+
+    with buffer.collect():
+        try:
+            with transaction.atomic():
+                result = QueueService.complete_interview(queue_entry)
+                NotificationService.on_interview_completed(
+                    completed_student=result['completed_student'],
+                    company=company,
+                    next_students=result['next_available']
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+    return {
+        'message': f"{queue_entry.student.full_name} marqué comme passé",
+        'student_id': queue_entry.student.id,
+        'is_completed': True,
+        'next_available_count': len(result['next_available'])
+    }
+
+
+def set_student_status(student_id, new_status):
+    from students.models import Student
+    from students.serializers import StudentStatusSerializer
+
+    student = Student.objects.get(pk=student_id)
+    old_status = student.status
+    serializer = StudentStatusSerializer(student, data={'status': new_status}, context={'student': student})
+    if not serializer.is_valid():
+        raise CommandError(_first_error(serializer.errors))
+
+    with buffer.collect():
+        with transaction.atomic():
+            serializer.save()
+            if old_status != student.status:
+                NotificationService.on_student_status_change(student, old_status, student.status)
+
+    return {
+        'message': f"Status changed to '{student.status}'",
+        'status': student.status
+    }
+
+
+def set_company_status(company, new_status):
+    from companies.serializers import CompanyStatusSerializer
+
+    old_status = company.status
+    serializer = CompanyStatusSerializer(company, data={'status': new_status})
+    if not serializer.is_valid():
+        raise CommandError(_first_error(serializer.errors))
+
+    with buffer.collect():
+        with transaction.atomic():
+            serializer.save()
+            if old_status != company.status:
+                NotificationService.on_company_status_change(company, company.status)
+
+    return {
+        'message': f"Status changed to '{company.status}'",
+        'status': company.status
+    }
@@ -0,0 +1,170 @@
+"""
+Compact binary frames for the notification socket
+On the venue's saturated Wi-Fi, frame size matters. A client may ask for
+the 'jobfair.cbor.v1' subprotocol; its socket then gets CBOR binary
+frames instead of JSON text. JSON stays the default.
+
+A compact frame is the JSON frame with:
+
+- keys listed in FIELDS replaced by their index (1-byte CBOR ints)
+- values of VALUE_FIELDS (event types, statuses, actions...) listed in
+  WORDS replaced by their index
+- a 'message' that one of TEMPLATES renders from the frame's own fields
+  replaced by the template index (the client renders it)
+
+Unknown keys and values are sent as is, so adding a field needs no table
+change. The tables travel in connection_established ('schema', itself a
+plain CBOR frame), so the client never holds a stale copy.
+
+Group broadcasts reach the consumer as the dispatcher's JSON text (see
+encoding); they are converted once per worker and shared by every
+compact socket (from_text). Client messages (ping, commands) stay JSON.
+
+scripts/bench_compact.py compares sizes and encode/decode times on the
+events of a scripted fair.
+"""
+import json
+import string
+from functools import lru_cache
+
+import cbor2
+
+from . import encoding
+
+SUBPROTOCOL = 'jobfair.cbor.v1'
+
+FIELDS = (
+    'type', 'data', 'seq', 'urgent', 'events', 'notification_type', 'message',
+    'student_id', 'student_name', 'company_id', 'company_name', 'queue_id',
+    'can_start', 'position', 'action', 'status', 'old_status', 'new_status',
+    'ahead_name', 'ahead_count', 'total_waiting', 'next_available_count',
+    'next_available', 'completed_student_id', 'completed_student_name',
+    'id', 'name', 'queue_length', 'available_slots', 'version', 'base', 'ops',
+    'op', 'section', 'row', 'company', 'stats', 'student_status', 'is_greyed',
+    'is_completed', 'created_at', 'completed_at', 'interview_duration',
+    'current_company_name', 'available_now', 'company_status', 'students_ahead',
+    'opportunities', 'reason', 'request_id', 'ok', 'error', 'versions', 'resync',
+    'counters', 'deltas', 'activity', 'dropped_activity', 'presence',
+    'can_start_any', 'max_concurrent_interviews', 'max_queue_size',
+    'current_interview_count', 'waiting_count', 'idle_students_count',
+    'current_interviews', 'total_interviews', 'total_students', 'total_companies',
+    'idle_companies', 'delay',
+)
+
+# Fields whose values are coded with WORDS
+VALUE_FIELDS = ('type', 'notification_type', 'action', 'status', 'old_status', 'new_status',
+                'op', 'section', 'student_status', 'company_status')
+
+WORDS = (
+    'notification', 'queue_update', 'status_change', 'can_start', 'can_start_after',
+    'interview_started', 'interview_completed', 'marked_complete', 'company_status',
+    'opportunities_snapshot', 'dashboard_delta', 'company_metrics', 'admin_summary',
+    'batch', 'pong', 'ack', 'catch_up', 'resync', 'subscribed', 'error',
+    'new_inscription', 'cancelled', 'available', 'paused', 'in_interview',
+    'recruiting', 'added', 'moved', 'updated', 'removed', 'waiting', 'completed',
+    'company',
+)
+
+# Messages built by NotificationService, rendered client-side from the frame's fields
+TEMPLATES = (
+    "🎯 C'est ton tour chez {company_name} !",
+    "🎯 Tu peux passer chez {company_name} !",
+    "🎯 Tu peux passer chez {company_name} maintenant !",
+    "🎯 {company_name} a repris ! Tu peux passer maintenant !",
+    "Tu peux passer chez {company_name} après {ahead_name}",
+    "Tu as été marqué passé chez {company_name}. Pense à repasser Disponible pour tes autres opportunités.",
+    "Tu es inscrit chez {company_name} (position {position})",
+    "Ton statut est maintenant: {new_status}",
+    "{company_name} est maintenant en pause",
+    "{company_name} a repris le recrutement",
+    "{student_name} est maintenant {new_status}",
+    "{student_name} a rejoint la file de {company_name}",
+)
+
+# Sent before the client has the schema: plain CBOR, no codes
+PLAIN_TYPES = ('connection_established', 'retry')
+
+SCHEMA = {
+    'fields': FIELDS,
+    'value_fields': VALUE_FIELDS,
+    'words': WORDS,
+    'templates': TEMPLATES,
+}
+
+FIELD_CODES = {name: code for code, name in enumerate(FIELDS)}
+WORD_CODES = {word: code for code, word in enumerate(WORDS)}
+_TEMPLATES = [
+    (code, template, template.split('{')[0],
+     [name for _, name, _, _ in string.Formatter().parse(template) if name])
+    for code, template in enumerate(TEMPLATES)
+]
+
+_loads = encoding.orjson.loads if encoding.orjson is not None else json.loads
+
+
+def _template(message, fields):
+    """Index of the template rendering message from fields, None if none does"""
+    for code, template, prefix, names in _TEMPLATES:
+        if not message.startswith(prefix):
+            continue
+        values = [fields.get(name) for name in names]
+        # Rendered the same in Python and JS: strings and numbers only
+        if not all(isinstance(value, (str, int)) and not isinstance(value, bool) for value in values):
+            continue
+        if template.format_map(fields) == message:
+            return code
+    return None
+
+
+def _compact(value):
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if key == 'message' and isinstance(item, str):
+                code = _template(item, value)
+                item = item if code is None else code
+            elif key in VALUE_FIELDS and isinstance(item, str):
+                item = WORD_CODES.get(item, item)
+            else:
+                item = _compact(item)
+            compacted[FIELD_CODES.get(key, key)] = item
+        return compacted
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+
+def dumps(content):
+    """CBOR frame of a client frame (JSON values)"""
+    if content.get('type') in PLAIN_TYPES:
+        return cbor2.dumps(content)
+    return cbor2.dumps(_compact(content))
+
+
+@lru_cache(maxsize=256)
+def from_text(text):
+    """CBOR frame of a JSON text frame (a broadcast is converted once per worker)"""
+    return dumps(_loads(text))
+
+
+def _expand(value):
+    """Inverse of _compact (tests and benchmark; the client has its own)"""
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    expanded = {}
+    for key, item in value.items():
+        name = FIELDS[key] if isinstance(key, int) else key
+        if name in VALUE_FIELDS and isinstance(item, int) and not isinstance(item, bool):
+            expanded[name] = WORDS[item]
+        else:
+            expanded[name] = _expand(item)
+    if isinstance(expanded.get('message'), int):
+        expanded['message'] = TEMPLATES[expanded['message']].format_map(expanded)
+    return expanded
+
+
+def loads(frame):
+    """Client frame of a CBOR frame"""
+    return _expand(cbor2.loads(frame))
@@ -3,9 +3,22 @@ WebSocket consumers for real-time notifications
 Complete implementation for Phase 4
 """
 import json
+import time
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework_simplejwt.models import TokenUser
+
+from companies import metrics as live_metrics
+from core import versions
+from . import admission, backlog, commands, compact, encoding
+from .presence import REAP_CODE, presence
+from .admin_stream import LEVELS as ADMIN_LEVELS
+from .models import GroupSequence, OutboxEvent
 
 
 class NotificationConsumer(AsyncJsonWebsocketConsumer):
@@ -19,23 +32,81 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
     Groups:
     - student_{id}: Personal notifications for a student
     - company_{token}: Updates for a company dashboard
-    - admin: Global admin notifications
+    - admin: Global admin notifications, one summary per tick
+      (admin_firehose instead after {"type": "subscribe", "level": "firehose"})
+    - metrics_company_{id}: Live queue metrics of the companies listed in
+      {"type": "subscribe", "companies": [ids]} (any authenticated socket)
+    
+    Replay:
+    - Personal group events carry a per-group seq; a client reconnecting
+      with ?resume_from=<last seq> gets the missed events from the outbox
+    - Then a 'catch_up' with the version token of each view the client
+      caches (core.versions); when the missed events are no longer
+      available it is flagged 'resync' and the client refetches only the
+      views whose token changed
+    
+    Admission:
+    - Handshakes beyond the worker's capacity get a 'retry' hint and are
+      closed with code 4429 (see admission)
+    
+    Group events arrive encoded by the dispatcher ('text', see encoding)
+    and are written as is; replayed events are encoded here.
+    
+    Compact frames:
+    - Clients asking for the 'jobfair.cbor.v1' subprotocol get CBOR binary
+      frames with coded fields (see compact); JSON text otherwise
+    
+    Commands:
+    - start_interview / complete_interview / set_status with a request_id,
+      answered by an 'ack' (see commands)
+    
+    Backpressure:
+    - When the worker falls behind (events older than WEBSOCKET_MAX_LAG)
+      or the client is slow to take its frames (a write longer than that),
+      the socket gets one resync 'catch_up' (changed views, jittered
+      delay) instead of its stale non-urgent events (see backlog)
+    
+    Presence:
+    - Clients ping every 'heartbeat' seconds (connection_established);
+      silent sockets are reaped with code 4408 (see presence)
     """
     
+    # Events flagged urgent for the client
+    URGENT_EVENTS = encoding.URGENT_EVENTS
+    
+    # CBOR frames (compact subprotocol negotiated)
+    cbor = False
+    
     async def connect(self):
         """Handle WebSocket connection with authentication"""
+        self.cbor = compact.SUBPROTOCOL in self.scope.get('subprotocols', [])
+        subprotocol = compact.SUBPROTOCOL if self.cbor else None
         self.user = self.scope.get('user')
         self.company = self.scope.get('company')
         self.auth_type = self.scope.get('auth_type')
         self.groups = []
+        self.personal_group = None
+        self.admin_group = None
+        self.metrics_groups = set()
+        self.student_id = None
+        self.last_seq = 0
         
         # Reject unauthenticated connections
         if not self.auth_type:
             await self.close(code=4001)
             return
         
+        # Too many handshakes in progress: come back later
+        retry_after = self.scope.get('retry_after')
+        if retry_after is not None:
+            await self.accept(subprotocol)
+            await self.send_json({'type': 'retry', 'retry_after': retry_after})
+            await self.close(code=admission.CLOSE_CODE)
+            return
+        
         # Accept connection
-        await self.accept()
+        await self.accept(subprotocol)
+        self.backlog = backlog.socket_backlog.connect(self.channel_name)
         
         # Join appropriate groups based on auth type
         if self.auth_type == 'jwt' and self.user.is_authenticated:
@@ -43,34 +114,86 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         elif self.auth_type == 'company' and self.company:
             await self._setup_company_groups()
         
+        # Registered before the replay: events committed from now on are sent
+        await presence.connect(self.channel_name, self.personal_group)
+        
         # Send connection confirmation
-        await self.send_json({
+        established = {
             'type': 'connection_established',
             'auth_type': self.auth_type,
-            'groups': self.groups
-        })
+            'groups': self.groups,
+            'heartbeat': presence.interval
+        }
+        if self.cbor:
+            # Code tables of the following frames
+            established['schema'] = compact.SCHEMA
+        await self.send_json(established)
+        
+        if self.personal_group:
+            resume_from = self._resume_from()
+            replayed = resume_from is None or await self._replay(resume_from)
+            await self._catch_up(resync=not replayed)
+        
+        ticket = self.scope.get('admission')
+        if ticket is not None:
+            ticket.release()
     
     async def _setup_user_groups(self):
         """Set up groups for authenticated user (student/admin)"""
         user = self.user
         
         if user.role == 'student':
-            # Get student ID
-            student_id = await self._get_student_id(user)
+            # Get student ID (from the JWT claim when present, else DB)
+            if isinstance(user, TokenUser):
+                student_id = user.student_id
+            else:
+                student_id = await self._get_student_id(user)
             if student_id:
+                self.student_id = student_id
                 group_name = f"student_{student_id}"
                 await self.channel_layer.group_add(group_name, self.channel_name)
                 self.groups.append(group_name)
+                self.personal_group = group_name
         
         if user.role == 'admin' or user.is_superuser:
-            await self.channel_layer.group_add('admin', self.channel_name)
-            self.groups.append('admin')
+            await self._join_admin_group(ADMIN_LEVELS['summary'])
     
     async def _setup_company_groups(self):
         """Set up groups for company token auth"""
         group_name = f"company_{self.company.access_token}"
         await self.channel_layer.group_add(group_name, self.channel_name)
         self.groups.append(group_name)
+        self.personal_group = group_name
+    
+    async def _join_admin_group(self, group_name):
+        if self.admin_group:
+            await self.channel_layer.group_discard(self.admin_group, self.channel_name)
+            self.groups.remove(self.admin_group)
+        await self.channel_layer.group_add(group_name, self.channel_name)
+        self.groups.append(group_name)
+        self.admin_group = group_name
+    
+    async def _subscribe_companies(self, company_ids):
+        """
+        Follow the metrics of exactly these companies (replaces the
+        previous set, [] unsubscribes)
+
+        Returns:
+            list: company ids followed, None if the list is invalid
+        """
+        if not isinstance(company_ids, list) or len(company_ids) > live_metrics.MAX_SUBSCRIPTIONS:
+            return None
+        if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in company_ids):
+            return None
+        wanted = {live_metrics.group_name(pk) for pk in company_ids}
+        for group_name in self.metrics_groups - wanted:
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+            self.groups.remove(group_name)
+        for group_name in wanted - self.metrics_groups:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+            self.groups.append(group_name)
+        self.metrics_groups = wanted
+        return sorted(set(company_ids))
     
     @database_sync_to_async
     def _get_student_id(self, user):
@@ -79,27 +202,226 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
             return user.student.id
         return None
     
+    # ==========================================
+    # Replay on reconnect
+    # ==========================================
+    
+    def _resume_from(self):
+        """Last seq the client saw (?resume_from=N), None on first connect"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['resume_from'][0])
+        except (KeyError, ValueError):
+            return None
+    
+    @database_sync_to_async
+    def _load_missed(self, group, since):
+        """Current seq of the group and the stored events after since"""
+        last_seq = GroupSequence.objects.filter(group=group).values_list('last_seq', flat=True).first() or 0
+        limit = settings.NOTIFICATION_OUTBOX_KEEP
+        events = list(OutboxEvent.objects.after(group, since)[:limit + 1])
+        return last_seq, events
+    
+    async def _replay(self, since):
+        """
+        Send the events missed since the client's last seq
+        
+        The group is already joined, so events committed meanwhile arrive
+        afterwards and are skipped by seq.
+        
+        Returns:
+            bool: False if the outbox no longer holds the whole gap (pruned,
+            too far behind, server reset): nothing is sent
+        """
+        last_seq, events = await self._load_missed(self.personal_group, since)
+        complete = (
+            since <= last_seq
+            and len(events) <= settings.NOTIFICATION_OUTBOX_KEEP
+            and (events[0].seq == since + 1 if events else since == last_seq)
+        )
+        if not complete:
+            self.last_seq = last_seq
+            return False
+        
+        self.last_seq = since
+        for event in events:
+            await self.dispatch(event.as_message())
+        return True
+    
+    async def _catch_up(self, resync=False, delay=None):
+        """
+        Version tokens of the client's cached views (cache reads only);
+        with resync, the client refetches those that changed, after
+        delay seconds if given
+        """
+        message = {
+            'type': 'catch_up',
+            'versions': await sync_to_async(versions.client_versions)(
+                student_id=self.student_id,
+                company_id=self.company.id if self.company else None
+            )
+        }
+        if resync:
+            message.update(resync=True, seq=self.last_seq)
+        if delay is not None:
+            message['delay'] = delay
+        await self.send_json(message)
+    
+    def _is_new(self, event):
+        """Record the event's seq; False if already delivered (no seq: always new)"""
+        seq = event.get('seq')
+        if seq is None:
+            return True
+        if seq <= self.last_seq:
+            return False
+        self.last_seq = seq
+        return True
+    
+    async def _keep_up(self, event, urgent=False):
+        """False if the socket is too far behind to send this event (see backlog)"""
+        action = self.backlog.check(event, urgent)
+        if action == backlog.RESYNC:
+            await self._catch_up(resync=True, delay=self.backlog.registry.resync_delay())
+        return action == backlog.DELIVER
+    
+    async def _forward(self, event):
+        """Send a group event to the client, once"""
+        if not self._is_new(event):
+            return
+        if not await self._keep_up(event, event['type'] in self.URGENT_EVENTS):
+            return
+        if 'text' in event:
+            await self._send_text(event['text'])
+        else:
+            await self.send_json(encoding.client_frame(event))
+    
+    async def _send_text(self, text):
+        """Write a frame encoded by the dispatcher (converted once per worker for CBOR sockets)"""
+        if self.cbor:
+            await self.send(bytes_data=compact.from_text(text))
+        else:
+            await self.send(text_data=text)
+    
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Every frame goes out here: time the write (see backlog)"""
+        started = time.monotonic()
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        if hasattr(self, 'backlog'):
+            self.backlog.record_send(time.monotonic() - started)
+    
+    async def send_json(self, content, close=False):
+        if self.cbor:
+            await self.send(bytes_data=compact.dumps(content), close=close)
+        else:
+            await self.send(text_data=await self.encode_json(content), close=close)
+    
+    @classmethod
+    async def encode_json(cls, content):
+        return encoding.dumps(content)
+    
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection - leave all groups"""
-        for group in self.groups:
+        await self._leave()
+    
+    async def _leave(self):
+        """Forget the socket and leave its groups (idempotent)"""
+        backlog.socket_backlog.disconnect(self.channel_name)
+        presence.disconnect(self.channel_name)
+        groups, self.groups = self.groups, []
+        for group in groups:
             await self.channel_layer.group_discard(group, self.channel_name)
     
+    async def presence_reap(self, event):
+        """
+        Close a socket that missed its heartbeats (see presence)
+        Groups are left first: a half-dead client may never finish the close
+        """
+        await self._leave()
+        await self.close(code=REAP_CODE)
+    
     async def receive_json(self, content):
         """
         Handle incoming WebSocket messages
         
         Supported message types:
-        - ping: Keep-alive, responds with pong
-        - subscribe: Subscribe to additional groups (future use)
+        - ping: Heartbeat (any message counts), responds with pong
+        - subscribe: Admin stream level ({"level": "summary" | "firehose"})
+          and/or company metrics ({"companies": [ids]})
+        - start_interview, complete_interview, set_status: see commands
         """
         message_type = content.get('type')
+        presence.touch(self.channel_name)
         
         if message_type == 'ping':
             await self.send_json({'type': 'pong'})
         
         elif message_type == 'subscribe':
-            # Future: allow subscribing to specific company updates
-            pass
+            if 'companies' in content:
+                companies = await self._subscribe_companies(content['companies'])
+                if companies is None:
+                    await self.send_json({
+                        'type': 'error',
+                        'message': f"Liste d'entreprises invalide ({live_metrics.MAX_SUBSCRIPTIONS} maximum)"
+                    })
+                else:
+                    await self.send_json({'type': 'subscribed', 'companies': companies})
+            level = content.get('level')
+            if self.admin_group and level in ADMIN_LEVELS:
+                await self._join_admin_group(ADMIN_LEVELS[level])
+                await self.send_json({'type': 'subscribed', 'level': level})
+        
+        elif message_type in commands.COMMANDS:
+            await self._run_command(message_type, content)
+    
+    # ==========================================
+    # Commands (interview actions, see commands)
+    # ==========================================
+    
+    async def _run_command(self, command, content):
+        """Run a command and ack it with its result or error"""
+        reply = {'type': 'ack', 'request_id': content.get('request_id')}
+        try:
+            reply['data'] = await self._command(command, content)
+            reply['ok'] = True
+        except commands.CommandError as e:
+            reply['ok'] = False
+            reply['error'] = str(e)
+            if e.code:
+                reply['code'] = e.code
+        except ObjectDoesNotExist:
+            # Student deleted while connected
+            reply['ok'] = False
+            reply['error'] = "Profil introuvable"
+        except Exception as e:
+            # Never leave a command without its ack (DB errors, bugs)
+            print(f"WebSocket command {command} failed: {e!r}")
+            reply['ok'] = False
+            reply['error'] = "Erreur serveur, veuillez réessayer"
+        await self.send_json(reply)
+    
+    @database_sync_to_async
+    def _command(self, command, content):
+        """Check who may run the command (as the HTTP permissions do) and run it"""
+        if self.auth_type == 'company':
+            from companies.token_cache import company_tokens
+            # Regenerated tokens stop working here too
+            company = company_tokens.get_company(self.company.access_token)
+            if company is None:
+                raise commands.CommandError("Token entreprise invalide")
+            if command == 'complete_interview':
+                return commands.complete_interview(company, content.get('queue_id'))
+            if command == 'set_status':
+                return commands.set_company_status(company, content.get('status'))
+        elif self.student_id:
+            # The socket outlives its JWT: expired sessions go through HTTP (refresh)
+            token = getattr(self.user, 'token', None)
+            if token is not None and token.get('exp', 0) < time.time():
+                raise commands.CommandError("Session expirée", code=commands.SESSION_EXPIRED)
+            if command == 'start_interview':
+                return commands.start_interview(self.student_id, content.get('queue_id'))
+            if command == 'set_status':
+                return commands.set_student_status(self.student_id, content.get('status'))
+        raise commands.CommandError("Action non autorisée")
     
     # ==========================================
     # Event handlers (called by channel_layer.group_send)
@@ -110,52 +432,77 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         Handle notification events
         Sent by NotificationService for personal notifications
         """
-        await self.send_json({
-            'type': 'notification',
-            'data': event.get('data', {})
-        })
+        await self._forward(event)
     
     async def queue_update(self, event):
         """
         Handle queue update events
         Sent when queue state changes (inscription, completion, etc.)
         """
-        await self.send_json({
-            'type': 'queue_update',
-            'data': event.get('data', {})
-        })
+        await self._forward(event)
     
     async def status_change(self, event):
         """
         Handle status change events
         Sent when student or company status changes
         """
-        await self.send_json({
-            'type': 'status_change',
-            'data': event.get('data', {})
-        })
+        await self._forward(event)
     
     async def interview_started(self, event):
         """Handle interview started event"""
-        await self.send_json({
-            'type': 'interview_started',
-            'data': event.get('data', {})
-        })
+        await self._forward(event)
     
     async def interview_completed(self, event):
         """Handle interview completed event"""
-        await self.send_json({
-            'type': 'interview_completed',
-            'data': event.get('data', {})
-        })
+        await self._forward(event)
     
     async def can_start(self, event):
         """
         Handle "you can start" notification
         Critical notification when it's student's turn
         """
-        await self.send_json({
-            'type': 'can_start',
-            'data': event.get('data', {}),
-            'urgent': True
-        })
+        await self._forward(event)
+    
+    async def admin_summary(self, event):
+        """
+        Handle the admin stream tick
+        Counters, deltas and activity since the previous summary
+        """
+        await self._forward(event)
+    
+    async def opportunities_snapshot(self, event):
+        """
+        Handle pushed opportunities (StudentOpportunitiesView payload + version)
+        Replaces the client's cached opportunities, no refetch
+        """
+        await self._forward(event)
+    
+    async def dashboard_delta(self, event):
+        """
+        Handle company dashboard patches (companies.dashboard)
+        Applied on the tablet's copy; a gap in base/seq triggers a refetch
+        """
+        await self._forward(event)
+    
+    async def company_metrics(self, event):
+        """
+        Handle live company metrics (companies.metrics)
+        Changed fields only; shared by every subscriber, no seq
+        """
+        await self._forward(event)
+    
+    async def batch(self, event):
+        """
+        Handle the events of one request for this group, in one frame
+        Built by notifications.buffer; the client processes them together
+        """
+        events = [inner for inner in event.get('events', []) if self._is_new(inner)]
+        urgent = any(inner['type'] in self.URGENT_EVENTS for inner in events)
+        if not events or not await self._keep_up(event, urgent):
+            return
+        if 'text' in event and len(events) == len(event['events']):
+            await self._send_text(event['text'])
+        elif len(events) == 1:
+            await self.send_json(encoding.client_frame(events[0]))
+        else:
+            await self.send_json({'type': 'batch', 'events': [encoding.client_frame(inner) for inner in events]})
@@ -0,0 +1,377 @@
+"""
+Non-blocking notification dispatch
+NotificationService hands group sends to this dispatcher instead of
+awaiting each channel layer round trip inside the HTTP request. Queued
+messages are drained by a background task on the ASGI event loop, which
+sends each batch concurrently (one ordered stream per group).
+
+Messages wait in one of three priority lanes, drained in this order:
+
+- urgent: can_start (or a batch holding one). Never dropped; pending
+  messages of the same group move up with it, so a group's stream
+  stays in order.
+- normal: personal notifications, snapshots, dashboard deltas. Bounded
+  by NOTIFICATION_QUEUE_SIZE, dropped beyond it.
+- low: company queue_update, live metrics, admin summaries and firehose.
+  A pending queue_update is replaced by a newer one to the same group;
+  the lane is bounded by NOTIFICATION_LOW_QUEUE_SIZE and shed beyond it.
+  Low messages sent after a newer event of their group are skipped by
+  the consumer (seq).
+
+Messages are encoded for the client once, on submission (see encoding),
+so group members don't each encode the same frame. Messages to personal
+groups with no socket are not sent (see presence): they wait in the
+outbox for the client's reconnect.
+
+The loop is bound by core.asgi on the first ASGI call. Without a bound
+loop (tests, management commands, WSGI) sends happen synchronously, as
+before.
+"""
+import time
+import asyncio
+import threading
+from collections import defaultdict, deque
+from operator import itemgetter
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import encoding
+from .presence import presence
+
+URGENT = 'urgent'
+NORMAL = 'normal'
+LOW = 'low'
+PRIORITIES = (URGENT, NORMAL, LOW)
+
+LOW_EVENTS = ('queue_update', 'company_metrics', 'admin_summary')
+# admin_stream.FIREHOSE_GROUP: every admin event, as is
+LOW_GROUPS = ('admin_firehose',)
+# Superseded by the next one to the same group (the client just refetches)
+COALESCED_EVENTS = ('queue_update',)
+
+
+def priority_of(group_name, message):
+    """Lane of a group message (a batch takes its most urgent event's)"""
+    if message['type'] == 'batch':
+        types = [event['type'] for event in message['events']]
+    else:
+        types = [message['type']]
+    if any(event_type in encoding.URGENT_EVENTS for event_type in types):
+        return URGENT
+    if group_name in LOW_GROUPS or all(event_type in LOW_EVENTS for event_type in types):
+        return LOW
+    return NORMAL
+
+
+class NotificationDispatcher:
+    """
+    Priority lanes of (group, message) drained on the ASGI loop
+
+    Metrics: queue depth, send latency (enqueue -> sent) and drops when
+    a lane is full, in total and per lane; messages not sent because
+    their group was offline.
+    """
+
+    def __init__(self, maxsize=None, batch_size=None, low_maxsize=None):
+        self.maxsize = maxsize or getattr(settings, 'NOTIFICATION_QUEUE_SIZE', 10000)
+        self.low_maxsize = low_maxsize or getattr(settings, 'NOTIFICATION_LOW_QUEUE_SIZE', 1000)
+        self.batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+        self._capacity = {URGENT: None, NORMAL: self.maxsize, LOW: self.low_maxsize}
+        self._loop = None
+        self._lanes = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._latencies = {priority: deque(maxlen=1000) for priority in PRIORITIES}
+        self.reset_metrics()
+
+    # ==========================================
+    # Lifecycle
+    # ==========================================
+
+    def bind(self, loop):
+        """Attach to the running ASGI loop and start the drain task (idempotent)"""
+        if self._loop is loop:
+            return
+        with self._lock:
+            if self._loop is loop:
+                return
+            self._lanes = {priority: deque() for priority in PRIORITIES}
+            # Pending coalesced messages: (group, type) -> lane item
+            self._coalescible = {}
+            self._unfinished = 0
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._task = loop.create_task(self._drain())
+            self._loop = loop
+
+    def unbind(self):
+        """Detach from the loop; later sends are synchronous again"""
+        with self._lock:
+            if self._task:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            self._loop = self._lanes = self._task = None
+
+    @property
+    def is_bound(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    # ==========================================
+    # Submission (any thread)
+    # ==========================================
+
+    def submit(self, group_name, message):
+        """
+        Queue a group send without waiting for it
+
+        Returns:
+            bool: False if the message was dropped (queue full / send error)
+        """
+        return self.submit_many([(group_name, message)])
+
+    def submit_many(self, items):
+        """
+        Queue many group sends in one hop to the loop (fan-out)
+
+        Args:
+            items: list of (group_name, message)
+        """
+        offline = presence.offline({group_name for group_name, _ in items})
+        if offline:
+            self._count('offline', sum(group_name in offline for group_name, _ in items))
+            items = [(group_name, message) for group_name, message in items if group_name not in offline]
+            if not items:
+                return True
+        # Classified and encoded here, in the caller's thread: never on the loop
+        items = [
+            (group_name, encoding.prepare(message), priority_of(group_name, message))
+            for group_name, message in items
+        ]
+        if not self.is_bound:
+            return self._send_now(items)
+
+        enqueued_at = time.monotonic()
+        batch = [(group_name, message, enqueued_at, priority) for group_name, message, priority in items]
+        try:
+            if self._on_loop():
+                self._enqueue(batch)
+            else:
+                self._loop.call_soon_threadsafe(self._enqueue, batch)
+        except RuntimeError:
+            # Loop closed during shutdown
+            self._count('dropped', len(batch))
+            return False
+        return True
+
+    def _on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _enqueue(self, batch):
+        for group_name, message, enqueued_at, priority in batch:
+            key = (group_name, message['type'])
+            if message['type'] in COALESCED_EVENTS and key in self._coalescible:
+                self._coalescible[key][1] = message
+                self._count_lane(priority, 'coalesced')
+                continue
+            lane = self._lanes[priority]
+            if priority == URGENT:
+                self._promote(group_name)
+            elif len(lane) >= self._capacity[priority]:
+                self._count('dropped')
+                self._count_lane(priority, 'dropped')
+                continue
+            item = [group_name, message, enqueued_at, priority]
+            lane.append(item)
+            if priority == LOW and message['type'] in COALESCED_EVENTS:
+                self._coalescible[key] = item
+            self._unfinished += 1
+            self._count('submitted')
+        if self._unfinished:
+            self._idle.clear()
+            self._wakeup.set()
+        self.max_depth = max(self.max_depth, self._depth())
+
+    def _promote(self, group_name):
+        """Move the group's pending messages to the urgent lane, in order"""
+        promoted = []
+        for priority in (NORMAL, LOW):
+            lane = self._lanes[priority]
+            if any(item[0] == group_name for item in lane):
+                promoted += [item for item in lane if item[0] == group_name]
+                self._lanes[priority] = deque(item for item in lane if item[0] != group_name)
+        promoted.sort(key=itemgetter(2))
+        self._lanes[URGENT].extend(promoted)
+
+    def _depth(self):
+        return sum(len(lane) for lane in self._lanes.values()) if self._lanes is not None else 0
+
+    def _send_now(self, items):
+        """Synchronous fallback: one round trip for the whole batch"""
+        if not get_channel_layer():
+            return False
+        self._count('submitted', len(items))
+        started = time.monotonic()
+        sent = async_to_sync(self._send_batch)([
+            (group_name, message, started, priority) for group_name, message, priority in items
+        ])
+        return sent == len(items)
+
+    # ==========================================
+    # Drain task (ASGI loop)
+    # ==========================================
+
+    def _take_batch(self):
+        """Up to batch_size pending messages, most urgent lanes first"""
+        batch = []
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            while lane and len(batch) < self.batch_size:
+                item = lane.popleft()
+                key = (item[0], item[1]['type'])
+                if self._coalescible.get(key) is item:
+                    del self._coalescible[key]
+                batch.append(tuple(item))
+        return batch
+
+    async def _drain(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._send_batch(batch)
+            finally:
+                self._unfinished -= len(batch)
+                if not self._unfinished:
+                    self._idle.set()
+
+    async def _send_batch(self, batch):
+        """
+        Send concurrently across groups, in order within a group
+
+        Returns:
+            int: number of messages sent
+        """
+        channel_layer = get_channel_layer()
+        by_group = defaultdict(list)
+        for group_name, message, enqueued_at, priority in batch:
+            by_group[group_name].append((message, enqueued_at, priority))
+        sent = await asyncio.gather(*(
+            self._send_group(channel_layer, group_name, items)
+            for group_name, items in by_group.items()
+        ))
+        return sum(sent)
+
+    async def _send_group(self, channel_layer, group_name, items):
+        sent = []
+        for message, enqueued_at, priority in items:
+            try:
+                # Send time, for the consumers' backlog tracking
+                await channel_layer.group_send(group_name, {**message, 'sent_at': time.time()})
+                sent.append((priority, enqueued_at))
+            except Exception as e:
+                print(f"WebSocket send error to {group_name}: {e}")
+                self._count('errors')
+        self._record_sent(sent)
+        return len(sent)
+
+    async def join(self):
+        """Wait until every queued message has been sent (tests, shutdown)"""
+        if self._lanes is not None:
+            await self._idle.wait()
+
+    # ==========================================
+    # Metrics
+    # ==========================================
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _count_lane(self, priority, name):
+        with self._lock:
+            self._lane_counts[priority][name] += 1
+
+    def _record_sent(self, sent):
+        now = time.monotonic()
+        with self._lock:
+            self.sent += len(sent)
+            for priority, enqueued_at in sent:
+                self._latencies[priority].append(now - enqueued_at)
+                self._lane_counts[priority]['sent'] += 1
+
+    def reset_metrics(self):
+        with self._lock:
+            self.submitted = self.sent = self.dropped = self.errors = self.offline = 0
+            self.max_depth = 0
+            self._lane_counts = {
+                priority: {'sent': 0, 'dropped': 0, 'coalesced': 0} for priority in PRIORITIES
+            }
+            for latencies in self._latencies.values():
+                latencies.clear()
+
+    @staticmethod
+    def _percentiles(latencies):
+        latencies = sorted(latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+        return {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1)}
+
+    def metrics(self):
+        """Queue depth, drops and send latency (ms) over the last 1000 sends of each lane"""
+        lanes = self._lanes
+        with self._lock:
+            return {
+                'bound': self.is_bound,
+                'depth': self._depth(),
+                'max_depth': self.max_depth,
+                'capacity': self.maxsize,
+                'submitted': self.submitted,
+                'sent': self.sent,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'offline': self.offline,
+                'latency_ms': self._percentiles(
+                    [latency for latencies in self._latencies.values() for latency in latencies]
+                ),
+                'lanes': {
+                    priority: {
+                        'depth': len(lanes[priority]) if lanes is not None else 0,
+                        'capacity': self._capacity[priority],
+                        **self._lane_counts[priority],
+                        'latency_ms': self._percentiles(self._latencies[priority])
+                    }
+                    for priority in PRIORITIES
+                }
+            }
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+class DispatcherLoopMiddleware:
+    """
+    ASGI middleware binding the dispatcher to the server's event loop,
+    along with any other loop-bound service (bind(loop) is idempotent)
+    """
+
+    def __init__(self, app, *services):
+        self.app = app
+        self.services = (notification_dispatcher, *services)
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        for service in self.services:
+            service.bind(loop)
+        return await self.app(scope, receive, send)
@@ -0,0 +1,68 @@
+"""
+Client frames encoded once per broadcast
+A group message reaches every socket of the group, and each consumer used
+to JSON-encode the same frame again (300 tablets and students on a shared
+group: 300 encodes per worker). The dispatcher now encodes the client
+frame once, when the message is submitted, and ships it as 'text' through
+the channel layer; consumers write it as is.
+
+A prepared message keeps only what consumers need besides the text
+(type for routing, seq for deduplication):
+
+    {'type': 'can_start', 'seq': 12, 'text': '{"type":"can_start",...}'}
+
+Batches keep their events too, for the rare client that already received
+some of them (replay overlap) and gets a filtered batch re-encoded.
+
+orjson is used when installed, the json module otherwise; both produce
+the same values: dates and times go through DjangoJSONEncoder (ISO 8601,
+'Z' for UTC, milliseconds) and non-string keys become strings.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# Events flagged urgent for the client
+URGENT_EVENTS = ('can_start',)
+
+_default = DjangoJSONEncoder().default
+# Datetimes left to DjangoJSONEncoder ('Z', milliseconds), int keys allowed as in json
+_ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+
+
+def dumps(content):
+    """JSON text of a client frame (dates, decimals and UUIDs as Django encodes them)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS).decode()
+    return json.dumps(content, cls=DjangoJSONEncoder)
+
+
+def client_frame(message):
+    """Frame sent to the client for a group message"""
+    frame = {
+        'type': message['type'],
+        'data': message.get('data', {})
+    }
+    if message['type'] in URGENT_EVENTS:
+        frame['urgent'] = True
+    if message.get('seq') is not None:
+        frame['seq'] = message['seq']
+    return frame
+
+
+def prepare(message):
+    """Group message carrying its encoded client frame (idempotent)"""
+    if 'text' in message:
+        return message
+    if message['type'] == 'batch':
+        text = dumps({'type': 'batch', 'events': [client_frame(event) for event in message['events']]})
+        return {**message, 'text': text}
+    prepared = {'type': message['type'], 'text': dumps(client_frame(message))}
+    if message.get('seq') is not None:
+        prepared['seq'] = message['seq']
+    return prepared
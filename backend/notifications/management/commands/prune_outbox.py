@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from notifications.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = 'Deletes notification outbox events past the retention window (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.NOTIFICATION_OUTBOX_RETENTION,
+                            help='Delete events older than this many seconds')
+        parser.add_argument('--keep', type=int, default=settings.NOTIFICATION_OUTBOX_KEEP,
+                            help='Maximum number of events kept per group')
+
+    def handle(self, *args, **options):
+        deleted = OutboxEvent.objects.prune(max_age=options['max_age'], keep_per_group=options['keep'])
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} outbox events'))
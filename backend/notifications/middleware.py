@@ -6,32 +6,48 @@ from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.models import TokenUser
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
+from .admission import admission_gate
 
-@database_sync_to_async
-def get_user_from_token(token_str):
-    """Validate JWT token and return user"""
+
+async def get_user_from_token(token_str):
+    """
+    Validate JWT token and return user
+    
+    Tokens carrying role/student_id claims (users.serializers) give a
+    stateless TokenUser: no DB access, so a reconnect storm after a
+    restart does not pile queries onto the thread pool. Older tokens
+    without claims fall back to the DB lookup.
+    """
     try:
         token = AccessToken(token_str)
-        user_id = token['user_id']
-        
+    except (InvalidToken, TokenError):
+        return AnonymousUser()
+    
+    if 'role' in token:
+        return TokenUser(token)
+    return await get_user_from_db(token.get('user_id'))
+
+
+@database_sync_to_async
+def get_user_from_db(user_id):
+    """Fallback: load the user for a token without role claims"""
+    try:
         from django.contrib.auth import get_user_model
         User = get_user_model()
         return User.objects.get(id=user_id)
-    except (InvalidToken, TokenError, Exception):
+    except Exception:
         return AnonymousUser()
 
 
 @database_sync_to_async
 def get_company_from_token(token_str):
-    """Validate company access token and return company"""
-    try:
-        from companies.models import Company
-        return Company.objects.get(access_token=token_str)
-    except Company.DoesNotExist:
-        return None
+    """Validate company access token and return company (cached, see companies.token_cache)"""
+    from companies.token_cache import company_tokens
+    return company_tokens.get_company(token_str)
 
 
 class WebSocketAuthMiddleware(BaseMiddleware):
@@ -41,6 +57,10 @@ class WebSocketAuthMiddleware(BaseMiddleware):
     Supports two authentication methods:
     1. JWT token for students/admin: ws://...?token=<jwt_token>
     2. Company token: ws://...?company_token=<company_access_token>
+    
+    Authenticated sockets then go through admission control (see
+    admission): scope['admission'] holds the handshake ticket, or
+    scope['retry_after'] is set when the socket must come back later.
     """
     
     async def __call__(self, scope, receive, send):
@@ -69,4 +89,17 @@ class WebSocketAuthMiddleware(BaseMiddleware):
                 scope['company'] = company
                 scope['auth_type'] = 'company'
         
-        return await super().__call__(scope, receive, send)
+        ticket = None
+        if scope['auth_type']:
+            user = scope['user']
+            priority = scope['auth_type'] == 'company' or user.role == 'admin' or user.is_superuser
+            ticket = admission_gate.admit(priority)
+            if ticket is None:
+                scope['retry_after'] = admission_gate.retry_after()
+            scope['admission'] = ticket
+        try:
+            return await super().__call__(scope, receive, send)
+        finally:
+            # Released by the consumer once connected; this covers failures
+            if ticket is not None:
+                ticket.release()
@@ -0,0 +1,43 @@
+# Generated by Django 5.0 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupSequence',
+            fields=[
+                ('group', models.CharField(max_length=150, primary_key=True, serialize=False)),
+                ('last_seq', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'notification_group_sequences',
+            },
+        ),
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(max_length=150)),
+                ('seq', models.BigIntegerField()),
+                ('event_type', models.CharField(max_length=50)),
+                ('data', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'notification_outbox',
+                'ordering': ['group', 'seq'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='outboxevent',
+            constraint=models.UniqueConstraint(fields=('group', 'seq'), name='unique_outbox_group_seq'),
+        ),
+    ]
@@ -1,3 +1,181 @@
-from django.db import models
+"""
+Notification outbox for JobFair Platform
+Events for personal groups (student_{id}, company_{token}) are stored
+once the state change that caused them has committed, numbered per
+group, delivered and replayed to clients that reconnect with
+resume_from (a dropped Wi-Fi must not lose a can_start).
 
-# Create your models here.
+Ordering: numbers are allocated and the events inserted in one short
+transaction after the request's commit, so a group's seq row is locked
+for that insert only, never for a whole request. Per group, seqs are
+gapless and become visible in order; they follow the order in which
+requests recorded their events after committing, which for two requests
+committing at the same moment may differ from their commit order. Every
+event describes committed state.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+
+
+class GroupSequence(models.Model):
+    """Last sequence number issued for a group (row lock orders concurrent writers)"""
+
+    group = models.CharField(max_length=150, primary_key=True)
+    last_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'notification_group_sequences'
+
+    def __str__(self):
+        return f"{self.group} @ {self.last_seq}"
+
+    @classmethod
+    def next_seq(cls, group):
+        """
+        Allocate the next sequence number for a group
+
+        The UPDATE keeps the row locked until the surrounding transaction
+        ends (OutboxEvent.record's own), so numbers become visible in order.
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(group=group).update(last_seq=F('last_seq') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(group=group, last_seq=1)
+                        return 1
+                except IntegrityError:
+                    # Created concurrently: increment theirs
+                    cls.objects.filter(group=group).update(last_seq=F('last_seq') + 1)
+            return cls.objects.filter(group=group).values_list('last_seq', flat=True).get()
+
+    @classmethod
+    def reserve(cls, counts):
+        """
+        Allocate count numbers for each group in a fixed number of queries
+
+        Rows are locked in group order so concurrent fan-outs cannot
+        deadlock on each other.
+
+        Args:
+            counts: {group: how many numbers}
+
+        Returns:
+            dict: {group: last allocated seq}
+        """
+        groups = sorted(counts)
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                [cls(group=group, last_seq=0) for group in groups], ignore_conflicts=True
+            )
+            list(cls.objects.select_for_update().filter(group__in=groups).order_by('group').values_list('pk'))
+            by_count = {}
+            for group in groups:
+                by_count.setdefault(counts[group], []).append(group)
+            for count, members in by_count.items():
+                cls.objects.filter(group__in=members).update(last_seq=F('last_seq') + count)
+            return dict(cls.objects.filter(group__in=groups).values_list('group', 'last_seq'))
+
+
+class OutboxEventQuerySet(models.QuerySet):
+
+    def after(self, group, seq):
+        """Events of a group newer than seq, in order (replay)"""
+        return self.filter(group=group, seq__gt=seq).order_by('seq')
+
+    def prune(self, max_age=None, keep_per_group=None):
+        """
+        Retention policy: drop events older than max_age, and beyond the
+        latest keep_per_group events of each group
+
+        Returns:
+            int: number of deleted events
+        """
+        from django.conf import settings
+
+        max_age = max_age if max_age is not None else settings.NOTIFICATION_OUTBOX_RETENTION
+        keep_per_group = keep_per_group if keep_per_group is not None else settings.NOTIFICATION_OUTBOX_KEEP
+
+        deleted, _ = self.filter(created_at__lt=timezone.now() - timedelta(seconds=max_age)).delete()
+
+        # Compaction: keep the latest events of each group
+        last_seq = GroupSequence.objects.filter(group=OuterRef('group')).values('last_seq')
+        count, _ = self.filter(seq__lte=Subquery(last_seq) - keep_per_group).delete()
+        return deleted + count
+
+
+class OutboxEvent(models.Model):
+    """A notification for one group, with its per-group sequence number"""
+
+    # Groups whose events are persisted and replayable
+    REPLAYABLE_PREFIXES = ('student_', 'company_')
+
+    group = models.CharField(max_length=150)
+    seq = models.BigIntegerField()
+    event_type = models.CharField(max_length=50)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = OutboxEventQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'notification_outbox'
+        ordering = ['group', 'seq']
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'seq'], name='unique_outbox_group_seq')
+        ]
+
+    def __str__(self):
+        return f"{self.group} #{self.seq} {self.event_type}"
+
+    @classmethod
+    def is_replayable(cls, group):
+        return group.startswith(cls.REPLAYABLE_PREFIXES)
+
+    @classmethod
+    @transaction.atomic
+    def record(cls, group, event_type, data):
+        """Store an event with the group's next seq (call after commit, see Ordering)"""
+        return cls.objects.create(
+            group=group,
+            seq=GroupSequence.next_seq(group),
+            event_type=event_type,
+            data=data
+        )
+
+    @classmethod
+    @transaction.atomic
+    def record_many(cls, events):
+        """
+        Store several events at once (fan-out), numbers and rows in one
+        transaction so no gap is ever visible
+
+        Args:
+            events: list of (group, event_type, data)
+
+        Returns:
+            list: OutboxEvent instances, in the order given
+        """
+        if len(events) == 1:
+            return [cls.record(*events[0])]
+
+        counts = Counter(group for group, _, _ in events)
+        last = GroupSequence.reserve(counts)
+        # Number each group's events in the order given
+        next_seq = {group: last[group] - count + 1 for group, count in counts.items()}
+        records = []
+        for group, event_type, data in events:
+            records.append(cls(group=group, seq=next_seq[group], event_type=event_type, data=data))
+            next_seq[group] += 1
+        return cls.objects.bulk_create(records)
+
+    def as_message(self):
+        """Channel layer message (consumer handler = event_type)"""
+        return {
+            'type': self.event_type,
+            'data': self.data,
+            'seq': self.seq
+        }
@@ -0,0 +1,228 @@
+"""
+Presence of the notification sockets
+The consumer records every socket of this worker: which personal group
+it serves (student_{id}, company_{token}, none for admins) and when the
+client last sent something. Clients send a 'ping' every
+WEBSOCKET_HEARTBEAT_INTERVAL seconds (given in connection_established);
+a socket silent for WEBSOCKET_HEARTBEAT_TIMEOUT seconds is half-dead and
+is reaped on the next tick: its groups are left and it is closed with
+code 4408.
+
+is_online() / offline() tell the dispatcher which personal groups have
+no socket at all, so their events are only stored in the outbox
+(replayed on reconnect) instead of being sent into the void.
+
+- Single worker (local memory cache): this registry is exact.
+- Several workers (shared cache): each worker marks its personal groups
+  in the cache on connect and on every tick. A group stays marked for
+  up to timeout + interval after its last socket left; it is never
+  reported offline while connected elsewhere.
+
+Without a bound loop (tests, management commands, WSGI) nothing is
+tracked and every group counts as online, as before.
+
+Counts go to the admin summary (admin_stream) and AdminMetricsView;
+scripts/bench_presence.py measures the memory cost per connection
+(~350 bytes, channel and group names included).
+"""
+import time
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+REAP_CODE = 4408
+# Groups with an outbox (replayed on reconnect): safe to skip when offline
+PERSONAL_PREFIXES = ('student_', 'company_')
+
+
+def _mark_key(group_name):
+    return f"presence:{group_name}"
+
+
+class Connection:
+    """One socket: its personal group and last client message (monotonic)"""
+
+    __slots__ = ('group', 'last_seen', 'reaped')
+
+    def __init__(self, group):
+        self.group = group
+        self.last_seen = time.monotonic()
+        self.reaped = False
+
+
+class PresenceRegistry:
+    """Sockets of this worker, their personal groups and heartbeats"""
+
+    def __init__(self, interval=None, timeout=None):
+        self.interval = interval or getattr(settings, 'WEBSOCKET_HEARTBEAT_INTERVAL', 20.0)
+        self.timeout = timeout or getattr(settings, 'WEBSOCKET_HEARTBEAT_TIMEOUT', 90.0)
+        self.shared = not settings.CACHES['default']['BACKEND'].endswith('LocMemCache')
+        self._loop = None
+        self._task = None
+        self._lock = threading.Lock()
+        # channel_name -> Connection
+        self._connections = {}
+        # personal group -> sockets connected to this worker
+        self._online = {}
+        # personal group -> last time a client was seen (wall clock)
+        self._last_seen = {}
+        self.reaped = 0
+
+    # ==========================================
+    # Lifecycle
+    # ==========================================
+
+    def bind(self, loop):
+        """Start reaping on the ASGI loop (idempotent)"""
+        if self._loop is loop:
+            return
+        with self._lock:
+            if self._loop is loop:
+                return
+            self._task = loop.create_task(self._tick())
+            self._loop = loop
+
+    def unbind(self):
+        with self._lock:
+            if self._task:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            self._loop = self._task = None
+
+    @property
+    def is_bound(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    # ==========================================
+    # Connections (consumer)
+    # ==========================================
+
+    async def connect(self, channel_name, group=None):
+        """Record a socket, before its missed events are replayed"""
+        with self._lock:
+            self._connections[channel_name] = Connection(group)
+            if group:
+                self._online[group] = self._online.get(group, 0) + 1
+                self._last_seen[group] = time.time()
+        if group and self.shared:
+            await sync_to_async(self._mark)([group])
+
+    def touch(self, channel_name):
+        """The client sent something: the socket is alive"""
+        connection = self._connections.get(channel_name)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    def disconnect(self, channel_name):
+        """Forget a socket (idempotent)"""
+        with self._lock:
+            connection = self._connections.pop(channel_name, None)
+            if connection is None or not connection.group:
+                return
+            group = connection.group
+            self._last_seen[group] = time.time()
+            if self._online[group] > 1:
+                self._online[group] -= 1
+            else:
+                del self._online[group]
+
+    # ==========================================
+    # Queries
+    # ==========================================
+
+    def offline(self, group_names):
+        """
+        Personal groups among group_names known to have no socket
+
+        Returns:
+            set: empty when nothing is tracked (no bound loop)
+        """
+        if not self.is_bound:
+            return set()
+        candidates = {
+            group for group in group_names
+            if group.startswith(PERSONAL_PREFIXES) and group not in self._online
+        }
+        if candidates and self.shared:
+            marked = cache.get_many([_mark_key(group) for group in candidates])
+            candidates = {group for group in candidates if _mark_key(group) not in marked}
+        return candidates
+
+    def is_online(self, group_name):
+        return not self.offline([group_name])
+
+    def last_seen(self, group_name):
+        """Wall-clock time a client of the group was last seen by this worker, None if never"""
+        if group_name in self._online:
+            return time.time()
+        return self._last_seen.get(group_name)
+
+    def counts(self):
+        """Sockets of this worker and the distinct students and companies they serve"""
+        with self._lock:
+            groups = list(self._online)
+            return {
+                'connections': len(self._connections),
+                'students': sum(group.startswith('student_') for group in groups),
+                'companies': sum(group.startswith('company_') for group in groups)
+            }
+
+    def metrics(self):
+        return {**self.counts(), 'reaped': self.reaped, 'heartbeat_timeout': self.timeout}
+
+    # ==========================================
+    # Tick (ASGI loop)
+    # ==========================================
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+                if self.shared:
+                    await sync_to_async(self._mark)(list(self._online))
+                from .admin_stream import admin_stream
+                admin_stream.set_presence(self.counts())
+            except Exception as e:
+                print(f"Presence tick error: {e}")
+
+    def _stale(self):
+        deadline = time.monotonic() - self.timeout
+        with self._lock:
+            stale = [
+                channel_name for channel_name, connection in self._connections.items()
+                if not connection.reaped and connection.last_seen < deadline
+            ]
+            for channel_name in stale:
+                self._connections[channel_name].reaped = True
+        return stale
+
+    async def reap(self):
+        """
+        Ask the consumers of silent sockets to close (they leave their
+        groups right away, whether or not the client still answers)
+
+        Returns:
+            int: sockets reaped
+        """
+        stale = self._stale()
+        channel_layer = get_channel_layer()
+        for channel_name in stale:
+            await channel_layer.send(channel_name, {'type': 'presence.reap'})
+        with self._lock:
+            self.reaped += len(stale)
+        return len(stale)
+
+    def _mark(self, group_names):
+        """Tell other workers these groups have a socket here"""
+        if group_names:
+            cache.set_many(
+                {_mark_key(group): time.time() for group in group_names},
+                timeout=self.timeout + self.interval
+            )
+
+
+presence = PresenceRegistry()
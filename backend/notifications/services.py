@@ -2,8 +2,14 @@
 Notification Service - Business Logic for Real-time Notifications
 Implements rules R13-R16 with proper WebSocket broadcasting
 """
-from asgiref.sync import async_to_sync
+from functools import partial
+
 from channels.layers import get_channel_layer
+from django.db import DatabaseError, transaction
+
+from . import buffer
+from .admin_stream import admin_stream
+from .models import OutboxEvent
 
 
 class NotificationService:
@@ -27,8 +33,8 @@ class NotificationService:
         """Get the channel layer for WebSocket broadcasting"""
         return get_channel_layer()
     
-    @staticmethod
-    def _send_to_group(group_name, event_type, data):
+    @classmethod
+    def _send_to_group(cls, group_name, event_type, data):
         """
         Send message to a WebSocket group
         
@@ -37,21 +43,56 @@ class NotificationService:
             event_type: Type of event (maps to consumer method)
             data: Message payload
         """
-        channel_layer = NotificationService.get_channel_layer()
-        if channel_layer:
+        return cls._send_many([(group_name, event_type, data)])
+    
+    @classmethod
+    def _send_to_groups(cls, group_names, event_type, data):
+        """Fan out one payload to many groups (built once, sent in one batch)"""
+        return cls._send_many([(group_name, event_type, data) for group_name in group_names])
+    
+    @staticmethod
+    def _send_many(sends):
+        """
+        Send a batch of messages to WebSocket groups
+        
+        Queued on the dispatcher in one hop once the transaction commits:
+        the request never waits on the channel layer, and rolled back
+        changes are never announced. During an HTTP request, events are
+        merged per recipient and flushed when it ends (notifications.buffer).
+        The dispatcher sends can_start first and never drops it; queue
+        updates and other low priority events may be coalesced or shed.
+        Events for student/company groups are also stored in the outbox
+        (replay on reconnect) once the caller's transaction has committed,
+        in a short transaction of their own with a fixed number of queries
+        per batch: the group's seq row is never locked for a whole request.
+        
+        Args:
+            sends: list of (group_name, event_type, data)
+        """
+        if not sends:
+            return True
+        transaction.on_commit(partial(NotificationService._record_and_dispatch, sends))
+        return True
+    
+    @staticmethod
+    def _record_and_dispatch(sends):
+        """Number and store the replayable events, then hand everything to the buffer"""
+        replayable = [send for send in sends if OutboxEvent.is_replayable(send[0])]
+        records = []
+        if replayable:
             try:
-                async_to_sync(channel_layer.group_send)(
-                    group_name,
-                    {
-                        'type': event_type,
-                        'data': data
-                    }
-                )
-                return True
-            except Exception as e:
-                print(f"WebSocket send error to {group_name}: {e}")
-                return False
-        return False
+                records = OutboxEvent.record_many(replayable)
+            except DatabaseError as e:
+                # The change is committed: send the events anyway, unnumbered
+                # (clients missing them resync from the view versions)
+                print(f"Outbox record failed: {e}")
+        numbered = iter(records)
+        messages = [
+            (group_name, next(numbered).as_message() if records and OutboxEvent.is_replayable(group_name)
+             else {'type': event_type, 'data': data})
+            for group_name, event_type, data in sends
+        ]
+        buffer.dispatch(messages)
     
     @classmethod
     def notify_student(cls, student, notification_type, data):
@@ -95,11 +136,16 @@ class NotificationService:
     
     @classmethod
     def notify_admin(cls, notification_type, data):
-        """Send notification to admin dashboard"""
-        cls._send_to_group('admin', 'notification', {
+        """
+        Send notification to admin dashboard
+        
+        Aggregated into per-tick summaries, or sent as is to firehose
+        subscribers (notifications.admin_stream), after commit
+        """
+        transaction.on_commit(partial(admin_stream.publish, {
             'notification_type': notification_type,
             **data
-        })
+        }))
     
     @classmethod
     def on_interview_started(cls, queue_entry):
@@ -140,7 +186,7 @@ class NotificationService:
         - Company: queue update with new available students
         """
         # R16: Notify completed student
-        cls._send_to_group(
+        sends = [(
             f"student_{completed_student.id}",
             'notification',
             {
@@ -150,15 +196,16 @@ class NotificationService:
                 'company_name': company.name,
                 'new_status': 'paused'
             }
-        )
+        )]
         
         # R13, R14: Notify next available students with "can_start" event
+        ahead_name = next_students[0].student.full_name if next_students else None
         for i, queue_entry in enumerate(next_students):
             student = queue_entry.student
             
             if i == 0:
                 # First available - urgent "can start" notification
-                cls._send_to_group(
+                sends.append((
                     f"student_{student.id}",
                     'can_start',  # Special urgent event type
                     {
@@ -170,17 +217,19 @@ class NotificationService:
                         'can_start': True,
                         'position': 1
                     }
-                )
+                ))
             else:
                 # Not first but slot may be available soon
-                ahead_name = next_students[0].student.full_name if next_students else None
-                cls.notify_student(student, cls.TYPE_CAN_START_AFTER, {
+                sends.append((f"student_{student.id}", 'notification', {
+                    'notification_type': cls.TYPE_CAN_START_AFTER,
+                    'student_id': student.id,
                     'message': f"Tu peux passer chez {company.name} après {ahead_name}",
                     'company_id': company.id,
                     'company_name': company.name,
                     'ahead_name': ahead_name,
                     'position': i + 1
-                })
+                }))
+        cls._send_many(sends)
         
         # Notify company of queue update
         cls.notify_company(company, cls.TYPE_INTERVIEW_COMPLETED, {
@@ -285,30 +334,33 @@ class NotificationService:
         """
         from queues.models import Queue
         
-        # Get all inscribed students
-        inscribed_entries = Queue.objects.filter(
-            company=company,
-            is_completed=False
-        ).select_related('student')
+        # Get all inscribed students (ids are enough to address them)
+        student_groups = [
+            f"student_{student_id}"
+            for student_id in Queue.objects.filter(
+                company=company,
+                is_completed=False
+            ).values_list('student_id', flat=True)
+        ]
         
         if new_status == 'paused':
-            # Notify inscribed students
-            for entry in inscribed_entries:
-                cls.notify_student(entry.student, cls.TYPE_COMPANY_STATUS, {
-                    'message': f"{company.name} est maintenant en pause",
-                    'company_id': company.id,
-                    'company_name': company.name,
-                    'status': 'paused'
-                })
+            # Notify inscribed students (one fan-out)
+            cls._send_to_groups(student_groups, 'notification', {
+                'notification_type': cls.TYPE_COMPANY_STATUS,
+                'message': f"{company.name} est maintenant en pause",
+                'company_id': company.id,
+                'company_name': company.name,
+                'status': 'paused'
+            })
         else:  # recruiting
-            # Notify inscribed students
-            for entry in inscribed_entries:
-                cls.notify_student(entry.student, cls.TYPE_COMPANY_STATUS, {
-                    'message': f"{company.name} a repris le recrutement",
-                    'company_id': company.id,
-                    'company_name': company.name,
-                    'status': 'recruiting'
-                })
+            # Notify inscribed students (one fan-out)
+            cls._send_to_groups(student_groups, 'notification', {
+                'notification_type': cls.TYPE_COMPANY_STATUS,
+                'message': f"{company.name} a repris le recrutement",
+                'company_id': company.id,
+                'company_name': company.name,
+                'status': 'recruiting'
+            })
             
             # Send "can start" to first available students
             from queues.services import QueueService
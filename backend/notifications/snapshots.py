@@ -0,0 +1,110 @@
+"""
+Pushed opportunity snapshots
+Instead of telling students "something changed" and letting them refetch
+/api/queues/opportunities/, queue transitions mark what they touched
+(queues.signals targets, after commit). After the request (see
+buffer.DeferredRunner) the opportunities of the students whose rows can
+have changed are computed, in batches of BATCH_SIZE students, in the
+StudentOpportunitiesView shape, and only students whose payload changed
+get an 'opportunities_snapshot' event:
+
+- a company change: everyone queued there
+- an entry joining, leaving or completing at position p: entries from p
+  on (R15 ahead count; R10 first available can only move behind p)
+- a student change: the student, and the entries behind them at every
+  company where they queue
+
+Students without a socket are skipped: their client refetches on
+reconnect (catch_up). The digest of the last payload pushed to each
+student is kept in the cache to detect changes; the snapshot version
+clients compare is the event's outbox seq, which only grows.
+"""
+import json
+import hashlib
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+EVENT_TYPE = 'opportunities_snapshot'
+# Students computed per query
+BATCH_SIZE = 200
+
+
+def _digest_key(student_id):
+    return f'opportunities_digest:{student_id}'
+
+
+def digest(payload):
+    encoded = json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    return hashlib.md5(encoded, usedforsecurity=False).hexdigest()
+
+
+def affected_students(targets):
+    """Students whose opportunity rows may have changed (see module docstring)"""
+    from queues.models import Queue
+
+    company_ids = {target[1] for target in targets if target[0] == 'company'}
+    student_ids = {target[1] for target in targets if target[0] == 'student'}
+    # company_id -> first position whose rows may have changed
+    from_position = {}
+    entries = [target[1:] for target in targets if target[0] == 'queue']
+    if student_ids:
+        entries += Queue.objects.filter(
+            student_id__in=student_ids, is_completed=False
+        ).values_list('company_id', 'position')
+    for company_id, position in entries:
+        if company_id not in company_ids:
+            from_position[company_id] = min(position, from_position.get(company_id, position))
+
+    if not company_ids and not from_position:
+        return student_ids
+    rows = Q(company_id__in=company_ids)
+    for company_id, position in from_position.items():
+        rows |= Q(company_id=company_id, position__gte=position)
+    queued = Queue.objects.filter(is_completed=False).filter(rows).values_list('student_id', flat=True)
+    return student_ids | set(queued)
+
+
+def push(targets):
+    """
+    Compute and send the snapshots of students whose opportunities changed
+
+    Args:
+        targets: set of queues.signals targets
+
+    Returns:
+        list: ids of students who were sent a snapshot
+    """
+    from .presence import presence
+
+    student_ids = affected_students(targets)
+    offline = presence.offline([f"student_{student_id}" for student_id in student_ids])
+    student_ids = sorted(student_id for student_id in student_ids if f"student_{student_id}" not in offline)
+    changed = []
+    for start in range(0, len(student_ids), BATCH_SIZE):
+        changed += _push_batch(student_ids[start:start + BATCH_SIZE])
+    return changed
+
+
+def _push_batch(student_ids):
+    from queues.services import QueueService
+    from .services import NotificationService
+
+    payloads = QueueService.get_opportunities_payloads(student_ids)
+    if not payloads:
+        return []
+
+    digests = {student_id: digest(payload) for student_id, payload in payloads.items()}
+    previous = cache.get_many([_digest_key(student_id) for student_id in payloads])
+    changed = [
+        student_id for student_id in payloads
+        if previous.get(_digest_key(student_id)) != digests[student_id]
+    ]
+    if changed:
+        NotificationService._send_many([
+            (f"student_{student_id}", EVENT_TYPE, payloads[student_id])
+            for student_id in changed
+        ])
+        cache.set_many({_digest_key(student_id): digests[student_id] for student_id in changed}, timeout=None)
+    return changed
@@ -1,3 +1,902 @@
-from django.test import TestCase
+import json
+import time
+import asyncio
+import threading
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import cbor2
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+from companies.models import Company
+from queues.models import Queue
+from students.models import Student
+from notifications import buffer, commands, compact, encoding, snapshots
+from notifications.backlog import socket_backlog
+from notifications.admin_stream import AdminEventStream
+from notifications.admission import AdmissionGate
+from notifications.consumers import NotificationConsumer
+from notifications.dispatcher import NotificationDispatcher, notification_dispatcher
+from notifications.middleware import WebSocketAuthMiddleware, get_user_from_token
+from notifications.models import GroupSequence, OutboxEvent
+from notifications.presence import PresenceRegistry, presence
+from notifications.services import NotificationService
+from users.serializers import JobFairTokenObtainPairSerializer
+
+User = get_user_model()
+
+
+class StatelessWebSocketAuthTest(TestCase):
+    """JWT role/student_id claims let WebSocket connects skip the DB"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='ws@test.com', password='testpass123', role='student'
+        )
+        self.student = Student.objects.create(user=self.user, first_name='Web', last_name='Socket')
+
+    def _login_token(self):
+        response = APIClient().post(
+            '/api/auth/login/', {'email': 'ws@test.com', 'password': 'testpass123'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data['access']
+
+    def test_login_token_carries_claims(self):
+        token = AccessToken(self._login_token())
+        self.assertEqual(token['role'], 'student')
+        self.assertEqual(token['student_id'], self.student.id)
+
+    def test_claims_resolve_without_db(self):
+        token = self._login_token()
+        with self.assertNumQueries(0):
+            user = async_to_sync(get_user_from_token)(token)
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.student_id, self.student.id)
+
+    def test_connect_joins_student_group_without_db(self):
+        token = self._login_token()
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+
+        async def connect():
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={token}')
+            connected, _ = await communicator.connect()
+            message = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return connected, message
+
+        with self.assertNumQueries(0):
+            connected, message = async_to_sync(connect)()
+        self.assertTrue(connected)
+        self.assertEqual(message['groups'], [f'student_{self.student.id}'])
+
+
+class WebSocketAuthFallbackTest(TransactionTestCase):
+    """Tokens issued before the claims existed still authenticate"""
+
+    def test_token_without_claims_falls_back_to_db(self):
+        user = User.objects.create_user(email='old@test.com', password='testpass123', role='student')
+        token = str(AccessToken.for_user(user))
+        self.assertEqual(async_to_sync(get_user_from_token)(token), user)
+
+
+class NotificationDispatcherTest(TestCase):
+    """Group sends are queued and drained on the ASGI loop"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.layer = get_channel_layer()
+        self.dispatchers = []
+
+    def tearDown(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.unbind()
+        self._run(asyncio.sleep(0.01))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=5)
+
+    def _bound_dispatcher(self, **kwargs):
+        dispatcher = NotificationDispatcher(**kwargs)
+
+        async def bind():
+            dispatcher.bind(asyncio.get_running_loop())
+        self._run(bind())
+        self.dispatchers.append(dispatcher)
+        return dispatcher
+
+    def _listen(self, *groups):
+        channel = self._run(self.layer.new_channel())
+        for group in groups:
+            self._run(self.layer.group_add(group, channel))
+        return channel
+
+    def test_batches_keep_per_group_order(self):
+        channels = {group: self._listen(group) for group in ('g_a', 'g_b')}
+        dispatcher = self._bound_dispatcher()
+
+        for i in range(20):
+            dispatcher.submit('g_a' if i % 2 else 'g_b', {'type': 'notification', 'data': {'i': i}})
+        self._run(dispatcher.join())
+
+        for group, parity in (('g_a', 1), ('g_b', 0)):
+            received = [json.loads(self._run(self.layer.receive(channels[group]))['text'])['data']['i'] for _ in range(10)]
+            self.assertEqual(received, [i for i in range(20) if i % 2 == parity])
+        metrics = dispatcher.metrics()
+        self.assertEqual((metrics['sent'], metrics['depth'], metrics['dropped']), (20, 0, 0))
+        self.assertIsNotNone(metrics['latency_ms']['p95'])
+
+    def test_full_queue_drops_and_counts(self):
+        dispatcher = self._bound_dispatcher(maxsize=2)
+
+        async def burst():
+            # On-loop submissions enqueue before the drain task can run
+            return [dispatcher.submit('g_c', {'type': 'notification', 'data': {}}) for _ in range(5)]
+        self._run(burst())
+        self._run(dispatcher.join())
+
+        metrics = dispatcher.metrics()
+        self.assertEqual((metrics['submitted'], metrics['dropped'], metrics['sent']), (2, 3, 2))
+
+    def test_urgent_lane_goes_first_and_never_drops(self):
+        channel = self._listen('g_n', 'g_u')
+        dispatcher = self._bound_dispatcher(maxsize=2, batch_size=1)
+
+        async def burst():
+            dispatcher.submit('g_n', {'type': 'notification', 'data': {'i': 0}})
+            dispatcher.submit('g_u', {'type': 'notification', 'data': {'i': 1}})
+            dispatcher.submit('g_n', {'type': 'notification', 'data': {'i': 2}})
+            # Normal lane full: the urgent one still gets in, with g_u's pending message ahead of it
+            return dispatcher.submit('g_u', {'type': 'can_start', 'data': {'i': 3}})
+        self.assertTrue(self._run(burst()))
+        self._run(dispatcher.join())
+
+        received = [json.loads(self._run(self.layer.receive(channel))['text']) for _ in range(3)]
+        self.assertEqual([(m['type'], m['data']['i']) for m in received],
+                         [('notification', 1), ('can_start', 3), ('notification', 0)])
+        lanes = dispatcher.metrics()['lanes']
+        self.assertEqual((lanes['urgent']['sent'], lanes['normal']['sent'], lanes['normal']['dropped']), (1, 2, 1))
+        self.assertIsNotNone(lanes['urgent']['latency_ms']['max'])
+
+    def test_low_lane_coalesces_queue_updates(self):
+        channel = self._listen('company_low')
+        dispatcher = self._bound_dispatcher()
+
+        async def burst():
+            for i in range(3):
+                dispatcher.submit('company_low', {'type': 'queue_update', 'data': {'i': i}, 'seq': i + 1})
+        self._run(burst())
+        self._run(dispatcher.join())
+
+        self.assertEqual(json.loads(self._run(self.layer.receive(channel))['text'])['seq'], 3)
+        lanes = dispatcher.metrics()['lanes']
+        self.assertEqual((lanes['low']['sent'], lanes['low']['coalesced']), (1, 2))
+
+    def test_service_sends_only_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            NotificationService.notify_admin('test', {'message': 'hello'})
+        self.assertEqual(len(callbacks), 1)
+
+
+class NotificationOutboxTest(TestCase):
+    """Personal group events are stored with a per-group sequence"""
+
+    def test_sequence_per_group(self):
+        seqs = [OutboxEvent.record(group, 'notification', {}).seq
+                for group in ('student_1', 'student_1', 'company_abc', 'student_1')]
+        self.assertEqual(seqs, [1, 2, 1, 3])
+
+    def test_send_records_personal_groups_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService._send_to_group('student_7', 'can_start', {'queue_id': 1})
+            NotificationService.notify_admin('test', {'message': 'hello'})
+            # Numbered after commit: the request never locks the seq row
+            self.assertFalse(GroupSequence.objects.exists())
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.as_message(), {'type': 'can_start', 'data': {'queue_id': 1}, 'seq': 1})
+
+    def test_prune_keeps_latest_per_group(self):
+        for _ in range(5):
+            OutboxEvent.record('student_1', 'notification', {})
+        OutboxEvent.record('student_2', 'notification', {})
+        OutboxEvent.objects.filter(group='student_2').update(created_at=timezone.now() - timedelta(hours=3))
+
+        deleted = OutboxEvent.objects.prune(max_age=3600, keep_per_group=2)
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(OutboxEvent.objects.values_list('group', 'seq')), [('student_1', 4), ('student_1', 5)])
+
+
+class OutboxReplayTest(TransactionTestCase):
+    """Reconnecting clients get missed events, or a resync when gone"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='replay@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Re', last_name='Play')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        self.group = f'student_{self.student.id}'
+        # Start from an empty stream (creating the student pushed a snapshot)
+        OutboxEvent.objects.all().delete()
+        GroupSequence.objects.all().delete()
+        for i in range(3):
+            OutboxEvent.record(self.group, 'can_start' if i == 2 else 'notification', {'i': i})
+
+    def _reconnect(self, resume_from, count):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+
+        async def connect():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/notifications/?token={self.token}&resume_from={resume_from}'
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual((await communicator.receive_json_from())['type'], 'connection_established')
+            messages = [await communicator.receive_json_from() for _ in range(count)]
+            catch_up = await communicator.receive_json_from()
+            self.assertEqual(catch_up['type'], 'catch_up')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            return messages, catch_up
+        return async_to_sync(connect)()
+
+    def test_missed_events_are_replayed_in_order(self):
+        messages, catch_up = self._reconnect(resume_from=1, count=2)
+        self.assertEqual([(m['type'], m['seq']) for m in messages], [('notification', 2), ('can_start', 3)])
+        self.assertTrue(messages[1]['urgent'])
+        self.assertNotIn('resync', catch_up)
+
+    def test_up_to_date_client_gets_nothing(self):
+        self.assertEqual(self._reconnect(resume_from=3, count=0)[0], [])
+
+    def test_pruned_gap_requires_resync(self):
+        OutboxEvent.objects.prune(max_age=3600, keep_per_group=1)
+        messages, catch_up = self._reconnect(resume_from=0, count=0)
+        self.assertEqual((catch_up['resync'], catch_up['seq']), (True, 3))
+        self.assertIn('profile', catch_up['versions'])
+
+
+class NotificationFanOutTest(TestCase):
+    """Company status changes reach every inscribed student in one batch"""
+
+    def _company_with_queue(self, size):
+        company = Company.objects.create(name=f'Fan Out {size}')
+        for i in range(size):
+            user = User.objects.create_user(email=f'fan{size}_{i}@test.com', password='x', role='student')
+            student = Student.objects.create(user=user, first_name=f'Fan{i}', last_name='Out')
+            Queue.objects.create(company=company, student=student)
+        return company
+
+    def _pause(self, company):
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            NotificationService.on_company_status_change(company, 'paused')
+        return len(queries), callbacks
+
+    def test_pause_cost_does_not_grow_with_queue(self):
+        small_queries, _ = self._pause(self._company_with_queue(2))
+        large_queries, callbacks = self._pause(self._company_with_queue(25))
+
+        self.assertEqual(small_queries, large_queries)
+        # One hand-off for all students, one for the admin group
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(OutboxEvent.objects.filter(event_type='notification').count(), 27)
+
+    def test_record_many_numbers_within_each_group(self):
+        OutboxEvent.record('student_1', 'notification', {})
+        events = OutboxEvent.record_many([
+            ('student_1', 'notification', {'n': 1}),
+            ('student_2', 'notification', {}),
+            ('student_1', 'can_start', {'n': 2}),
+        ])
+        self.assertEqual([(e.group, e.seq) for e in events], [('student_1', 2), ('student_2', 1), ('student_1', 3)])
+
+
+class NotificationBufferTest(TestCase):
+    """Events of one request reach each recipient as a single message"""
+
+    def test_coalesce_merges_per_group_in_order(self):
+        a1, b1, a2 = ({'type': 'notification', 'seq': n} for n in (1, 2, 3))
+        self.assertEqual(
+            buffer.coalesce([('g_a', a1), ('g_b', b1), ('g_a', a2)]),
+            [('g_a', {'type': 'batch', 'events': [a1, a2]}), ('g_b', b1)]
+        )
+
+    def test_status_change_and_can_start_share_one_message(self):
+        user = User.objects.create_user(email='merge@test.com', password='x', role='student')
+        student = Student.objects.create(user=user, first_name='Mer', last_name='Ge')
+        Queue.objects.create(company=Company.objects.create(name='Merge Corp'), student=student)
+        student.status = 'available'
+        student.save()
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'student_{student.id}', channel)
+
+        with buffer.collect():
+            with self.captureOnCommitCallbacks(execute=True):
+                NotificationService.on_student_status_change(student, 'paused', 'available')
+
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['type'], 'batch')
+        self.assertEqual([event['type'] for event in message['events']], ['notification', 'can_start'])
+        self.assertEqual([event['seq'] for event in message['events']], [1, 2])
+
+
+class AdminEventStreamTest(TestCase):
+    """Admin sockets get one summary per tick instead of every event"""
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.summary = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('admin', self.summary)
+
+    def _receive(self, channel):
+        # Client frame, encoded by the dispatcher
+        return json.loads(async_to_sync(self.layer.receive)(channel)['text'])
+
+    def test_unbound_stream_summarizes_each_event(self):
+        firehose = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('admin_firehose', firehose)
+        stream = AdminEventStream()
+
+        stream.publish({'notification_type': 'queue_update', 'message': 'Alice a rejoint', 'extra': 1})
+
+        summary = self._receive(self.summary)
+        self.assertEqual(summary['type'], 'admin_summary')
+        self.assertEqual(summary['data']['events'], 1)
+        self.assertEqual(summary['data']['activity'], [{'notification_type': 'queue_update', 'message': 'Alice a rejoint'}])
+        self.assertIn('total_students', summary['data']['counters'])
+        self.assertEqual(self._receive(firehose)['data']['extra'], 1)
+
+    def test_events_between_ticks_share_one_summary(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        stream = AdminEventStream(interval=0.2)
+        try:
+            # Bound from the loop thread, as DispatcherLoopMiddleware does
+            async def bind():
+                notification_dispatcher.bind(loop)
+                stream.bind(loop)
+            asyncio.run_coroutine_threadsafe(bind(), loop).result(timeout=5)
+            for i in range(3):
+                stream.publish({'notification_type': 'status_change', 'message': f'event {i}'})
+
+            summary = json.loads(asyncio.run_coroutine_threadsafe(
+                self.layer.receive(self.summary), loop
+            ).result(timeout=5)['text'])
+        finally:
+            stream.unbind()
+            notification_dispatcher.unbind()
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.assertEqual(summary['data']['events'], 3)
+        self.assertEqual([a['message'] for a in summary['data']['activity']], ['event 0', 'event 1', 'event 2'])
+
+
+class OpportunitySnapshotTest(TestCase):
+    """Students get their recomputed opportunities only when they changed"""
+
+    def setUp(self):
+        self.company = Company.objects.create(name='Snapshot Corp')
+        self.students = []
+        for name in ('Alice', 'Bob'):
+            user = User.objects.create_user(email=f'{name}@snap.com', password='testpass123', role='student')
+            student = Student.objects.create(user=user, first_name=name, last_name='Snap', status='available')
+            Queue.objects.create(company=self.company, student=student)
+            self.students.append(student)
+        snapshots.cache.delete_many([snapshots._digest_key(s.id) for s in self.students])
+
+    def _push(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return snapshots.push({('company', self.company.id)})
+
+    def test_only_changed_students_are_pushed(self):
+        alice, bob = self.students
+        self.assertEqual(sorted(self._push()), [alice.id, bob.id])
+        self.assertEqual(self._push(), [])
+
+        # Bob pausing changes his own rows, not Alice's (still first available)
+        Student.objects.filter(pk=bob.pk).update(status='paused')
+        self.assertEqual(self._push(), [bob.id])
+
+        event = OutboxEvent.objects.filter(group=f'student_{bob.id}').last()
+        self.assertEqual(event.event_type, 'opportunities_snapshot')
+        self.assertEqual(event.data['student_status'], 'paused')
+
+    def test_snapshot_matches_opportunities_view(self):
+        alice = self.students[0]
+        self._push()
+        pushed = OutboxEvent.objects.get(group=f'student_{alice.id}').data
+
+        client = APIClient()
+        client.force_authenticate(user=alice.user)
+        response = client.get('/api/queues/opportunities/')
+
+        self.assertEqual(pushed, response.data)
+
+    def test_join_at_end_recomputes_only_the_newcomer(self):
+        alice, bob = self.students
+        user = User.objects.create_user(email='carol@snap.com', password='testpass123', role='student')
+        carol = Student.objects.create(user=user, first_name='Carol', last_name='Snap')
+        entry = Queue.objects.create(company=self.company, student=carol)
+
+        targets = {('queue', self.company.id, entry.position), ('student', carol.id)}
+        self.assertEqual(snapshots.affected_students(targets), {carol.id})
+        # Bob's change reaches the entries behind him, not Alice ahead
+        self.assertEqual(snapshots.affected_students({('student', bob.id)}), {bob.id, carol.id})
+        self.assertEqual(
+            snapshots.affected_students({('company', self.company.id)}), {alice.id, bob.id, carol.id}
+        )
+
+    def test_offline_students_are_skipped(self):
+        alice, bob = self.students
+        with mock.patch.object(presence, 'offline', return_value={f'student_{bob.id}'}):
+            self.assertEqual(self._push(), [alice.id])
+
+
+class DeferredRunnerTest(TestCase):
+    """Deferred pushes run after the response, merged and in bounded batches"""
+
+    def test_bound_runner_merges_and_bounds_batches(self):
+        runner = buffer.DeferredRunner(batch_size=2)
+        runner._loop = mock.Mock(is_closed=mock.Mock(return_value=False))
+        runner._wakeup = mock.Mock()
+        calls = []
+
+        def push(targets):
+            calls.append(set(targets))
+
+        runner.submit(push, {1, 2})
+        runner.submit(push, {2, 3})
+        self.assertEqual(calls, [])
+        self.assertEqual(runner.pending(), 3)
+
+        first = runner._take()
+        self.assertEqual(len(first[push]), 2)
+        runner._run_batch(first)
+        runner._run_batch(runner._take())
+        self.assertEqual(runner._take(), {})
+        self.assertEqual(set().union(*calls), {1, 2, 3})
+
+    def test_unbound_runner_runs_right_away(self):
+        calls = []
+        buffer.DeferredRunner().submit(calls.append, [('company', 1)])
+        self.assertEqual(calls, [{('company', 1)}])
+
+
+class EncodedBroadcastTest(TestCase):
+    """Group messages are encoded once and written as is by every consumer"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='encoded@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='En', last_name='Coded')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+
+    def test_prepared_message_carries_client_frame(self):
+        prepared = encoding.prepare({'type': 'can_start', 'data': {'company_id': 1}, 'seq': 3})
+        self.assertEqual(set(prepared), {'type', 'seq', 'text'})
+        self.assertEqual(json.loads(prepared['text']), {
+            'type': 'can_start', 'data': {'company_id': 1}, 'urgent': True, 'seq': 3
+        })
+        self.assertIs(encoding.prepare(prepared), prepared)
+
+    def test_orjson_matches_django_encoding(self):
+        """Same values with or without orjson: Django dates, int keys"""
+        content = {'data': {
+            'at': datetime(2026, 3, 5, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'day': date(2026, 3, 5), 'time': dt_time(9, 30, 15, 123456),
+            'price': Decimal('1.50'), 'id': uuid.UUID(int=7), 'counts': {3: 'three'},
+        }}
+        expected = json.dumps(content, cls=DjangoJSONEncoder)
+        self.assertEqual(json.loads(encoding.dumps(content)), json.loads(expected))
+        self.assertEqual(json.loads(encoding.dumps(content))['data']['at'], '2026-03-05T09:30:15.123Z')
+        with mock.patch.object(encoding, 'orjson', None):
+            self.assertEqual(encoding.dumps(content), expected)
+
+    def test_consumers_send_text_and_skip_delivered_seqs(self):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+        layer = get_channel_layer()
+        group = f'student_{self.student.id}'
+        first = encoding.prepare({'type': 'notification', 'data': {'i': 1}, 'seq': 1})
+        batch = encoding.prepare({'type': 'batch', 'events': [
+            {'type': 'notification', 'data': {'i': 1}, 'seq': 1},
+            {'type': 'queue_update', 'data': {'i': 2}, 'seq': 2},
+        ]})
+
+        async def receive():
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+            await communicator.connect()
+            # connection_established, catch_up
+            [await communicator.receive_json_from() for _ in range(2)]
+            await layer.group_send(group, first)
+            raw = await communicator.receive_from()
+            # Overlapping batch: only the new event, re-encoded
+            await layer.group_send(group, batch)
+            rest = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return raw, rest
+
+        raw, rest = async_to_sync(receive)()
+        self.assertEqual(raw, first['text'])
+        self.assertEqual(rest, {'type': 'queue_update', 'data': {'i': 2}, 'seq': 2})
+
+
+class SocketBacklogTest(TestCase):
+    """A socket that fell behind gets one resync instead of stale events"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='backlog@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Back', last_name='Log')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        socket_backlog.reset_metrics()
+
+    def test_stale_events_collapse_into_one_resync(self):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+        layer = get_channel_layer()
+        group = f'student_{self.student.id}'
+        stale = time.time() - 60
+
+        def event(event_type, seq, sent_at):
+            return {**encoding.prepare({'type': event_type, 'data': {'seq': seq}, 'seq': seq}), 'sent_at': sent_at}
+
+        async def fall_behind():
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+            await communicator.connect()
+            # connection_established, catch_up
+            [await communicator.receive_json_from() for _ in range(2)]
+            for message in (
+                event('notification', 1, stale),
+                event('notification', 2, stale + 1),
+                event('can_start', 3, stale + 2),
+            ):
+                await layer.group_send(group, message)
+            received = [await communicator.receive_json_from() for _ in range(2)]
+            # Sent after the resync: delivered again
+            await layer.group_send(group, event('queue_update', 4, time.time()))
+            received.append(await communicator.receive_json_from())
+            self.assertTrue(await communicator.receive_nothing())
+            metrics = socket_backlog.metrics()
+            await communicator.disconnect()
+            return received, metrics
+
+        received, metrics = async_to_sync(fall_behind)()
+        self.assertEqual([(m['type'], m['seq']) for m in received], [('catch_up', 1), ('can_start', 3), ('queue_update', 4)])
+        # The resync tells what changed and spreads the refetches
+        resync = received[0]
+        self.assertTrue(resync['resync'])
+        self.assertIn('profile', resync['versions'])
+        self.assertTrue(0 <= resync['delay'] <= socket_backlog.resync_jitter)
+        self.assertEqual((metrics['connections'], metrics['dropped'], metrics['resyncs']), (1, 2, 1))
+        self.assertGreater(metrics['lag_ms']['max'], 50000)
+
+    def test_slow_socket_resyncs_on_a_healthy_worker(self):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+
+        async def slow_application(scope, receive, send):
+            async def slow_send(message):
+                if message['type'] == 'websocket.send':
+                    await asyncio.sleep(0.3)
+                await send(message)
+            await application(scope, receive, slow_send)
+
+        async def one_slow_socket():
+            fast = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+            slow = WebsocketCommunicator(slow_application, f'/ws/notifications/?token={self.token}')
+            for communicator in (fast, slow):
+                await communicator.connect()
+                [await communicator.receive_json_from() for _ in range(2)]
+            # Fresh events from one request: the worker keeps up
+            sent_at = time.time()
+            for seq in (1, 2, 3):
+                await get_channel_layer().group_send(f'student_{self.student.id}', {
+                    **encoding.prepare({'type': 'notification', 'data': {'seq': seq}, 'seq': seq}),
+                    'sent_at': sent_at
+                })
+            fast_received = [await fast.receive_json_from() for _ in range(3)]
+            slow_received = [await slow.receive_json_from(timeout=2)]
+            self.assertTrue(await slow.receive_nothing(timeout=1))
+            metrics = socket_backlog.metrics()
+            for communicator in (fast, slow):
+                await communicator.disconnect()
+            return fast_received, slow_received, metrics
+
+        with mock.patch.object(socket_backlog, 'max_lag', 0.2):
+            fast_received, slow_received, metrics = async_to_sync(one_slow_socket)()
+        self.assertEqual([m['seq'] for m in fast_received], [1, 2, 3])
+        # The slow socket gets one resync instead of the events
+        self.assertEqual([(m['type'], m.get('resync')) for m in slow_received], [('catch_up', True)])
+        self.assertEqual((metrics['slow'], metrics['resyncs'], metrics['dropped']), (1, 1, 3))
+
+
+class WebSocketCommandTest(TransactionTestCase):
+    """Interview actions sent on the socket are acked with the view's response"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='command@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Com', last_name='Mand', status='available')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        self.company = Company.objects.create(name='Command Corp')
+        self.entry = Queue.objects.create(company=self.company, student=self.student)
+        self.application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+
+    def _commands(self, query, *commands):
+        """Acks of the commands, in order (events in between are skipped)"""
+        async def run():
+            communicator = WebsocketCommunicator(self.application, f'/ws/notifications/?{query}')
+            await communicator.connect()
+            await communicator.receive_json_from()
+            acks = []
+            for command in commands:
+                await communicator.send_json_to(command)
+                while True:
+                    message = await communicator.receive_json_from(timeout=5)
+                    if message['type'] == 'ack':
+                        acks.append(message)
+                        break
+            await communicator.disconnect()
+            return acks
+        return async_to_sync(run)()
+
+    def test_interview_round_trip(self):
+        started, refused = self._commands(
+            f'token={self.token}',
+            {'type': 'start_interview', 'request_id': 'r1', 'queue_id': self.entry.id},
+            {'type': 'set_status', 'request_id': 'r2', 'status': 'paused'},
+        )
+        self.assertEqual((started['request_id'], started['ok']), ('r1', True))
+        self.assertEqual(started['data']['status'], 'in_interview')
+        self.assertEqual((refused['request_id'], refused['ok']), ('r2', False))
+
+        completed, = self._commands(
+            f'company_token={self.company.access_token}',
+            {'type': 'complete_interview', 'request_id': 'c1', 'queue_id': self.entry.id},
+        )
+        self.assertTrue(completed['ok'])
+        self.entry.refresh_from_db()
+        self.student.refresh_from_db()
+        self.assertTrue(self.entry.is_completed)
+        self.assertEqual(self.student.status, 'paused')
+
+    def test_commands_follow_http_permissions(self):
+        forbidden, missing = self._commands(
+            f'token={self.token}',
+            {'type': 'complete_interview', 'request_id': 'x', 'queue_id': self.entry.id},
+            {'type': 'start_interview', 'request_id': 'y', 'queue_id': 0},
+        )
+        self.assertEqual((forbidden['ok'], forbidden['error']), (False, "Action non autorisée"))
+        self.assertEqual((missing['ok'], missing['error']), (False, "Inscription introuvable"))
+        self.assertFalse(Queue.objects.get(pk=self.entry.pk).is_completed)
+
+    def test_expired_session_is_acked_with_its_code(self):
+        access = JobFairTokenObtainPairSerializer.get_token(self.student.user).access_token
+        access.set_exp(lifetime=timedelta(seconds=1))
+        query = f'token={access}'
+
+        async def run():
+            communicator = WebsocketCommunicator(self.application, f'/ws/notifications/?{query}')
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await asyncio.sleep(1.5)
+            await communicator.send_json_to({'type': 'set_status', 'request_id': 'e1', 'status': 'paused'})
+            while (message := await communicator.receive_json_from(timeout=5))['type'] != 'ack':
+                pass
+            await communicator.disconnect()
+            return message
+
+        expired = async_to_sync(run)()
+        self.assertEqual(
+            (expired['ok'], expired['error'], expired['code']),
+            (False, "Session expirée", commands.SESSION_EXPIRED)
+        )
+        self.student.refresh_from_db()
+        self.assertEqual(self.student.status, 'available')
+
+    def test_missing_rows_and_db_errors_are_acked(self):
+        with mock.patch.object(commands, 'set_student_status', side_effect=DatabaseError('locked')):
+            failed, = self._commands(
+                f'token={self.token}', {'type': 'set_status', 'request_id': 'd1', 'status': 'paused'}
+            )
+        self.assertEqual((failed['ok'], failed['error']), (False, "Erreur serveur, veuillez réessayer"))
+        with mock.patch.object(commands, 'set_student_status', side_effect=KeyError('status')):
+            crashed, = self._commands(
+                f'token={self.token}', {'type': 'set_status', 'request_id': 'd3', 'status': 'paused'}
+            )
+        self.assertEqual((crashed['ok'], crashed['request_id']), (False, 'd3'))
+
+        Student.objects.filter(pk=self.student.pk).delete()
+        deleted, = self._commands(
+            f'token={self.token}', {'type': 'set_status', 'request_id': 'd2', 'status': 'paused'}
+        )
+        self.assertEqual((deleted['ok'], deleted['error']), (False, "Profil introuvable"))
+        self.assertNotIn('code', deleted)
+
+
+class HandshakeAdmissionTest(TransactionTestCase):
+    """Handshakes beyond capacity are told to retry; tablets keep their slots"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='storm@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Sto', last_name='Rm')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        self.company = Company.objects.create(name='Storm Corp')
+        self.gate = AdmissionGate(max_handshakes=3, reserved=1)
+        patcher = mock.patch('notifications.middleware.admission_gate', self.gate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _connect(self, query):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+
+        async def connect():
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/?{query}')
+            await communicator.connect()
+            message = await communicator.receive_json_from()
+            output = await communicator.receive_output() if message['type'] == 'retry' else None
+            await communicator.disconnect()
+            return message, output
+        return async_to_sync(connect)()
+
+    def test_students_refused_first_and_told_when_to_retry(self):
+        self.gate.active = 2
+        message, close = self._connect(f'token={self.token}')
+        self.assertEqual(message['type'], 'retry')
+        self.assertGreaterEqual(message['retry_after'], 1.0)
+        self.assertEqual(close, {'type': 'websocket.close', 'code': 4429})
+
+        # The reserved slot still admits a company tablet
+        message, _ = self._connect(f'company_token={self.company.access_token}')
+        self.assertEqual(message['type'], 'connection_established')
+        self.assertEqual(self.gate.active, 2)
+        self.assertEqual(self.gate.metrics()['refused'], 1)
+
+    def test_connected_sockets_free_their_slot(self):
+        for _ in range(4):
+            message, _ = self._connect(f'token={self.token}')
+            self.assertEqual(message['type'], 'connection_established')
+        self.assertEqual((self.gate.active, self.gate.metrics()['admitted']), (0, 4))
+
+
+class PresenceTest(TestCase):
+    """Silent sockets are reaped; offline personal groups are not sent to"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='presence@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Pre', last_name='Sence')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        self.group = f'student_{self.student.id}'
+        self.presence = PresenceRegistry(interval=60, timeout=0.05)
+        self.presence.shared = False
+        for module in ('consumers', 'dispatcher'):
+            patcher = mock.patch(f'notifications.{module}.presence', self.presence)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_silent_socket_is_reaped(self):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+
+        async def go_silent():
+            self.presence.bind(asyncio.get_running_loop())
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+            await communicator.connect()
+            established = await communicator.receive_json_from()
+            await communicator.receive_json_from()
+            online = (self.presence.is_online(self.group), self.presence.counts())
+            await asyncio.sleep(0.1)
+            # A ping keeps it alive
+            await communicator.send_json_to({'type': 'ping'})
+            await communicator.receive_json_from()
+            kept = await self.presence.reap()
+            await asyncio.sleep(0.1)
+            reaped = await self.presence.reap()
+            closed = await communicator.receive_output()
+            offline = self.presence.offline([self.group, 'admin'])
+            await communicator.disconnect()
+            self.presence.unbind()
+            return established, online, kept, reaped, closed, offline
+
+        established, online, kept, reaped, closed, offline = async_to_sync(go_silent)()
+        self.assertEqual(established['heartbeat'], 60)
+        self.assertEqual(online, (True, {'connections': 1, 'students': 1, 'companies': 0}))
+        self.assertEqual((kept, reaped), (0, 1))
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': 4408})
+        self.assertEqual(offline, {self.group})
+        self.assertEqual(self.presence.counts()['connections'], 0)
+        self.assertIsNotNone(self.presence.last_seen(self.group))
+
+    def test_dispatcher_skips_offline_groups(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)('admin', channel)
+        dispatcher = NotificationDispatcher()
+
+        async def send():
+            self.presence.bind(asyncio.get_running_loop())
+            sent = await sync_to_async(dispatcher.submit_many)([
+                (self.group, {'type': 'can_start', 'data': {}}),
+                ('admin', {'type': 'notification', 'data': {}}),
+            ])
+            self.presence.unbind()
+            return sent
+
+        self.assertTrue(async_to_sync(send)())
+        self.assertEqual(async_to_sync(layer.receive)(channel)['type'], 'notification')
+        self.assertEqual((dispatcher.metrics()['offline'], dispatcher.metrics()['sent']), (1, 1))
+
+
+class CompactFrameTest(TestCase):
+    """The CBOR subprotocol carries the same frames, smaller"""
+
+    def setUp(self):
+        user = User.objects.create_user(email='cbor@test.com', password='testpass123', role='student')
+        self.student = Student.objects.create(user=user, first_name='Cb', last_name='Or')
+        self.token = str(JobFairTokenObtainPairSerializer.get_token(user).access_token)
+        self.company = Company.objects.create(name='Compact Corp')
+
+    def test_service_messages_use_templates(self):
+        Queue.objects.create(company=self.company, student=self.student)
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f'student_{self.student.id}', channel)
+
+        with buffer.collect():
+            with self.captureOnCommitCallbacks(execute=True):
+                NotificationService.on_student_status_change(self.student, 'paused', 'available')
+
+        text = async_to_sync(layer.receive)(channel)['text']
+        frame = compact.from_text(text)
+        coded = cbor2.loads(frame)
+        messages = [event[compact.FIELD_CODES['data']][compact.FIELD_CODES['message']]
+                    for event in coded[compact.FIELD_CODES['events']]]
+        self.assertTrue(all(isinstance(message, int) for message in messages))
+        self.assertEqual(compact.loads(frame), json.loads(text))
+        self.assertLess(len(frame), len(text.encode()) / 2)
+
+    def test_negotiated_socket_gets_cbor_frames(self):
+        application = WebSocketAuthMiddleware(NotificationConsumer.as_asgi())
+        message = encoding.prepare({'type': 'can_start', 'seq': 1, 'data': {
+            'notification_type': 'can_start', 'company_name': self.company.name,
+            'message': f"🎯 Tu peux passer chez {self.company.name} !", 'can_start': True
+        }})
+
+        async def receive():
+            cbor_socket = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}',
+                                                subprotocols=[compact.SUBPROTOCOL])
+            json_socket = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+            _, subprotocol = await cbor_socket.connect()
+            await json_socket.connect()
+            established = cbor2.loads(await cbor_socket.receive_from())
+            catch_up = compact.loads(await cbor_socket.receive_from())
+            [await json_socket.receive_from() for _ in range(2)]
+            await get_channel_layer().group_send(f'student_{self.student.id}', message)
+            received = (await cbor_socket.receive_from(), await json_socket.receive_from())
+            await cbor_socket.disconnect()
+            await json_socket.disconnect()
+            return subprotocol, established, catch_up, received
+
+        subprotocol, established, catch_up, (frame, text) = async_to_sync(receive)()
+        self.assertEqual(subprotocol, compact.SUBPROTOCOL)
+        self.assertEqual(established['schema']['fields'], list(compact.FIELDS))
+        self.assertEqual(catch_up['type'], 'catch_up')
+        self.assertEqual(text, message['text'])
+        self.assertEqual(compact.loads(frame), json.loads(text))
@@ -2,6 +2,9 @@
 Django Admin configuration for Queues app
 """
 from django.contrib import admin
+from django.db import transaction
+from core import versions
+from .index import queue_index
 from .models import Queue
 
 
@@ -31,9 +34,13 @@ class QueueAdmin(admin.ModelAdmin):
             is_completed=True,
             completed_at=timezone.now()
         )
+        transaction.on_commit(queue_index.invalidate)
+        transaction.on_commit(versions.bump_epoch)
         self.message_user(request, f"Marked {queryset.count()} entries as completed")
     
     @admin.action(description='Reset to pending')
     def reset_to_pending(self, request, queryset):
         queryset.update(is_completed=False, completed_at=None)
+        transaction.on_commit(queue_index.invalidate)
+        transaction.on_commit(versions.bump_epoch)
         self.message_user(request, f"Reset {queryset.count()} entries to pending")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class QueuesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'queues'
+
+    def ready(self):
+        # Keep the in-memory queue index in sync with model changes
+        from . import signals  # noqa: F401
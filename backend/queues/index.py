@@ -0,0 +1,542 @@
+"""
+In-memory queue index for JobFair Platform
+Per-company read model of waiting entries used for first-available
+and ahead-count lookups without SQL round trips (R2, R3, R10, R15),
+plus the admin dashboard aggregates
+
+The index only reflects committed state: model signals (see queues.signals)
+push changes into it once the surrounding transaction commits. A caller that
+has uncommitted queue/student writes on its connection falls back to the DB.
+
+Signals only reach the index of the process that wrote: changes made by
+another worker, a shell or a management command never arrive. Every
+process counts its committed updates (and invalidations) in a shared cache
+counter; when the counter moved by more than this process's own updates
+since its index was loaded, lookups fall back to the DB until a rebuild
+catches up (in the background once bound to the ASGI loop, on the lookup
+otherwise).
+
+Rebuilds load a fresh copy without holding the index lock and swap it in;
+updates committed meanwhile are replayed on the copy. Once bound to the
+ASGI loop, a background task reconciles the index every RECONCILE_INTERVAL
+seconds, correcting any drift of the incremental aggregates.
+"""
+import time
+import asyncio
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+
+# Seconds between background rebuilds from the DB
+RECONCILE_INTERVAL = 300
+# Cache counter of the index updates committed by all processes
+WRITES_KEY = 'queue_index:writes'
+
+
+def _shared_writes():
+    return cache.get(WRITES_KEY, 0)
+
+
+def _count_shared_write():
+    try:
+        cache.incr(WRITES_KEY)
+    except ValueError:
+        if not cache.add(WRITES_KEY, 1, timeout=None):
+            cache.incr(WRITES_KEY)
+
+
+class CompanyQueueIndex:
+    """
+    Waiting entries of a single company, kept as sorted (position, queue_id) lists
+
+    - waiting: every non-completed entry (greyed students included)
+    - available: entries whose student is 'available' and not interviewing
+    - interviewing: entries whose student is currently interviewing here
+    """
+
+    __slots__ = ('waiting', 'available', 'interviewing')
+
+    def __init__(self):
+        self.waiting = []
+        self.available = []
+        self.interviewing = []
+
+
+def _discard(sorted_list, key):
+    """Remove key from a sorted list if present"""
+    i = bisect_left(sorted_list, key)
+    if i < len(sorted_list) and sorted_list[i] == key:
+        del sorted_list[i]
+
+
+def _update(method):
+    """
+    Apply an update under the index lock (ignored until built), count it
+    in the shared counter, and record it while a rebuild is loading so it
+    can be replayed on the copy
+    """
+    @wraps(method)
+    def apply(self, *args):
+        with self._lock:
+            self._count_write()
+            if self._pending is not None:
+                self._pending.append((method, args))
+            if self._ready:
+                method(self, *args)
+    return apply
+
+
+class QueueIndex:
+    """
+    Process-wide read model of all open queue entries
+
+    Built lazily from the DB on first use (and after invalidate()),
+    then kept current by post-commit model signals of this process and
+    rebuilt when another process wrote (see is_current).
+    """
+
+    # Attributes replaced when a rebuilt copy is swapped in
+    STATE = (
+        '_companies', '_entries', '_students', '_student_entries', '_company_meta',
+        '_interviews_at', '_status_counts', '_completed_count', '_idle_students',
+        '_idle_companies', '_built_at',
+    )
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # One rebuild at a time; lookups keep using the lock meanwhile
+        self._build_lock = threading.Lock()
+        self._ready = False
+        # Updates recorded while a rebuild loads, None otherwise
+        self._pending = None
+        # Bumped by invalidate(): a rebuild started before is discarded
+        self._generation = 0
+        # Updates counted by this process, and the shared count minus them
+        # when the index was loaded (see is_current)
+        self._own_writes = 0
+        self._foreign_writes = None
+        self._refreshing = False
+        self._loop = None
+        self._task = None
+        self._reset()
+
+    def _reset(self):
+        self._companies = {}        # company_id -> CompanyQueueIndex
+        self._entries = {}          # queue_id -> (company_id, student_id, position)
+        self._students = {}         # student_id -> (status, current_company_id)
+        self._student_entries = {}  # student_id -> set of open queue_ids
+        # Admin dashboard aggregates
+        self._company_meta = {}         # company_id -> (name, status)
+        self._interviews_at = Counter() # company_id -> students with current_company
+        self._status_counts = Counter() # student status -> count
+        self._completed_count = 0       # completed entries
+        self._idle_students = set()     # students without open inscription
+        self._idle_companies = set()    # recruiting, waiting entries, nobody in interview
+        self._built_at = None
+
+    # ==========================================
+    # Lifecycle
+    # ==========================================
+
+    def rebuild(self):
+        """
+        Reload the whole index from the database
+
+        The copy is loaded without the index lock (lookups and updates go
+        on), then the updates committed meanwhile are replayed on it and it
+        is swapped in. Replayed updates carry absolute state, so applying
+        one the copy already reflects changes nothing.
+
+        Returns:
+            dict: {stat: (incremental, actual)} for every admin stat that
+            differed from the rebuilt copy (empty on a first build)
+        """
+        with self._build_lock:
+            with self._lock:
+                generation = self._generation
+                foreign_writes = _shared_writes() - self._own_writes
+                self._pending = []
+            try:
+                fresh = QueueIndex()
+                fresh._load()
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                pending, self._pending = self._pending, None
+                if generation != self._generation:
+                    # Invalidated while loading: the copy may predate the change
+                    return {}
+                for method, args in pending:
+                    method(fresh, *args)
+                before = self._aggregate() if self._ready else None
+                for name in self.STATE:
+                    setattr(self, name, getattr(fresh, name))
+                # Writes of other processes while loading leave it stale
+                self._foreign_writes = foreign_writes
+                self._ready = True
+                if before is None:
+                    return {}
+                after = self._aggregate()
+                return {
+                    key: (before[key], after[key])
+                    for key in after if before[key] != after[key]
+                }
+
+    def _load(self):
+        """Fill this (private, unshared) index from the database"""
+        from companies.models import Company
+        from queues.models import Queue
+        from students.models import Student
+
+        entries = list(
+            Queue.objects.filter(is_completed=False)
+            .values_list('id', 'company_id', 'student_id', 'position')
+        )
+        completed_count = Queue.objects.filter(is_completed=True).count()
+        students = Student.objects.values_list('id', 'status', 'current_company_id')
+        companies = Company.objects.values_list('id', 'name', 'status')
+
+        for company_id, name, status in companies:
+            self._company_meta[company_id] = (name, status)
+        for student_id, status, current_company_id in students:
+            self._set_student(student_id, status, current_company_id)
+            self._idle_students.add(student_id)
+        for queue_id, company_id, student_id, position in entries:
+            self._insert(queue_id, company_id, student_id, position)
+        self._completed_count = completed_count
+        for company_id in self._company_meta:
+            self._refresh_company(company_id)
+        self._built_at = time.monotonic()
+        self._ready = True
+
+    def reconcile(self):
+        """
+        Rebuild from the DB and report drift of the incremental aggregates
+        
+        Returns:
+            dict: {stat: (incremental, actual)} for every stat that drifted
+        """
+        drift = self.rebuild()
+        if drift:
+            print(f"Queue index stats drift corrected: {drift}")
+        return drift
+
+    def invalidate(self):
+        """
+        Drop the index; it is rebuilt from the DB on next lookup, here and
+        in the other processes (bulk writes bypassing the signals)
+        """
+        with self._lock:
+            self._count_write()
+            self._generation += 1
+            self._ready = False
+            self._reset()
+
+    def _ensure_built(self):
+        if not self._ready:
+            with self._build_lock:
+                built = self._ready
+            if not built:
+                self.rebuild()
+
+    # ==========================================
+    # Background reconciliation (ASGI loop)
+    # ==========================================
+
+    def bind(self, loop):
+        """Start reconciling on the ASGI loop (idempotent)"""
+        if self._loop is loop:
+            return
+        with self._lock:
+            if self._loop is loop:
+                return
+            self._task = loop.create_task(self._tick())
+            self._loop = loop
+
+    def unbind(self):
+        with self._lock:
+            if self._task:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            self._loop = self._task = None
+
+    @property
+    def is_bound(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL)
+            if not self._ready:
+                continue
+            try:
+                # Own thread: the rebuild queries must not hold up request handlers
+                await sync_to_async(self._in_thread, thread_sensitive=False)(self.reconcile)
+            except Exception as e:
+                print(f"Queue index reconcile error: {e}")
+
+    def _in_thread(self, func):
+        close_old_connections()
+        try:
+            func()
+        finally:
+            close_old_connections()
+
+    async def _refresh(self):
+        try:
+            await sync_to_async(self._in_thread, thread_sensitive=False)(self.rebuild)
+        except Exception as e:
+            print(f"Queue index refresh error: {e}")
+        finally:
+            self._refreshing = False
+
+    def _schedule_refresh(self):
+        """Rebuild in the background (once at a time); False when not bound"""
+        if not self.is_bound:
+            return False
+        with self._lock:
+            if not self._refreshing:
+                self._refreshing = True
+                self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._refresh()))
+        return True
+
+    # ==========================================
+    # Cross-process staleness
+    # ==========================================
+
+    def _count_write(self):
+        """Count an update of this process (under the index lock)"""
+        self._own_writes += 1
+        _count_shared_write()
+
+    def is_current(self):
+        """Built, and no other process wrote since it was loaded (one cache read)"""
+        with self._lock:
+            return self._ready and _shared_writes() - self._own_writes == self._foreign_writes
+
+    @property
+    def is_built(self):
+        """Lookups are served from memory (no rebuild query pending)"""
+        return self._ready
+
+    def is_usable(self):
+        """
+        Check if lookups can be served from the index
+
+        False when the current connection has index updates waiting for
+        commit: the caller must see its own writes, so it reads the DB.
+        Also False while another process's writes are not in the index
+        yet and a background rebuild is on its way (unbound processes
+        rebuild on the spot).
+        """
+        if connection.in_atomic_block and any(
+            getattr(callback[1], 'queue_index_update', False)
+            for callback in connection.run_on_commit
+        ):
+            return False
+        self._ensure_built()
+        if self.is_current():
+            return True
+        if self._schedule_refresh():
+            return False
+        self.rebuild()
+        return True
+
+    # ==========================================
+    # Updates (applied after commit)
+    # ==========================================
+
+    @_update
+    def upsert_entry(self, queue_id, company_id, student_id, position, is_completed, created=False):
+        """Apply a saved queue entry"""
+        # Every row is either open (in _entries) or completed
+        was_open = queue_id in self._entries
+        self._remove(queue_id)
+        if is_completed:
+            if was_open or created:
+                self._completed_count += 1
+        else:
+            if not was_open and not created:
+                self._completed_count = max(self._completed_count - 1, 0)
+            self._insert(queue_id, company_id, student_id, position)
+
+    @_update
+    def remove_entry(self, queue_id, is_completed=False):
+        """Apply a deleted queue entry"""
+        if queue_id in self._entries:
+            self._remove(queue_id)
+        elif is_completed:
+            self._completed_count = max(self._completed_count - 1, 0)
+
+    @_update
+    def update_student(self, student_id, status, current_company_id):
+        """Apply a student status change to every company they queue at"""
+        self._apply_student(student_id, status, current_company_id)
+
+    @_update
+    def remove_student(self, student_id):
+        """Apply a deleted student (their entries cascade separately)"""
+        for queue_id in list(self._student_entries.get(student_id, ())):
+            self._remove(queue_id)
+        self._student_entries.pop(student_id, None)
+        old = self._set_student(student_id, None, None)
+        self._idle_students.discard(student_id)
+        self._refresh_company(old and old[1])
+
+    @_update
+    def remove_company(self, company_id):
+        """Apply a deleted company (entries cascade, interviews are SET_NULL)"""
+        company = self._companies.get(company_id)
+        if company:
+            for _, queue_id in list(company.waiting):
+                self._remove(queue_id)
+        self._companies.pop(company_id, None)
+        self._company_meta.pop(company_id, None)
+        self._idle_companies.discard(company_id)
+        for student_id, (status, current_company_id) in list(self._students.items()):
+            if current_company_id == company_id:
+                self._apply_student(student_id, status, None)
+
+    @_update
+    def update_company(self, company_id, name, status):
+        """Apply a saved company (name/status shown in admin stats)"""
+        self._company_meta[company_id] = (name, status)
+        self._refresh_company(company_id)
+
+    def _apply_student(self, student_id, status, current_company_id):
+        queue_ids = self._student_entries.get(student_id, ())
+        entries = [(queue_id, self._entries[queue_id]) for queue_id in queue_ids]
+        for queue_id, _ in entries:
+            self._remove(queue_id)
+        old = self._set_student(student_id, status, current_company_id)
+        if old is None and not entries:
+            self._idle_students.add(student_id)
+        for queue_id, (company_id, _, position) in entries:
+            self._insert(queue_id, company_id, student_id, position)
+        self._refresh_company(old and old[1])
+        self._refresh_company(current_company_id)
+
+    def _insert(self, queue_id, company_id, student_id, position):
+        key = (position, queue_id)
+        company = self._companies.setdefault(company_id, CompanyQueueIndex())
+        insort(company.waiting, key)
+
+        status, current_company_id = self._students.get(student_id, ('available', None))
+        if current_company_id == company_id:
+            insort(company.interviewing, key)
+        elif status == 'available' and current_company_id is None:
+            insort(company.available, key)
+
+        self._entries[queue_id] = (company_id, student_id, position)
+        self._student_entries.setdefault(student_id, set()).add(queue_id)
+        self._idle_students.discard(student_id)
+        self._refresh_company(company_id)
+
+    def _remove(self, queue_id):
+        entry = self._entries.pop(queue_id, None)
+        if entry is None:
+            return
+        company_id, student_id, position = entry
+        key = (position, queue_id)
+        company = self._companies[company_id]
+        _discard(company.waiting, key)
+        _discard(company.available, key)
+        _discard(company.interviewing, key)
+        student_entries = self._student_entries.get(student_id, set())
+        student_entries.discard(queue_id)
+        if not student_entries and student_id in self._students:
+            self._idle_students.add(student_id)
+        self._refresh_company(company_id)
+
+    def _set_student(self, student_id, status, current_company_id):
+        """Replace a student's state (status None removes it), keeping counters"""
+        old = self._students.pop(student_id, None)
+        if old:
+            self._status_counts[old[0]] -= 1
+            if old[1]:
+                self._interviews_at[old[1]] -= 1
+        if status is not None:
+            self._students[student_id] = (status, current_company_id)
+            self._status_counts[status] += 1
+            if current_company_id:
+                self._interviews_at[current_company_id] += 1
+        return old
+
+    def _refresh_company(self, company_id):
+        """Recompute whether a company is idle (waiting students, nobody in interview)"""
+        if not company_id:
+            return
+        meta = self._company_meta.get(company_id)
+        company = self._companies.get(company_id)
+        if (meta and meta[1] == 'recruiting' and company and company.waiting
+                and not self._interviews_at[company_id]):
+            self._idle_companies.add(company_id)
+        else:
+            self._idle_companies.discard(company_id)
+
+    # ==========================================
+    # Lookups
+    # ==========================================
+
+    def first_available(self, company_id, count=1):
+        """R2-R3: queue ids of the first N available students, by position"""
+        with self._lock:
+            company = self._companies.get(company_id)
+            if not company:
+                return []
+            return [queue_id for _, queue_id in company.available[:count]]
+
+    def ahead_count(self, company_id, position):
+        """R15: open entries ahead of position, excluding students interviewing here"""
+        with self._lock:
+            company = self._companies.get(company_id)
+            if not company:
+                return 0
+            key = (position, 0)
+            return bisect_left(company.waiting, key) - bisect_left(company.interviewing, key)
+
+    def stats(self):
+        """
+        Admin dashboard aggregates, O(1) apart from the idle companies list
+        (reconciled in the background, see _tick)
+        """
+        self._ensure_built()
+        with self._lock:
+            return self._aggregate()
+
+    def _aggregate(self):
+        in_interview = self._status_counts['in_interview']
+        idle_companies = sorted(
+            (
+                {'id': company_id, 'name': self._company_meta[company_id][0],
+                 'status': self._company_meta[company_id][1]}
+                for company_id in self._idle_companies
+            ),
+            key=lambda c: c['name']
+        )
+        return {
+            'total_students': len(self._students),
+            'total_companies': len(self._company_meta),
+            'total_interviews': self._completed_count,
+            'current_interviews': in_interview,
+            'waiting_count': max(len(self._entries) - in_interview, 0),
+            'idle_companies': idle_companies,
+            'idle_students_count': len(self._idle_students),
+        }
+
+    def student_companies(self, student_id):
+        """Company ids where the student has an open inscription"""
+        with self._lock:
+            return {
+                self._entries[queue_id][0]
+                for queue_id in self._student_entries.get(student_id, ())
+            }
+
+
+queue_index = QueueIndex()
@@ -3,7 +3,7 @@ Queue model for JobFair Platform
 Represents student inscription in a company's waiting queue
 Implements order and completion tracking per business rules R1-R4
 """
-from django.db import models
+from django.db import models, transaction
 
 
 class Queue(models.Model):
@@ -52,13 +52,12 @@ class Queue(models.Model):
         return f"{self.student} @ {self.company} [{status}]"
     
     def save(self, *args, **kwargs):
-        """Auto-assign position on creation"""
+        """Auto-assign position on creation from the company counter (R1)"""
         if not self.pk and not self.position:
-            # Get max position for this company and add 1
-            max_pos = Queue.objects.filter(company=self.company).aggregate(
-                max_pos=models.Max('position')
-            )['max_pos'] or 0
-            self.position = max_pos + 1
+            with transaction.atomic():
+                self.position = self.company.allocate_queue_position()
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
     
     def mark_completed(self):
@@ -87,12 +86,8 @@ class Queue(models.Model):
         
         Returns: QuerySet of Queue entries for available students
         """
-        return cls.objects.filter(
-            company=company,
-            is_completed=False,
-            student__status='available',
-            student__current_company__isnull=True
-        ).select_related('student').order_by('position')[:count]
+        from queues.services import QueueService
+        return QueueService.get_first_available_students(company, count)
     
     @classmethod
     def get_students_ahead_count(cls, queue_entry):
@@ -104,10 +99,5 @@ class Queue(models.Model):
         - Already completed (is_completed=True)
         - Currently in interview at this company
         """
-        return cls.objects.filter(
-            company=queue_entry.company,
-            position__lt=queue_entry.position,
-            is_completed=False
-        ).exclude(
-            student__current_company=queue_entry.company
-        ).count()
+        from queues.services import QueueService
+        return QueueService.get_students_ahead_count(queue_entry)
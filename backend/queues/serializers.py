@@ -3,6 +3,7 @@ Serializers for Queue model
 """
 from rest_framework import serializers
 from .models import Queue
+from .services import QueueService
 from students.serializers import StudentListSerializer
 from companies.serializers import CompanyPublicSerializer
 
@@ -24,43 +25,16 @@ class QueueCreateSerializer(serializers.ModelSerializer):
             )
         return value
     
-    def validate(self, attrs):
-        """Check unique constraint: one inscription per student per company"""
-        student = self.context['request'].user.student
-        company = attrs['company']
-        
-        # Check for existing inscriptions
-        existing_q = Queue.objects.filter(company=company, student=student).first()
-        
-        if existing_q:
-            if existing_q.is_completed:
-                raise serializers.ValidationError({
-                    'company': "Vous avez déjà passé un entretien avec cette entreprise."
-                })
-            else:
-                raise serializers.ValidationError({
-                    'company': "Vous êtes déjà inscrit chez cette entreprise."
-                })
-        
-        # Check max queue size
-        if company.max_queue_size:
-            current_queue_size = Queue.objects.filter(
-                company=company,
-                is_completed=False
-            ).count()
-            
-            if current_queue_size >= company.max_queue_size:
-                raise serializers.ValidationError({
-                    'company': f"La file d'attente est complète ({company.max_queue_size} pers. max)."
-                })
-
-        return attrs
-    
     def create(self, validated_data):
+        """
+        Join the queue through QueueService (R1)
+        Duplicate and max_queue_size checks happen atomically there
+        """
         student = self.context['request'].user.student
-        validated_data['student'] = student
-        # Position is auto-calculated in model.save()
-        return super().create(validated_data)
+        try:
+            return QueueService.join_queue(student, validated_data['company'])
+        except ValueError as e:
+            raise serializers.ValidationError({'company': str(e)})
 
 
 class QueueStudentSerializer(serializers.ModelSerializer):
@@ -2,12 +2,25 @@
 Queue Service - Business Logic for Queue Management
 Implements rules R1-R4, R10-R15
 """
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat
 from django.utils import timezone
+from queues.index import queue_index
 from queues.models import Queue
 from students.models import Student
 
 
+def _count(queryset):
+    """Correlated COUNT(*) subquery over a queryset filtered on OuterRef"""
+    return Coalesce(
+        Subquery(
+            queryset.values('company').annotate(total=Count('id')).values('total')[:1]
+        ),
+        0
+    )
+
+
 class QueueService:
     """
     Service class for queue-related business logic
@@ -15,6 +28,75 @@ class QueueService:
     and managing queue state transitions
     """
     
+    @staticmethod
+    def join_queue(student, company):
+        """
+        Inscribe a student in a company's queue (R1)
+        
+        Race-free: the position is allocated from the company counter, which
+        locks the company row, so the max_queue_size check that follows sees
+        every concurrent inscription. Duplicates are caught by the
+        (company, student) unique constraint rather than a pre-read.
+        
+        Args:
+            student: Student instance
+            company: Company instance
+            
+        Returns:
+            Queue: The new queue entry
+        """
+        try:
+            with transaction.atomic():
+                position = company.allocate_queue_position()
+                
+                if company.max_queue_size:
+                    current_queue_size = Queue.objects.filter(
+                        company=company,
+                        is_completed=False
+                    ).count()
+                    if current_queue_size >= company.max_queue_size:
+                        raise ValueError(
+                            f"La file d'attente est complète ({company.max_queue_size} pers. max)."
+                        )
+                
+                return Queue.objects.create(
+                    company=company,
+                    student=student,
+                    position=position
+                )
+        except IntegrityError:
+            existing = Queue.objects.filter(company=company, student=student).first()
+            if existing and existing.is_completed:
+                raise ValueError("Vous avez déjà passé un entretien avec cette entreprise.")
+            raise ValueError("Vous êtes déjà inscrit chez cette entreprise.")
+    
+    @staticmethod
+    def get_first_available_ids(company, count=1):
+        """
+        Get ids of the first N available queue entries of a company
+
+        Served from the in-memory queue index when possible,
+        otherwise from the database.
+        
+        Returns:
+            list: Queue entry ids ordered by position
+        """
+        if queue_index.is_usable():
+            return queue_index.first_available(company.id, count)
+        return QueueService._first_available_ids_from_db(company, count)
+    
+    @staticmethod
+    def _first_available_ids_from_db(company, count=1):
+        """Same lookup from committed rows (the index only catches up in on_commit)"""
+        return list(
+            Queue.objects.filter(
+                company=company,
+                is_completed=False,
+                student__status='available',
+                student__current_company__isnull=True
+            ).order_by('position').values_list('id', flat=True)[:count]
+        )
+    
     @staticmethod
     def get_first_available_students(company, count=1):
         """
@@ -30,6 +112,10 @@ class QueueService:
         Returns:
             QuerySet of Queue entries for available students
         """
+        if queue_index.is_usable():
+            return Queue.objects.filter(
+                id__in=queue_index.first_available(company.id, count)
+            ).select_related('student').order_by('position')
         return Queue.objects.filter(
             company=company,
             is_completed=False,
@@ -55,14 +141,65 @@ class QueueService:
         Returns:
             int: Number of students ahead
         """
+        if queue_index.is_usable():
+            return queue_index.ahead_count(queue_entry.company_id, queue_entry.position)
         return Queue.objects.filter(
-            company=queue_entry.company,
+            company_id=queue_entry.company_id,
             position__lt=queue_entry.position,
             is_completed=False
         ).exclude(
-            student__current_company=queue_entry.company
+            student__current_company_id=queue_entry.company_id
         ).count()
     
+    @staticmethod
+    def _check_preconditions(queue_entry):
+        """
+        R10 checks on the entry, student and company state
+        
+        Returns:
+            str: error_message, or None if all pass
+        """
+        student = queue_entry.student
+        company = queue_entry.company
+        
+        if queue_entry.is_completed:
+            return "Vous êtes déjà passé chez cette entreprise."
+        
+        if student.status != 'available':
+            if student.status == 'in_interview':
+                return f"Vous êtes déjà en entretien chez {student.current_company.name}."
+            return "Vous devez être disponible pour commencer un entretien."
+        
+        if company.status != 'recruiting':
+            return "Cette entreprise est actuellement en pause."
+        
+        return None
+    
+    @staticmethod
+    def _check_turn(queue_entry, from_db=False):
+        """
+        R10: Check the entry is the first available in its company's queue
+        
+        Args:
+            from_db: read committed rows instead of the queue index (the
+                re-check under the company lock)
+        
+        Returns:
+            str: error_message, or None if it is the student's turn
+        """
+        if from_db:
+            first_available_ids = QueueService._first_available_ids_from_db(queue_entry.company, 1)
+        else:
+            first_available_ids = QueueService.get_first_available_ids(queue_entry.company, 1)
+        if first_available_ids and first_available_ids[0] == queue_entry.id:
+            return None
+        if first_available_ids:
+            first_available = Queue.objects.select_related('student').get(
+                id=first_available_ids[0]
+            )
+            return f"Ce n'est pas encore votre tour. {first_available.student.full_name} passe avant vous."
+        return "Ce n'est pas encore votre tour."
+    
     @staticmethod
     def can_start_interview(queue_entry):
         """
@@ -81,37 +218,33 @@ class QueueService:
         Returns:
             tuple: (bool: can_start, str: error_message or None)
         """
-        student = queue_entry.student
-        company = queue_entry.company
-        
-        if queue_entry.is_completed:
-            return False, "Vous êtes déjà passé chez cette entreprise."
+        error = QueueService._check_preconditions(queue_entry)
         
-        if student.status != 'available':
-            if student.status == 'in_interview':
-                return False, f"Vous êtes déjà en entretien chez {student.current_company.name}."
-            return False, "Vous devez être disponible pour commencer un entretien."
-        
-        if company.status != 'recruiting':
-            return False, "Cette entreprise est actuellement en pause."
+        if not error and not queue_entry.company.has_available_slots():
+            error = "Cette entreprise ne peut pas recevoir plus d'étudiants pour le moment."
         
-        if not company.has_available_slots():
-            return False, "Cette entreprise ne peut pas recevoir plus d'étudiants pour le moment."
+        if not error:
+            error = QueueService._check_turn(queue_entry)
         
-        # Check if first available in queue
-        first_available = QueueService.get_first_available_students(company, 1).first()
-        if not first_available or first_available.id != queue_entry.id:
-            if first_available:
-                return False, f"Ce n'est pas encore votre tour. {first_available.student.full_name} passe avant vous."
-            return False, "Ce n'est pas encore votre tour."
-        
-        return True, None
+        return error is None, error
     
     @staticmethod
-    @transaction.atomic
     def start_interview(queue_entry):
         """
-        Start an interview - atomic transaction
+        Start an interview
+        
+        Race-free under concurrent clicks (R10-R11):
+        1. Read-only checks (queue index) before any write: a click that
+           is not its turn fails without locking anything
+        2. Claim a slot with a conditional UPDATE on the company row,
+           which also serializes starts at this company; the row stays
+           locked until the outermost transaction ends (the callers' one,
+           which also records the notifications)
+        3. Re-check the student is first available, under that lock, from
+           the database: a competing start committed but whose on_commit
+           has not updated the queue index yet is already visible there
+        4. Move the student to in_interview with a conditional UPDATE
+        Any failure rolls the slot claim back.
         
         Changes:
         - Student status → 'in_interview'
@@ -123,17 +256,26 @@ class QueueService:
         Returns:
             bool: Success
         """
-        can_start, error = QueueService.can_start_interview(queue_entry)
-        if not can_start:
+        error = (
+            QueueService._check_preconditions(queue_entry)
+            or QueueService._check_turn(queue_entry)
+        )
+        if error:
             raise ValueError(error)
         
         student = queue_entry.student
         company = queue_entry.company
         
-        # Update student status
-        student.status = 'in_interview'
-        student.current_company = company
-        student.save()
+        with transaction.atomic():
+            if not company.claim_interview_slot():
+                raise ValueError("Cette entreprise ne peut pas recevoir plus d'étudiants pour le moment.")
+            
+            error = QueueService._check_turn(queue_entry, from_db=True)
+            if error:
+                raise ValueError(error)
+            
+            if not student.claim_interview(company):
+                raise ValueError("Vous devez être disponible pour commencer un entretien.")
         
         return True
     
@@ -144,6 +286,10 @@ class QueueService:
         Complete an interview (mark student as 'passé')
         R6, R7, R12: Atomic transaction
         
+        The slot is released first, which locks the company row (same lock
+        order as start_interview), then the entry and student are re-read
+        so a double click cannot complete twice.
+        
         Changes:
         - Queue is_completed → True
         - Queue completed_at → now
@@ -157,12 +303,16 @@ class QueueService:
         Returns:
             dict: Info about next available students for notifications
         """
-        if queue_entry.is_completed:
-            raise ValueError("Cet étudiant a déjà été marqué comme passé.")
-        
         student = queue_entry.student
         company = queue_entry.company
         
+        company.release_interview_slot()
+        queue_entry.refresh_from_db(fields=['is_completed', 'completed_at'])
+        student.refresh_from_db(fields=['status', 'current_company'])
+        
+        if queue_entry.is_completed:
+            raise ValueError("Cet étudiant a déjà été marqué comme passé.")
+        
         # Verify student is in interview at this company
         if student.current_company_id != company.id:
             raise ValueError("Cet étudiant n'est pas en entretien chez vous.")
@@ -190,43 +340,141 @@ class QueueService:
         }
     
     @staticmethod
-    def get_queue_status(company):
+    def get_queue_status(company, completed_limit=None):
         """
         Get complete queue status for a company
         
-        Returns three sections:
+        Open entries and the latest completed ones are read in a single
+        query, then split in Python (no per-section query or COUNT):
         - in_interview: Students currently interviewing
         - waiting: Students waiting (ordered by position)
-        - completed: Students already passed
+        - completed: Students already passed (latest first)
+        
+        Args:
+            company: Company instance
+            completed_limit: Max completed entries to return (None = all)
+            
+        Returns:
+            dict: sections plus total_waiting, available_count and
+            current_interview_count computed from the same rows
         """
-        all_entries = Queue.objects.filter(
-            company=company
-        ).select_related('student', 'student__current_company')
+        completed_filter = Q(company=company, is_completed=True)
+        if completed_limit is not None:
+            # Limited in SQL: LIMIT subquery on the latest completions
+            latest = Queue.objects.filter(completed_filter).order_by(
+                F('completed_at').desc(nulls_last=True), '-id'
+            )[:completed_limit]
+            completed_filter = Q(id__in=latest.values('id'))
         
-        in_interview = all_entries.filter(
-            is_completed=False,
-            student__current_company=company
-        ).order_by('position')
+        entries = Queue.objects.filter(
+            Q(company=company, is_completed=False) | completed_filter
+        ).select_related('student', 'student__current_company').order_by('position')
+        
+        in_interview, waiting, completed = [], [], []
+        available_count = 0
+        for entry in entries:
+            student = entry.student
+            if entry.is_completed:
+                completed.append(entry)
+            elif student.current_company_id == company.id:
+                in_interview.append(entry)
+            else:
+                waiting.append(entry)
+                if student.status == 'available' and student.current_company_id is None:
+                    available_count += 1
+        
+        # Latest first; entries completed without a timestamp go last
+        completed.sort(key=lambda e: (e.completed_at is not None, e.completed_at, e.id), reverse=True)
+        
+        return {
+            'in_interview': in_interview,
+            'waiting': waiting,
+            'completed': completed,
+            'total_waiting': len(waiting),
+            'available_count': available_count,
+            'current_interview_count': len(in_interview)
+        }
+    
+    @staticmethod
+    def annotate_opportunities(entries):
+        """
+        Annotate queue entries with everything R10/R15 checks need
+        
+        One correlated subquery per value, evaluated in a single query:
+        - ahead_count: open entries ahead, excluding students interviewing here
+        - first_available_id / first_available_name: first available entry
         
-        waiting = all_entries.filter(
+        Args:
+            entries: QuerySet of Queue entries
+            
+        Returns:
+            QuerySet with company, student and student's current company joined
+        """
+        company_entries = Queue.objects.filter(
+            company=OuterRef('company'),
             is_completed=False
-        ).exclude(
-            student__current_company=company
+        ).order_by()
+        first_available = company_entries.filter(
+            student__status='available',
+            student__current_company__isnull=True
         ).order_by('position')
         
-        completed = all_entries.filter(
-            is_completed=True
-        ).order_by('-completed_at')
+        return entries.select_related(
+            'company', 'student', 'student__current_company'
+        ).annotate(
+            ahead_count=_count(
+                company_entries.filter(
+                    position__lt=OuterRef('position')
+                ).exclude(
+                    student__current_company=OuterRef('company')
+                )
+            ),
+            first_available_id=Subquery(first_available.values('id')[:1]),
+            first_available_name=Subquery(
+                first_available.annotate(
+                    full_name=Concat(
+                        'student__first_name', Value(' '), 'student__last_name',
+                        output_field=CharField()
+                    )
+                ).values('full_name')[:1]
+            )
+        )
+    
+    @staticmethod
+    def build_opportunity(entry):
+        """
+        Evaluate R10 for an entry from annotate_opportunities()
+        
+        Mirrors can_start_interview() without running any query
+        
+        Returns:
+            dict: queue_entry, can_start, reason, position, ahead_count
+        """
+        student = entry.student
+        company = entry.company
+        reason = None
+        
+        if company.status != 'recruiting':
+            reason = 'company_paused'
+        elif student.status != 'available':
+            if student.status == 'in_interview':
+                reason = f"Vous êtes déjà en entretien chez {student.current_company.name}."
+            else:
+                reason = "Vous devez être disponible pour commencer un entretien."
+        elif not company.has_available_slots():
+            reason = "Cette entreprise ne peut pas recevoir plus d'étudiants pour le moment."
+        elif entry.first_available_id != entry.id:
+            if entry.first_available_id:
+                reason = f"Ce n'est pas encore votre tour. {entry.first_available_name} passe avant vous."
+            else:
+                reason = "Ce n'est pas encore votre tour."
         
         return {
-            'in_interview': list(in_interview),
-            'waiting': list(waiting),
-            'completed': list(completed),
-            'total_waiting': waiting.count(),
-            'available_count': waiting.filter(
-                student__status='available',
-                student__current_company__isnull=True
-            ).count()
+            'queue_entry': entry,
+            'can_start': reason is None,
+            'reason': reason,
+            'position': entry.position,
+            'ahead_count': entry.ahead_count
         }
     
     @staticmethod
@@ -238,38 +486,69 @@ class QueueService:
         - Not completed
         - Student is first available (can start now)
         - Or is next after current person
+        
+        Computed in a single query whatever the number of inscriptions
         """
-        entries = Queue.objects.filter(
-            student=student,
-            is_completed=False
-        ).select_related('company')
+        entries = QueueService.annotate_opportunities(
+            Queue.objects.filter(student=student, is_completed=False)
+        )
+        opportunities = [QueueService.build_opportunity(entry) for entry in entries]
         
-        opportunities = []
-        for entry in entries:
-            company = entry.company
-            
-            if company.status != 'recruiting':
-                opportunities.append({
-                    'queue_entry': entry,
-                    'can_start': False,
-                    'reason': 'company_paused',
-                    'position': entry.position,
-                    'ahead_count': QueueService.get_students_ahead_count(entry)
-                })
-                continue
-            
-            can_start, error = QueueService.can_start_interview(entry)
-            
-            opportunities.append({
-                'queue_entry': entry,
-                'can_start': can_start,
-                'reason': error if not can_start else None,
-                'position': entry.position,
-                'ahead_count': QueueService.get_students_ahead_count(entry)
+        return sorted(opportunities, key=lambda x: (-x['can_start'], x['position']))
+    
+    @staticmethod
+    def serialize_opportunities(student_status, opportunities):
+        """
+        Opportunities payload (StudentOpportunitiesView response, pushed
+        snapshots)
+        
+        Args:
+            student_status: Student.status
+            opportunities: sorted list from get_student_opportunities()
+        """
+        result = []
+        for opp in opportunities:
+            entry = opp['queue_entry']
+            result.append({
+                'queue_id': entry.id,
+                'company_id': entry.company_id,
+                'company_name': entry.company.name,
+                'company_status': entry.company.status,
+                'position': opp['position'],
+                'can_start': opp['can_start'],
+                'ahead_count': opp['ahead_count'],
+                'reason': opp['reason']
             })
         
+        return {
+            'student_status': student_status,
+            'opportunities': result,
+            'can_start_any': any(o['can_start'] for o in opportunities)
+        }
+    
+    @staticmethod
+    def get_opportunities_payloads(student_ids):
+        """
+        Opportunities payloads of many students in two queries
+        
+        Returns:
+            dict: {student_id: serialize_opportunities() payload} for existing students
+        """
+        statuses = dict(Student.objects.filter(id__in=student_ids).values_list('id', 'status'))
+        entries = QueueService.annotate_opportunities(
+            Queue.objects.filter(student_id__in=statuses, is_completed=False)
+        )
+        by_student = {student_id: [] for student_id in statuses}
+        for entry in entries:
+            by_student[entry.student_id].append(QueueService.build_opportunity(entry))
         
-        return sorted(opportunities, key=lambda x: (-x['can_start'], x['position']))
+        return {
+            student_id: QueueService.serialize_opportunities(
+                statuses[student_id],
+                sorted(opportunities, key=lambda x: (-x['can_start'], x['position']))
+            )
+            for student_id, opportunities in by_student.items()
+        }
 
     @staticmethod
     @transaction.atomic
@@ -283,6 +562,8 @@ class QueueService:
         
         # If currently interviewing at this company
         if student.current_company_id == company.id:
+            # Lock order: company row (slot release), then student row
+            company.release_interview_slot()
             # Force end interview
             student.status = 'available' # Or paused? Let's default to available so they are free
             student.current_company = None
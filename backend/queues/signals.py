@@ -0,0 +1,115 @@
+"""
+Signal handlers keeping the in-memory queue index, ETag versions, pushed
+opportunity snapshots, company dashboard deltas and live company metrics
+current
+Every queue/student transition (inscription, start, completion, cancel,
+status change) is a model save, so all follow the same events
+NotificationService announces, applied once the transaction commits.
+Signals only fire in the process that wrote: the queue index of the
+other processes learns about the change from a shared counter and
+rebuilds (see queues.index).
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from companies.models import Company
+from companies import dashboard, metrics
+from core import versions
+from notifications import buffer, snapshots
+from students.models import Student
+from .index import queue_index
+from .models import Queue
+
+
+def _on_commit(func, *args):
+    """Defer an index update until commit (immediately in autocommit)"""
+    callback = partial(func, *args)
+    callback.queue_index_update = True
+    transaction.on_commit(callback)
+
+
+def _bump_on_commit(func, *args):
+    """Bump read versions after commit so a 304 never hides committed data"""
+    transaction.on_commit(partial(func, *args))
+
+
+def _push_on_commit(company_ids=(), student_ids=(), entries=()):
+    """
+    Recompute pushed opportunities, dashboard deltas and company metrics
+    once the change is visible (once per request for all its changes)
+
+    Targets say how far a change reaches:
+    - ('company', id): every row of the company (settings, interview slots)
+    - ('queue', company_id, position): rows from that position on (an
+      entry joined, left or completed: R10 first available, R15 ahead count)
+    - ('student', id): the student's own data
+    """
+    targets = (
+        [('company', pk) for pk in company_ids]
+        + [('queue', company_id, position) for company_id, position in entries]
+        + [('student', pk) for pk in student_ids]
+    )
+    transaction.on_commit(partial(buffer.defer, snapshots.push, *targets))
+    transaction.on_commit(partial(buffer.defer, dashboard.push, *targets))
+    transaction.on_commit(partial(buffer.defer, metrics.push, *targets))
+
+
+@receiver(post_save, sender=Queue)
+def queue_saved(sender, instance, **kwargs):
+    _on_commit(
+        queue_index.upsert_entry,
+        instance.id, instance.company_id, instance.student_id,
+        instance.position, instance.is_completed, kwargs.get('created', False)
+    )
+    _bump_on_commit(versions.bump_queue_entry, instance.company_id, instance.student_id)
+    _push_on_commit(student_ids=[instance.student_id], entries=[(instance.company_id, instance.position)])
+
+
+@receiver(post_delete, sender=Queue)
+def queue_deleted(sender, instance, **kwargs):
+    _on_commit(queue_index.remove_entry, instance.id, instance.is_completed)
+    _bump_on_commit(versions.bump_queue_entry, instance.company_id, instance.student_id)
+    _push_on_commit(student_ids=[instance.student_id], entries=[(instance.company_id, instance.position)])
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, **kwargs):
+    _on_commit(
+        queue_index.update_student,
+        instance.id, instance.status, instance.current_company_id
+    )
+    _bump_on_commit(versions.bump_student, instance.id)
+    # Interview started or ended: the slots of both companies moved
+    interview_companies = set()
+    if instance.loaded_company_id != instance.current_company_id:
+        interview_companies = {instance.loaded_company_id, instance.current_company_id} - {None}
+    instance.loaded_company_id = instance.current_company_id
+    _push_on_commit(company_ids=interview_companies, student_ids=[instance.id])
+
+
+@receiver(post_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    if instance.current_company_id:
+        # Deleted mid-interview: free the slot (checks read the counter)
+        company = Company.objects.filter(pk=instance.current_company_id).first()
+        if company:
+            company.release_interview_slot()
+    _on_commit(queue_index.remove_student, instance.id)
+    _bump_on_commit(versions.bump_student, instance.id)
+
+
+@receiver(post_save, sender=Company)
+def company_saved(sender, instance, **kwargs):
+    _on_commit(queue_index.update_company, instance.id, instance.name, instance.status)
+    # Name/status/settings show up in every student view: rare, bump all
+    _bump_on_commit(versions.bump_epoch)
+    _push_on_commit(company_ids=[instance.id])
+
+
+@receiver(post_delete, sender=Company)
+def company_deleted(sender, instance, **kwargs):
+    _on_commit(queue_index.remove_company, instance.id)
+    _bump_on_commit(versions.bump_epoch)
@@ -2,10 +2,17 @@
 Unit tests for QueueService business logic
 Testing rules R1-R15
 """
-from django.test import TestCase
+import threading
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
 from students.models import Student
 from companies.models import Company
+from queues import index
+from queues.index import RECONCILE_INTERVAL, QueueIndex, queue_index
 from queues.models import Queue
 from queues.services import QueueService
 
@@ -177,6 +184,41 @@ class QueueServiceTest(TestCase):
         q1.is_completed = True
         q1.save()
         self.assertEqual(QueueService.get_students_ahead_count(q2), 0)
+    
+    def test_queue_status_single_query(self):
+        """Dashboard snapshot: one query, sections split in Python"""
+        q1 = Queue.objects.create(company=self.company, student=self.student1)
+        q2 = Queue.objects.create(company=self.company, student=self.student2)
+        q3 = Queue.objects.create(company=self.company, student=self.student3)
+        QueueService.start_interview(q1)
+        self.student3.status = 'paused'
+        self.student3.save()
+        
+        with self.assertNumQueries(1):
+            status = QueueService.get_queue_status(self.company)
+        
+        self.assertEqual(status['in_interview'], [q1])
+        self.assertEqual(status['waiting'], [q2, q3])
+        self.assertEqual(status['total_waiting'], 2)
+        self.assertEqual(status['available_count'], 1)
+        self.assertEqual(status['current_interview_count'], 1)
+    
+    def test_queue_status_limits_completed(self):
+        """Only the latest completed entries are fetched, latest first"""
+        entries = [
+            Queue.objects.create(company=self.company, student=s)
+            for s in (self.student1, self.student2, self.student3)
+        ]
+        for entry in entries:
+            QueueService.start_interview(Queue.objects.get(id=entry.id))
+            QueueService.complete_interview(Queue.objects.get(id=entry.id))
+            entry.student.set_available()
+        
+        status = QueueService.get_queue_status(self.company, completed_limit=2)
+        self.assertEqual(status['completed'], [entries[2], entries[1]])
+        
+        status = QueueService.get_queue_status(self.company)
+        self.assertEqual(len(status['completed']), 3)
 
 
 class CompanyStatusTest(TestCase):
@@ -204,3 +246,551 @@ class CompanyStatusTest(TestCase):
         self.company.pause()
         self.company.resume()
         self.assertEqual(self.company.status, 'recruiting')
+
+
+class QueueIndexConsistencyTest(TransactionTestCase):
+    """In-memory queue index must agree with the DB path (R2, R3, R15)"""
+    
+    def setUp(self):
+        queue_index.invalidate()
+        self.companies = [
+            Company.objects.create(name=f'Company {i}', max_concurrent_interviews=2)
+            for i in range(2)
+        ]
+        self.students = []
+        for i in range(6):
+            user = User.objects.create(email=f'index{i}@test.com', role='student')
+            self.students.append(
+                Student.objects.create(user=user, first_name=f'S{i}', last_name='Test')
+            )
+        for company in self.companies:
+            for student in self.students:
+                Queue.objects.create(company=company, student=student)
+    
+    def tearDown(self):
+        queue_index.invalidate()
+    
+    def assertIndexMatchesDatabase(self):
+        for company in self.companies:
+            expected_first = list(
+                Queue.objects.filter(
+                    company=company,
+                    is_completed=False,
+                    student__status='available',
+                    student__current_company__isnull=True
+                ).order_by('position').values_list('id', flat=True)
+            )
+            self.assertEqual(queue_index.first_available(company.id, 10), expected_first)
+            
+            for entry in Queue.objects.filter(company=company):
+                expected_ahead = Queue.objects.filter(
+                    company=company,
+                    position__lt=entry.position,
+                    is_completed=False
+                ).exclude(student__current_company=company).count()
+                self.assertEqual(
+                    queue_index.ahead_count(company.id, entry.position),
+                    expected_ahead
+                )
+    
+    def test_index_follows_transitions(self):
+        """Index stays consistent through start, complete, status change and cancel"""
+        self.assertTrue(queue_index.is_usable())
+        self.assertIndexMatchesDatabase()
+        
+        company_a, company_b = self.companies
+        first = Queue.objects.get(company=company_a, student=self.students[0])
+        QueueService.start_interview(first)
+        self.assertIndexMatchesDatabase()
+        
+        # Second available at company B is student 1 (student 0 is greyed)
+        self.assertEqual(
+            QueueService.get_first_available_students(company_b, 1).first().student,
+            self.students[1]
+        )
+        
+        QueueService.complete_interview(first)
+        self.assertIndexMatchesDatabase()
+        
+        self.students[0].refresh_from_db()
+        self.students[0].set_available()
+        self.assertIndexMatchesDatabase()
+        
+        self.students[2].status = 'paused'
+        self.students[2].save()
+        self.assertIndexMatchesDatabase()
+        
+        QueueService.cancel_inscription(
+            Queue.objects.get(company=company_b, student=self.students[3])
+        )
+        self.assertIndexMatchesDatabase()
+        
+        self.students[4].delete()
+        self.assertIndexMatchesDatabase()
+    
+    def test_index_rebuild_matches_incremental_state(self):
+        """A rebuilt index equals the incrementally maintained one"""
+        self.assertTrue(queue_index.is_usable())
+        entry = Queue.objects.get(company=self.companies[1], student=self.students[0])
+        QueueService.start_interview(entry)
+        
+        incremental = [
+            (queue_index.first_available(c.id, 10), queue_index.ahead_count(c.id, 6))
+            for c in self.companies
+        ]
+        queue_index.rebuild()
+        rebuilt = [
+            (queue_index.first_available(c.id, 10), queue_index.ahead_count(c.id, 6))
+            for c in self.companies
+        ]
+        self.assertEqual(incremental, rebuilt)
+    
+    def test_admin_stats_follow_transitions(self):
+        """Incremental admin aggregates never drift from a DB rebuild"""
+        stats = queue_index.stats()
+        self.assertEqual(stats['waiting_count'], 12)
+        self.assertEqual(len(stats['idle_companies']), 2)
+        
+        company_a, company_b = self.companies
+        first = Queue.objects.get(company=company_a, student=self.students[0])
+        QueueService.start_interview(first)
+        stats = queue_index.stats()
+        self.assertEqual(stats['current_interviews'], 1)
+        self.assertEqual(stats['idle_companies'], [
+            {'id': company_b.id, 'name': company_b.name, 'status': 'recruiting'}
+        ])
+        self.assertEqual(queue_index.reconcile(), {})
+        
+        QueueService.complete_interview(first)
+        company_b.pause()
+        QueueService.cancel_inscription(
+            Queue.objects.get(company=company_b, student=self.students[3])
+        )
+        user = User.objects.create(email='idle@test.com', role='student')
+        Student.objects.create(user=user, first_name='Idle', last_name='Test')
+        stats = queue_index.stats()
+        self.assertEqual(stats['total_interviews'], 1)
+        self.assertEqual(stats['total_students'], 7)
+        self.assertEqual(stats['idle_students_count'], 1)
+        self.assertEqual(stats['idle_companies'], [
+            {'id': company_a.id, 'name': company_a.name, 'status': 'recruiting'}
+        ])
+        self.assertEqual(queue_index.reconcile(), {})
+        
+        self.students[5].delete()
+        company_a.delete()
+        self.assertEqual(queue_index.reconcile(), {})
+    
+    def test_rebuild_replays_updates_committed_while_loading(self):
+        """The copy is loaded outside the lock; changes committed meanwhile are not lost"""
+        self.assertTrue(queue_index.is_usable())
+        company_a = self.companies[0]
+        first = Queue.objects.get(company=company_a, student=self.students[0])
+        load = QueueIndex._load
+        
+        def load_then_start(index):
+            load(index)
+            # Committed after the copy read the DB, applied to the live index
+            QueueService.start_interview(first)
+        
+        with mock.patch.object(QueueIndex, '_load', load_then_start):
+            self.assertEqual(queue_index.rebuild(), {})
+        self.assertIndexMatchesDatabase()
+        self.assertEqual(queue_index.stats()['current_interviews'], 1)
+    
+    def test_writes_of_other_processes_are_seen(self):
+        """Another process's writes never reach our signals, only the shared counter"""
+        self.assertTrue(queue_index.is_usable())
+        # Our own writes keep the index current
+        self.students[2].status = 'paused'
+        self.students[2].save()
+        self.assertTrue(queue_index.is_current())
+        
+        company_a = self.companies[0]
+        entry = Queue.objects.get(company=company_a, student=self.students[0])
+        Student.objects.filter(pk=self.students[0].pk).update(current_company=company_a, status='in_interview')
+        index._count_shared_write()
+        self.assertFalse(queue_index.is_current())
+        
+        # Unbound: the lookup rebuilds first
+        self.assertNotIn(entry.id, QueueService.get_first_available_ids(company_a, 10))
+        self.assertTrue(queue_index.is_current())
+        self.assertIndexMatchesDatabase()
+    
+    def test_bound_index_reads_the_db_until_refreshed(self):
+        company_a = self.companies[0]
+        self.assertTrue(queue_index.is_usable())
+        entry = Queue.objects.get(company=company_a, student=self.students[0])
+        Student.objects.filter(pk=self.students[0].pk).update(status='paused')
+        index._count_shared_write()
+        with mock.patch.object(QueueIndex, '_schedule_refresh', return_value=True) as refresh:
+            self.assertFalse(queue_index.is_usable())
+            self.assertNotIn(entry.id, QueueService.get_first_available_ids(company_a, 10))
+        refresh.assert_called()
+    
+    def test_stats_never_rebuild_on_request(self):
+        """Reconciliation runs in the background: an old index is served as is"""
+        queue_index.stats()
+        queue_index._built_at -= 10 * RECONCILE_INTERVAL
+        with self.assertNumQueries(0):
+            queue_index.stats()
+    
+    def test_idle_students_endpoint_is_paginated(self):
+        for i in range(3):
+            user = User.objects.create(email=f'idle{i}@test.com', role='student')
+            Student.objects.create(user=user, first_name=f'Idle{i}', last_name='Test')
+        admin = User.objects.create(email='admin@test.com', role='admin')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        
+        response = client.get('/api/admin/dashboard/idle-students/?page_size=2')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(
+            client.get('/api/admin/dashboard/').data['idle_students_count'], 3
+        )
+
+
+class StudentOpportunitiesTest(TestCase):
+    """Batched opportunities must match per-entry R10/R15 checks"""
+    
+    def setUp(self):
+        self.students = []
+        for i in range(4):
+            user = User.objects.create(email=f'opp{i}@test.com', role='student')
+            self.students.append(
+                Student.objects.create(user=user, first_name=f'S{i}', last_name='Test')
+            )
+        self.student = self.students[-1]
+    
+    def _join_companies(self, count):
+        offset = Company.objects.count()
+        for i in range(count):
+            company = Company.objects.create(name=f'Opp Company {offset + i}')
+            # Mix of states: students ahead, paused company, busy slot
+            for other in self.students[:i % 3]:
+                Queue.objects.create(company=company, student=other)
+            if i % 4 == 1:
+                company.pause()
+            Queue.objects.create(company=company, student=self.student)
+    
+    def test_matches_per_entry_checks(self):
+        """Batched result equals can_start_interview/get_students_ahead_count"""
+        self._join_companies(6)
+        self.students[0].status = 'paused'
+        self.students[0].save()
+        
+        for opp in QueueService.get_student_opportunities(self.student):
+            entry = Queue.objects.get(id=opp['queue_entry'].id)
+            if entry.company.status != 'recruiting':
+                expected = (False, 'company_paused')
+            else:
+                can_start, error = QueueService.can_start_interview(entry)
+                expected = (can_start, error)
+            self.assertEqual((opp['can_start'], opp['reason']), expected)
+            self.assertEqual(opp['ahead_count'], QueueService.get_students_ahead_count(entry))
+    
+    def test_reason_when_in_interview(self):
+        """Student in interview elsewhere gets the company name as reason"""
+        self._join_companies(2)
+        busy_at = Company.objects.create(name='Busy Corp')
+        self.student.start_interview(busy_at)
+        
+        opportunities = QueueService.get_student_opportunities(self.student)
+        reasons = {opp['reason'] for opp in opportunities}
+        self.assertIn("Vous êtes déjà en entretien chez Busy Corp.", reasons)
+    
+    def test_fixed_query_count(self):
+        """One query whatever the number of inscriptions"""
+        self._join_companies(1)
+        with self.assertNumQueries(1):
+            QueueService.get_student_opportunities(self.student)
+        
+        self._join_companies(15)
+        with self.assertNumQueries(1):
+            QueueService.get_student_opportunities(self.student)
+
+
+class ConcurrentInscriptionTest(TransactionTestCase):
+    """R1 under the opening-minute rush: concurrent joins stay consistent"""
+    
+    JOINS = 200
+    
+    def setUp(self):
+        self.company = Company.objects.create(name='Rush Corp', max_queue_size=150)
+        self.students = []
+        for i in range(self.JOINS):
+            user = User.objects.create(email=f'rush{i}@test.com', role='student')
+            self.students.append(
+                Student.objects.create(user=user, first_name=f'S{i}', last_name='Rush')
+            )
+        queue_index.invalidate()
+    
+    def tearDown(self):
+        queue_index.invalidate()
+    
+    def _join_concurrently(self, students):
+        barrier = threading.Barrier(len(students))
+        results = []
+        
+        def join(student):
+            try:
+                barrier.wait()
+                QueueService.join_queue(student, self.company)
+                results.append('joined')
+            except ValueError as e:
+                results.append(str(e))
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=join, args=(s,)) for s in students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_no_duplicate_positions_no_overshoot(self):
+        """200 concurrent joins: unique positions, max_queue_size respected"""
+        results = self._join_concurrently(self.students)
+        
+        positions = list(
+            Queue.objects.filter(company=self.company).values_list('position', flat=True)
+        )
+        self.assertEqual(len(positions), len(set(positions)))
+        self.assertEqual(len(positions), self.company.max_queue_size)
+        self.assertEqual(results.count('joined'), self.company.max_queue_size)
+        self.assertEqual(
+            results.count("La file d'attente est complète (150 pers. max)."),
+            self.JOINS - self.company.max_queue_size
+        )
+    
+    def test_company_save_keeps_position_counter(self):
+        """Saving a stale company instance must not rewind the counter"""
+        stale = Company.objects.get(pk=self.company.pk)
+        QueueService.join_queue(self.students[0], self.company)
+        stale.pause()
+        
+        entry = QueueService.join_queue(self.students[1], self.company)
+        self.assertEqual(entry.position, 2)
+    
+    def test_duplicate_join_rejected_by_constraint(self):
+        """Concurrent double-click by the same student creates one entry"""
+        student = self.students[0]
+        results = self._join_concurrently([student] * 10)
+        
+        self.assertEqual(Queue.objects.filter(company=self.company, student=student).count(), 1)
+        self.assertEqual(results.count('joined'), 1)
+        self.assertEqual(results.count("Vous êtes déjà inscrit chez cette entreprise."), 9)
+
+
+class ConcurrentSlotClaimTest(TransactionTestCase):
+    """R10-R11: concurrent start clicks can never over-book a company"""
+    
+    def setUp(self):
+        queue_index.invalidate()
+        self.company = Company.objects.create(name='Slot Corp', max_concurrent_interviews=2)
+        self.entries = []
+        for i in range(20):
+            user = User.objects.create(email=f'slot{i}@test.com', role='student')
+            student = Student.objects.create(user=user, first_name=f'S{i}', last_name='Slot')
+            self.entries.append(Queue.objects.create(company=self.company, student=student))
+    
+    def tearDown(self):
+        queue_index.invalidate()
+    
+    def _run_concurrently(self, func, args_list):
+        barrier = threading.Barrier(len(args_list))
+        results = []
+        
+        def run(*args):
+            try:
+                barrier.wait()
+                func(*args)
+                results.append(True)
+            except ValueError:
+                results.append(False)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=run, args=args) for args in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def _fresh_entry(self, entry):
+        return Queue.objects.select_related('student', 'company').get(pk=entry.pk)
+    
+    def test_concurrent_starts_respect_slots(self):
+        """Everyone clicks at once, round after round: exactly max_concurrent_interviews succeed"""
+        successes = []
+        while True:
+            waiting = [entry for entry in self.entries if not Student.objects.filter(
+                pk=entry.student_id, current_company__isnull=False).exists()]
+            results = self._run_concurrently(
+                QueueService.start_interview,
+                [(self._fresh_entry(entry),) for entry in waiting]
+            )
+            # R10: only the first available student can start in a round
+            self.assertLessEqual(results.count(True), 1)
+            if not any(results):
+                break
+            successes.append(results.count(True))
+        
+        self.company.refresh_from_db()
+        in_interview = Student.objects.filter(current_company=self.company).count()
+        self.assertEqual(sum(successes), self.company.max_concurrent_interviews)
+        self.assertEqual(in_interview, self.company.max_concurrent_interviews)
+        self.assertEqual(self.company.occupied_slots, in_interview)
+    
+    def test_turn_recheck_ignores_stale_index(self):
+        """The re-check under the lock reads the database, not the index"""
+        entry = self._fresh_entry(self.entries[1])
+        # Index not caught up yet: entry 1 looks first available
+        with mock.patch.object(QueueService, 'get_first_available_ids', return_value=[entry.id]):
+            with self.assertRaisesMessage(ValueError, "pas encore votre tour"):
+                QueueService.start_interview(entry)
+        
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.occupied_slots, 0)
+        self.assertIsNone(Student.objects.get(pk=entry.student_id).current_company)
+    
+    def test_same_student_cannot_start_twice(self):
+        """A student first in two queues can only start one interview"""
+        other = Company.objects.create(name='Other Corp')
+        student = self.entries[0].student
+        other_entry = Queue.objects.create(company=other, student=student)
+        
+        results = self._run_concurrently(
+            QueueService.start_interview,
+            [(self._fresh_entry(self.entries[0]),), (self._fresh_entry(other_entry),)] * 3
+        )
+        
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(
+            Company.objects.filter(occupied_slots=1).count(), 1
+        )
+    
+    def test_double_complete_releases_once(self):
+        """Double "Marquer passé" click frees the slot exactly once"""
+        QueueService.start_interview(self._fresh_entry(self.entries[0]))
+        QueueService.start_interview(self._fresh_entry(self.entries[1]))
+        
+        results = self._run_concurrently(
+            QueueService.complete_interview,
+            [(self._fresh_entry(self.entries[0]),) for _ in range(4)]
+        )
+        
+        self.company.refresh_from_db()
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(self.company.occupied_slots, 1)
+        self.assertEqual(self.company.get_current_interview_count(), 1)
+    
+    def test_admin_edits_realign_counter(self):
+        """Django admin edits of current_company bypass claim/release: both directions heal"""
+        from django.contrib import admin
+        from students.admin import StudentAdmin
+        
+        model_admin = StudentAdmin(Student, admin.site)
+        student = self.entries[0].student
+        student.status, student.current_company = 'in_interview', self.company
+        model_admin.save_model(None, student, mock.Mock(initial={'current_company': None}), change=True)
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.occupied_slots, 1)
+        
+        student.status, student.current_company = 'available', None
+        model_admin.save_model(None, student, mock.Mock(initial={'current_company': self.company.pk}), change=True)
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.occupied_slots, 0)
+    
+    def test_slot_check_and_claim_share_the_counter(self):
+        """can_start and the claim agree, also after a student is deleted mid-interview"""
+        first, second, third = (self._fresh_entry(entry) for entry in self.entries[:3])
+        QueueService.start_interview(first)
+        QueueService.start_interview(second)
+        self.assertFalse(self._fresh_entry(self.entries[2]).company.has_available_slots())
+        
+        first.student.delete()
+        third = self._fresh_entry(self.entries[2])
+        self.assertTrue(third.company.has_available_slots())
+        self.assertEqual(QueueService.can_start_interview(third), (True, None))
+        QueueService.start_interview(third)
+        self.assertFalse(third.company.has_available_slots())
+    
+    def test_drifted_counter_self_heals(self):
+        """A counter left above the real count does not block the company"""
+        Company.objects.filter(pk=self.company.pk).update(occupied_slots=2)
+        
+        QueueService.start_interview(self._fresh_entry(self.entries[0]))
+        
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.occupied_slots, 1)
+
+
+class ConditionalGetTest(TestCase):
+    """Hot student/company reads answer If-None-Match with 304"""
+    
+    def setUp(self):
+        queue_index.invalidate()
+        self.company = Company.objects.create(name='ETag Corp')
+        self.other_company = Company.objects.create(name='Other Corp')
+        users = [User.objects.create(email=f'etag{i}@test.com', role='student') for i in range(3)]
+        self.student, self.neighbour, self.stranger = [
+            Student.objects.create(user=u, first_name=f'E{i}', last_name='Tag')
+            for i, u in enumerate(users)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            Queue.objects.create(company=self.company, student=self.neighbour)
+            Queue.objects.create(company=self.company, student=self.student)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.student.user)
+    
+    def tearDown(self):
+        queue_index.invalidate()
+    
+    def _get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+    
+    def test_unchanged_data_returns_304(self):
+        for url in ['/api/queues/', '/api/queues/opportunities/', '/api/students/me/', '/api/companies/']:
+            first = self._get(url)
+            self.assertEqual(first.status_code, 200, url)
+            self.assertIn('no-cache', first['Cache-Control'])
+            second = self._get(url, first['ETag'])
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second['ETag'], first['ETag'])
+    
+    def test_change_in_followed_company_invalidates(self):
+        """A student ahead pausing changes ahead counts/first-available (R2, R15)"""
+        url = '/api/queues/opportunities/'
+        etag = self._get(url)['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.neighbour.status = 'paused'
+            self.neighbour.save()
+        
+        response = self._get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['can_start_any'])
+    
+    def test_unrelated_change_keeps_304(self):
+        """Activity at a company the student does not follow is not refetched"""
+        url = '/api/queues/'
+        etag = self._get(url)['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Queue.objects.create(company=self.other_company, student=self.stranger)
+        
+        self.assertEqual(self._get(url, etag).status_code, 304)
+    
+    def test_company_status_change_invalidates(self):
+        url = '/api/queues/'
+        etag = self._get(url)['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.pause()
+        
+        self.assertEqual(self._get(url, etag).status_code, 200)
@@ -5,7 +5,9 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import ListCreateAPIView
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from core import versions
 from core.permissions import IsStudent, IsCompanyToken, IsOwnerOrAdmin
 from .models import Queue
 from .services import QueueService
@@ -30,6 +32,10 @@ class StudentQueueListView(ListCreateAPIView):
             return QueueCreateSerializer
         return QueueStudentSerializer
     
+    @versions.versioned(versions.student_keys)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+    
     def get_queryset(self):
         return Queue.objects.filter(
             student=self.request.user.student
@@ -37,9 +43,11 @@ class StudentQueueListView(ListCreateAPIView):
     
     def perform_create(self, serializer):
         """Override to trigger notification on inscription"""
-        queue_entry = serializer.save()
-        # Trigger notification for new inscription
-        NotificationService.on_queue_inscription(queue_entry)
+        # Inscription and its outbox events commit together
+        with transaction.atomic():
+            queue_entry = serializer.save()
+            # Trigger notification for new inscription
+            NotificationService.on_queue_inscription(queue_entry)
 
 
 class QueueStartInterviewView(APIView):
@@ -58,20 +66,13 @@ class QueueStartInterviewView(APIView):
             student=request.user.student
         )
         
-        # Use service for validation and action
-        can_start, error = QueueService.can_start_interview(queue_entry)
-        
-        if not can_start:
-            return Response(
-                {'detail': error},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+        # Service validates (R10) and claims the slot atomically
         try:
-            QueueService.start_interview(queue_entry)
-            
-            # Trigger notifications
-            NotificationService.on_interview_started(queue_entry)
+            with transaction.atomic():
+                QueueService.start_interview(queue_entry)
+                
+                # Trigger notifications
+                NotificationService.on_interview_started(queue_entry)
             
             return Response({
                 'message': f"Entretien commencé chez {queue_entry.company.name}",
@@ -104,14 +105,15 @@ class QueueCompleteView(APIView):
         )
         
         try:
-            result = QueueService.complete_interview(queue_entry)
-            
-            # Trigger notifications
-            NotificationService.on_interview_completed(
-                completed_student=result['completed_student'],
-                company=company,
-                next_students=result['next_available']
-            )
+            with transaction.atomic():
+                result = QueueService.complete_interview(queue_entry)
+                
+                # Trigger notifications
+                NotificationService.on_interview_completed(
+                    completed_student=result['completed_student'],
+                    company=company,
+                    next_students=result['next_available']
+                )
             
             return Response({
                 'message': f"{queue_entry.student.full_name} marqué comme passé",
@@ -134,29 +136,12 @@ class StudentOpportunitiesView(APIView):
     
     permission_classes = [IsStudent]
     
+    @versions.versioned(versions.student_keys)
     def get(self, request):
         student = request.user.student
         opportunities = QueueService.get_student_opportunities(student)
         
-        result = []
-        for opp in opportunities:
-            entry = opp['queue_entry']
-            result.append({
-                'queue_id': entry.id,
-                'company_id': entry.company_id,
-                'company_name': entry.company.name,
-                'company_status': entry.company.status,
-                'position': opp['position'],
-                'can_start': opp['can_start'],
-                'ahead_count': opp['ahead_count'],
-                'reason': opp['reason']
-            })
-        
-        return Response({
-            'student_status': student.status,
-            'opportunities': result,
-            'can_start_any': any(o['can_start'] for o in opportunities)
-        })
+        return Response(QueueService.serialize_opportunities(student.status, opportunities))
 
 
 class QueueDetailView(APIView):
@@ -170,9 +155,10 @@ class QueueDetailView(APIView):
         queue_entry = get_object_or_404(Queue, pk=pk)
         self.check_object_permissions(request, queue_entry)
         
-        # Trigger notification before deletion so we have the data
-        NotificationService.on_queue_cancel(queue_entry)
-        
-        QueueService.cancel_inscription(queue_entry)
+        with transaction.atomic():
+            # Trigger notification before deletion so we have the data
+            NotificationService.on_queue_cancel(queue_entry)
+            
+            QueueService.cancel_inscription(queue_entry)
         
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,139 @@
+"""
+Frame size and codec time: JSON text vs compact CBOR (notifications.compact)
+
+Plays a small fair through the services (inscriptions, status changes,
+interviews started and completed, a company pause and resume), records
+every message handed to the dispatcher (notifications, can_start,
+snapshots, dashboard deltas, admin summaries...) and compares, per event
+type and in total:
+
+- JSON: the text frame every socket gets today (encoding.prepare)
+- CBOR: the same frame in CBOR, without codes
+- compact: the 'jobfair.cbor.v1' frame (coded fields, words, templates)
+
+and the server encode / client-side decode time per frame (decode timed
+in Python, as a proxy for the browser). Everything is rolled back.
+
+Usage: python scripts/bench_compact.py [--students 40] [--companies 5] [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from collections import defaultdict
+from unittest import mock
+
+import django
+
+# Setup Django environment
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+import cbor2
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.test import TestCase
+
+from companies.models import Company
+from notifications import commands, compact, encoding
+from notifications.dispatcher import notification_dispatcher
+from notifications.services import NotificationService
+from queues.models import Queue
+from queues.services import QueueService
+from students.models import Student
+
+User = get_user_model()
+
+
+def play_fair(students_count, companies_count):
+    """Client frames sent during a scripted fair (rolled back)"""
+    recorded = []
+
+    def record(items):
+        recorded.extend(encoding.prepare(message)['text'] for _, message in items)
+        return True
+
+    def step(action, *args):
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            try:
+                action(*args)
+            except commands.CommandError:
+                pass
+
+    with transaction.atomic(), mock.patch.object(notification_dispatcher, 'submit_many', record):
+        companies = [
+            Company.objects.create(name=f'Bench Company {i}', max_concurrent_interviews=2)
+            for i in range(companies_count)
+        ]
+        students = []
+        for i in range(students_count):
+            user = User.objects.create_user(email=f'bench_compact_{i}@test.com', password='x', role='student')
+            students.append(Student.objects.create(user=user, first_name='Camille', last_name=f'Martin {i}'))
+
+        def inscribe(student, company):
+            with transaction.atomic():
+                NotificationService.on_queue_inscription(QueueService.join_queue(student, company))
+
+        for i, student in enumerate(students):
+            for company in companies[i % companies_count:][:3]:
+                step(inscribe, student, company)
+        for student in students:
+            step(commands.set_student_status, student.id, 'available')
+        for entry in Queue.objects.filter(position__lte=2).select_related('company'):
+            step(commands.start_interview, entry.student_id, entry.id)
+        for entry in Queue.objects.filter(student__current_company=F('company'), is_completed=False).select_related('company'):
+            step(commands.complete_interview, entry.company, entry.id)
+        step(commands.set_company_status, companies[0], 'paused')
+        step(commands.set_company_status, companies[0], 'recruiting')
+        transaction.set_rollback(True)
+    return recorded
+
+
+def timed(func, frames, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            func(frame)
+    return (time.perf_counter() - started) / repeat / len(frames) * 1e6
+
+
+def run_benchmark(students, companies, repeat):
+    texts = play_fair(students, companies)
+    frames = [json.loads(text) for text in texts]
+    cbor = [cbor2.dumps(frame) for frame in frames]
+    packed = [compact.dumps(frame) for frame in frames]
+    for frame, data in zip(frames, packed):
+        assert compact.loads(data) == frame
+
+    print(f"--- COMPACT FRAMES BENCHMARK: {len(texts)} frames, {students} students, {companies} companies ---")
+    sizes = defaultdict(lambda: [0, 0, 0, 0])
+    for frame, text, plain, data in zip(frames, texts, cbor, packed):
+        for total in (sizes[frame['type']], sizes['TOTAL']):
+            total[0] += 1
+            total[1] += len(text.encode())
+            total[2] += len(plain)
+            total[3] += len(data)
+
+    print(f"\n{'event':>24} {'frames':>7} {'JSON':>9} {'CBOR':>9} {'compact':>9} {'saved':>6}")
+    for event_type, (count, json_bytes, cbor_bytes, compact_bytes) in sorted(sizes.items(), key=lambda i: i[0] == 'TOTAL'):
+        print(f"{event_type:>24} {count:>7} {json_bytes:>9} {cbor_bytes:>9} {compact_bytes:>9} "
+              f"{1 - compact_bytes / json_bytes:>6.0%}")
+
+    print(f"\n{'per frame':>24} {'encode':>10} {'decode':>10}")
+    print(f"{'JSON':>24} {timed(encoding.dumps, frames, repeat):>7.1f} us {timed(json.loads, texts, repeat):>7.1f} us")
+    print(f"{'compact':>24} {timed(compact.dumps, frames, repeat):>7.1f} us {timed(compact.loads, packed, repeat):>7.1f} us")
+    # What a CBOR socket costs per broadcast: the dispatcher's text converted
+    print(f"{'compact from text':>24} {timed(compact.from_text.__wrapped__, texts, repeat):>7.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--students', type=int, default=40)
+    parser.add_argument('--companies', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    run_benchmark(args.students, args.companies, args.repeat)
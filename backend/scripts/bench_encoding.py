@@ -0,0 +1,82 @@
+"""
+Encode cost of a group broadcast per fan-out size
+
+For a message reaching N sockets, compares the per-consumer encoding
+(each consumer's send_json, as before) with the frame encoded once by the
+dispatcher (encoding.prepare) and written as is by every consumer. Both
+json and orjson (when installed) are timed, on a dashboard-sized payload.
+
+Only the encoding is measured: no channel layer, no sockets.
+
+Usage: python scripts/bench_encoding.py [--sizes 1,10,100,300,1000] [--repeat 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import django
+
+# Setup Django environment
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.core.serializers.json import DjangoJSONEncoder
+from notifications import encoding
+
+
+def dashboard_payload(rows=40):
+    """A dashboard_delta of a busy company (whole rows, as sent)"""
+    row = {
+        'id': 0, 'student': 0, 'student_name': 'Camille Martin', 'position': 0,
+        'is_completed': False, 'is_greyed': False, 'student_status': 'available',
+        'joined_at': '2026-03-12T09:41:27.512000Z', 'started_at': None
+    }
+    ops = [{'op': 'updated', 'section': 'waiting', 'row': {**row, 'id': i, 'student': i, 'position': i}}
+           for i in range(rows)]
+    return {'type': 'dashboard_delta', 'data': {'seq': 8, 'base': 7, 'ops': ops}, 'seq': 8}
+
+
+def per_consumer(message, sockets, dumps):
+    for _ in range(sockets):
+        dumps(encoding.client_frame(message))
+
+
+def encoded_once(message, sockets):
+    text = encoding.prepare(message)['text']
+    for _ in range(sockets):
+        # The consumer writes the text it received
+        _ = text
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run_benchmark(sizes, repeat):
+    message = dashboard_payload()
+    frame_bytes = len(encoding.dumps(encoding.client_frame(message)))
+    backend = 'orjson' if encoding.orjson is not None else 'json'
+    print(f"--- ENCODING BENCHMARK: {frame_bytes} byte frame, encoder {backend} ---")
+
+    stdlib = lambda content: json.dumps(content, cls=DjangoJSONEncoder)
+    print(f"\n{'sockets':>8} {'per-consumer json':>18} {'per-consumer fast':>18} {'encoded once':>13}")
+    for sockets in sizes:
+        before = timed(lambda: per_consumer(message, sockets, stdlib), repeat)
+        fast = timed(lambda: per_consumer(message, sockets, encoding.dumps), repeat)
+        once = timed(lambda: encoded_once(message, sockets), repeat)
+        print(f"{sockets:>8} {before:>15.3f} ms {fast:>15.3f} ms {once:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', default='1,10,100,300,1000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    run_benchmark([int(size) for size in args.sizes.split(',')], args.repeat)
@@ -0,0 +1,159 @@
+"""
+Fan-out benchmark for company pause/resume notifications
+
+Sends one payload to N student groups, each with a listening channel,
+and compares the per-recipient path (one async_to_sync group_send per
+student, as NotificationService did before) with the batched fan-out
+(one submit_many drained on the loop). Also times the outbox writes:
+one OutboxEvent.record per student vs one record_many for the batch
+(rolled back afterwards).
+
+Runs on the in-memory layer, and on Redis when --redis (or REDIS_URL)
+is given.
+
+Usage: python scripts/bench_fanout.py [--recipients 1000] [--redis redis://localhost:6379/0]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+
+import django
+
+# Setup Django environment
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, channel_layers
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from notifications.dispatcher import NotificationDispatcher
+from notifications.models import OutboxEvent
+
+GROUP_PATTERN = 'student_bench_fanout_{}'
+PAYLOAD = {
+    'notification_type': 'company_status',
+    'message': "Bench Corp est maintenant en pause",
+    'company_id': 0,
+    'company_name': 'Bench Corp',
+    'status': 'paused'
+}
+
+
+class BenchLoop:
+    """Event loop in a thread, standing in for the ASGI server loop"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro, timeout=120):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout=timeout)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+async def listen(layer, groups):
+    channels = []
+    for group in groups:
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        channels.append(channel)
+    return channels
+
+
+async def receive_all(layer, channels):
+    for channel in channels:
+        await layer.receive(channel)
+
+
+async def forget(layer, groups, channels):
+    for group, channel in zip(groups, channels):
+        await layer.group_discard(group, channel)
+
+
+def bench_layer(name, layer, recipients):
+    print(f"\n[{name}]")
+    channel_layers.set('default', layer)
+    bench = BenchLoop()
+    groups = [GROUP_PATTERN.format(i) for i in range(recipients)]
+    message = {'type': 'notification', 'data': PAYLOAD}
+    try:
+        channels = bench.run(listen(layer, groups))
+
+        # Before: one blocking round trip per student (request thread)
+        started = time.monotonic()
+        for group in groups:
+            async_to_sync(layer.group_send)(group, message)
+        sequential = time.monotonic() - started
+        bench.run(receive_all(layer, channels))
+        print(f"   Per-recipient sends: {sequential * 1000:8.1f} ms blocking the request")
+
+        # After: one hop to the loop, batches sent concurrently across groups
+        dispatcher = NotificationDispatcher()
+
+        async def bind():
+            dispatcher.bind(asyncio.get_running_loop())
+        bench.run(bind())
+
+        started = time.monotonic()
+        dispatcher.submit_many([(group, message) for group in groups])
+        handed_off = time.monotonic() - started
+        bench.run(dispatcher.join())
+        delivered = time.monotonic() - started
+        bench.run(receive_all(layer, channels))
+        latency = dispatcher.metrics()['latency_ms']
+        print(f"   Fan-out hand-off:    {handed_off * 1000:8.1f} ms blocking the request")
+        print(f"   Fan-out delivered:   {delivered * 1000:8.1f} ms "
+              f"(p50 {latency['p50']} ms, p95 {latency['p95']} ms)")
+        dispatcher.unbind()
+
+        bench.run(forget(layer, groups, channels))
+    finally:
+        bench.close()
+
+
+def bench_outbox(recipients):
+    print("\n[outbox]")
+    groups = [GROUP_PATTERN.format(i) for i in range(recipients)]
+
+    for label, write in (
+        ('Per-recipient record', lambda: [OutboxEvent.record(g, 'notification', PAYLOAD) for g in groups]),
+        ('Batched record_many ', lambda: OutboxEvent.record_many([(g, 'notification', PAYLOAD) for g in groups])),
+    ):
+        with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+            started = time.monotonic()
+            write()
+            elapsed = time.monotonic() - started
+            transaction.set_rollback(True)
+        print(f"   {label}: {elapsed * 1000:8.1f} ms, {len(queries)} queries")
+
+
+def run_benchmark(recipients, redis_url):
+    print(f"--- FAN-OUT BENCHMARK: {recipients} recipients ---")
+    bench_layer('in-memory', InMemoryChannelLayer(capacity=10), recipients)
+
+    if redis_url:
+        from channels_redis.core import RedisChannelLayer
+        bench_layer('redis', RedisChannelLayer(hosts=[redis_url]), recipients)
+    else:
+        print("\n[redis] skipped (pass --redis or set REDIS_URL)")
+
+    bench_outbox(recipients)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--recipients', type=int, default=1000)
+    parser.add_argument('--redis', default=os.environ.get('REDIS_URL'))
+    args = parser.parse_args()
+
+    run_benchmark(args.recipients, args.redis)
@@ -0,0 +1,64 @@
+"""
+Memory cost of presence tracking per connection
+
+Registers N sockets in a PresenceRegistry (students, a few company
+tablets, admins, as at the fair) and measures what the registry
+allocates with tracemalloc. Channel names are shaped like the channel
+layer's. The group names and channel names themselves are counted: the
+registry is the only one holding them in this benchmark.
+
+Usage: python scripts/bench_presence.py [--connections 100,1000,10000]
+"""
+import os
+import sys
+import uuid
+import asyncio
+import argparse
+import tracemalloc
+
+import django
+
+# Setup Django environment
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from notifications.presence import PresenceRegistry
+
+
+def sockets(count):
+    """(channel_name, personal group) of count sockets: 1 tablet or admin per 20"""
+    for i in range(count):
+        channel_name = f"specific.{uuid.uuid4().hex}!{uuid.uuid4().hex}"
+        if i % 20 == 0:
+            group = f"company_{uuid.uuid4().hex}" if i % 40 else None
+        else:
+            group = f"student_{i}"
+        yield channel_name, group
+
+
+async def register(registry, count):
+    for channel_name, group in sockets(count):
+        await registry.connect(channel_name, group)
+
+
+def run_benchmark(sizes):
+    print("--- PRESENCE MEMORY BENCHMARK ---")
+    print(f"\n{'connections':>12} {'allocated':>12} {'per connection':>15}")
+    for count in sizes:
+        registry = PresenceRegistry()
+        registry.shared = False
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        asyncio.run(register(registry, count))
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        print(f"{count:>12} {allocated / 1024:>9.1f} KB {allocated / count:>11.0f} B")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--connections', default='100,1000,10000')
+    args = parser.parse_args()
+
+    run_benchmark([int(count) for count in args.connections.split(',')])
@@ -0,0 +1,122 @@
+"""
+Contention benchmark for QueueService.start_interview slot claims
+
+Worker threads loop join → start → complete → back to available on one
+company and report claims/sec. After every successful claim the number of
+students in interview is sampled: it must never exceed
+max_concurrent_interviews (R9-R11), and the slot counter must end equal
+to the real interview count.
+
+Usage: python scripts/bench_slot_claims.py [--threads 16] [--slots 2] [--seconds 5]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+import django
+
+# Setup Django environment
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.db import connection, OperationalError
+from students.models import Student
+from companies.models import Company
+from queues.models import Queue
+from queues.services import QueueService
+
+User = get_user_model()
+
+COMPANY_NAME = 'Bench Slot Corp'
+EMAIL_PATTERN = 'bench_slot_{}@jobfair.com'
+
+
+def cleanup():
+    Company.objects.filter(name=COMPANY_NAME).delete()
+    User.objects.filter(email__startswith='bench_slot_').delete()
+
+
+def run_benchmark(threads, slots, seconds):
+    print(f"--- SLOT CLAIM BENCHMARK: {threads} threads, {slots} slots, {seconds}s ---")
+    cleanup()
+
+    company = Company.objects.create(name=COMPANY_NAME, max_concurrent_interviews=slots)
+    students = []
+    for i in range(threads):
+        user = User.objects.create(email=EMAIL_PATTERN.format(i), role='student')
+        students.append(Student.objects.create(user=user, first_name=f'Bench{i}', last_name='Slot'))
+
+    lock = threading.Lock()
+    stats = {'claims': 0, 'rejected': 0, 'lock_errors': 0, 'max_in_interview': 0}
+    deadline = time.monotonic() + seconds
+
+    def worker(student):
+        try:
+            while time.monotonic() < deadline:
+                entry = Queue.objects.filter(company=company, student=student).first()
+                if entry is None:
+                    entry = QueueService.join_queue(student, company)
+                entry = Queue.objects.select_related('student', 'company').get(pk=entry.pk)
+
+                try:
+                    QueueService.start_interview(entry)
+                except ValueError:
+                    with lock:
+                        stats['rejected'] += 1
+                    # Not our turn yet: retry like an impatient click
+                    time.sleep(0.005)
+                    continue
+                except OperationalError:
+                    # SQLite busy timeout; PostgreSQL waits on the row lock instead
+                    with lock:
+                        stats['lock_errors'] += 1
+                    continue
+
+                in_interview = Student.objects.filter(current_company=company).count()
+                with lock:
+                    stats['claims'] += 1
+                    stats['max_in_interview'] = max(stats['max_in_interview'], in_interview)
+
+                QueueService.complete_interview(entry)
+                entry.student.set_available()
+                entry.delete()
+        finally:
+            connection.close()
+
+    started = time.monotonic()
+    workers = [threading.Thread(target=worker, args=(s,)) for s in students]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    company.refresh_from_db()
+    real_count = company.get_current_interview_count()
+
+    print(f"   Claims:           {stats['claims']} ({stats['claims'] / elapsed:.1f} claims/sec)")
+    print(f"   Rejected clicks:  {stats['rejected']} ({stats['rejected'] / elapsed:.1f}/sec)")
+    print(f"   Lock errors:      {stats['lock_errors']}")
+    print(f"   Max in interview: {stats['max_in_interview']} (limit {slots})")
+    print(f"   Slot counter:     {company.occupied_slots} (real {real_count})")
+
+    ok = stats['max_in_interview'] <= slots and company.occupied_slots == real_count
+    cleanup()
+
+    print(f"\n--- {'INVARIANT HOLDS' if ok else 'INVARIANT VIOLATED'} ---")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--slots', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    success = run_benchmark(args.threads, args.slots, args.seconds)
+    sys.exit(0 if success else 1)
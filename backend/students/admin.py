@@ -19,6 +19,12 @@ class StudentAdmin(admin.ModelAdmin):
         ('Status', {'fields': ('status', 'current_company')}),
     )
     
+    def save_model(self, request, obj, form, change):
+        """Status/current_company edits bypass claim/release: realign slot counters"""
+        old_company_id = form.initial.get('current_company') if change else None
+        super().save_model(request, obj, form, change)
+        obj.sync_interview_slots(old_company_id, obj.current_company_id)
+    
     def full_name(self, obj):
         return obj.full_name
     full_name.short_description = 'Name'
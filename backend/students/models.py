@@ -4,6 +4,7 @@ Linked to User model via OneToOne relationship
 Implements status tracking per business rules R2-R8
 """
 from django.db import models
+from django.db.models.signals import post_save
 from django.conf import settings
 
 
@@ -50,6 +51,15 @@ class Student(models.Model):
         verbose_name = 'Student'
         verbose_name_plural = 'Students'
     
+    # Interview company when loaded/last saved (queues.signals pushes slot changes)
+    loaded_company_id = None
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_company_id = dict(zip(field_names, values)).get('current_company_id')
+        return instance
+    
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
     
@@ -63,21 +73,63 @@ class Student(models.Model):
     
     def start_interview(self, company):
         """
-        Start an interview at given company
-        Called when student clicks "Commencer mon entretien"
+        Start an interview at given company without R10 checks
+        QueueService.start_interview is the validated, race-free path
         """
         self.status = 'in_interview'
         self.current_company = company
         self.save()
+        company.occupy_interview_slot()
+    
+    def sync_interview_slots(self, *company_ids):
+        """
+        Realign the slot counters of these companies after a change that
+        did not go through claim/release (admin edits of status or
+        current_company): sync_occupied_slots corrects both directions
+        """
+        from companies.models import Company
+        for company in Company.objects.filter(pk__in={pk for pk in company_ids if pk}):
+            company.sync_occupied_slots()
+    
+    def claim_interview(self, company):
+        """
+        R10: Atomically move from available to in_interview at company
+        
+        Conditional UPDATE, so a student can never start two interviews
+        at once even if both requests passed validation.
+        
+        Returns:
+            bool: True if the student was available and is now in interview
+        """
+        claimed = Student.objects.filter(
+            pk=self.pk,
+            status='available',
+            current_company__isnull=True
+        ).update(status='in_interview', current_company=company)
+        if not claimed:
+            return False
+        
+        self.status = 'in_interview'
+        self.current_company = company
+        # update() skips signals; derived state (queue index) listens to post_save
+        post_save.send(
+            sender=Student, instance=self, created=False,
+            update_fields=frozenset({'status', 'current_company'}),
+            raw=False, using=self._state.db
+        )
+        return True
     
     def end_interview(self):
         """
         End current interview (R7: auto-pause after marked complete)
         Called when company marks student as 'passé'
         """
+        company = self.current_company
         self.status = 'paused'
         self.current_company = None
         self.save()
+        if company:
+            company.release_interview_slot()
     
     def set_available(self):
         """
@@ -5,10 +5,14 @@ from rest_framework import status, viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db import transaction
+from core import versions
 from core.permissions import IsStudent, IsAdmin
 from .models import Student
+from companies.models import Company
 from .serializers import StudentSerializer, StudentStatusSerializer, StudentAdminSerializer
 from notifications.services import NotificationService
+from queues.index import queue_index
 
 
 class StudentMeView(APIView):
@@ -16,6 +20,7 @@ class StudentMeView(APIView):
     
     permission_classes = [IsStudent]
     
+    @versions.versioned(versions.student_profile_keys)
     def get(self, request):
         student = request.user.student
         serializer = StudentSerializer(student)
@@ -45,14 +50,15 @@ class StudentStatusView(APIView):
             context={'student': student}
         )
         if serializer.is_valid():
-            serializer.save()
-            new_status = student.status
-            
-            # Trigger notification if status actually changed
-            if old_status != new_status:
-                NotificationService.on_student_status_change(
-                    student, old_status, new_status
-                )
+            with transaction.atomic():
+                serializer.save()
+                new_status = student.status
+                
+                # Trigger notification if status actually changed
+                if old_status != new_status:
+                    NotificationService.on_student_status_change(
+                        student, old_status, new_status
+                    )
             
             return Response({
                 'message': f"Status changed to '{student.status}'",
@@ -70,14 +76,18 @@ class StudentAdminViewSet(viewsets.ModelViewSet):
     
     def perform_update(self, serializer):
         """Trigger notification if status changed by admin"""
-        old_status = self.get_object().status
-        instance = serializer.save()
-        new_status = instance.status
-        
-        if old_status != new_status:
-            NotificationService.on_student_status_change(
-                instance, old_status, new_status
-            )
+        old = self.get_object()
+        old_status, old_company_id = old.status, old.current_company_id
+        with transaction.atomic():
+            instance = serializer.save()
+            new_status = instance.status
+            # Bypasses claim/release: keep the slot counters right
+            instance.sync_interview_slots(old_company_id, instance.current_company_id)
+            
+            if old_status != new_status:
+                NotificationService.on_student_status_change(
+                    instance, old_status, new_status
+                )
 
     def perform_destroy(self, instance):
         """Delete associated user account when deleting student profile"""
@@ -88,6 +98,10 @@ class StudentAdminViewSet(viewsets.ModelViewSet):
     def bulk_available(self, request):
         """Set all students to 'available' status"""
         updated_count = Student.objects.all().update(status='available', current_company=None)
+        Company.objects.update(occupied_slots=0)
+        # Bulk update bypasses model signals
+        transaction.on_commit(queue_index.invalidate)
+        transaction.on_commit(versions.bump_epoch)
         return Response({
             'message': f'Updated {updated_count} students to available',
             'updated': updated_count
@@ -3,6 +3,7 @@ Serializers for user registration and authentication
 """
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from users.models import User
 from students.models import Student
 
@@ -63,3 +64,20 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'email', 'role', 'created_at']
         read_only_fields = fields
+
+
+class JobFairTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Login serializer adding role/student_id claims to the JWT
+    The WebSocket middleware joins student_{id}/admin groups from these
+    claims without any DB lookup (access tokens inherit refresh claims)
+    """
+    
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['role'] = user.role
+        token['is_superuser'] = user.is_superuser
+        student = getattr(user, 'student', None) if user.role == 'student' else None
+        token['student_id'] = student.id if student else None
+        return token
@@ -2,7 +2,7 @@
  * WebSocket Context
  * Manages WebSocket connection and provides hooks for real-time updates
  */
-import { createContext, useContext, useEffect, useState, useCallback } from 'react'
+import { createContext, useContext, useEffect, useState, useCallback, useRef } from 'react'
 import { useQueryClient } from '@tanstack/react-query'
 import { wsClient } from '../services/websocket'
 import { useAuth } from './AuthContext'
@@ -17,10 +17,15 @@ export function WebSocketProvider({ children }) {
     const { showToast } = useToast()
     const [connectionStatus, setConnectionStatus] = useState('disconnected')
     const [lastNotification, setLastNotification] = useState(null)
+    // View versions at the last catch-up: what the cached queries reflect
+    const versionsRef = useRef(null)
+    // Outbox seq of the last opportunities snapshot applied (its version)
+    const snapshotSeqRef = useRef(0)
 
     // Connect WebSocket when authenticated
     useEffect(() => {
         if (isAuthenticated && user) {
+            snapshotSeqRef.current = 0
             const token = getAccessToken()
             wsClient.connect(token)
         } else {
@@ -35,6 +40,19 @@ export function WebSocketProvider({ children }) {
 
     // Set up event listeners
     useEffect(() => {
+        // Invalidations requested while handling one frame (a batch carries
+        // several events for the same request) are merged and run once
+        const pendingKeys = new Set()
+        const invalidate = (...keys) => {
+            if (pendingKeys.size === 0) {
+                queueMicrotask(() => {
+                    pendingKeys.forEach((key) => queryClient.invalidateQueries({ queryKey: [key] }))
+                    pendingKeys.clear()
+                })
+            }
+            keys.forEach((key) => pendingKeys.add(key))
+        }
+
         const handleConnection = (data) => {
             setConnectionStatus(data.status)
         }
@@ -48,9 +66,7 @@ export function WebSocketProvider({ children }) {
             }
 
             // Student/Admin dashboard usually need refresh on notifications
-            queryClient.invalidateQueries({ queryKey: ['queues'] })
-            queryClient.invalidateQueries({ queryKey: ['opportunities'] })
-            queryClient.invalidateQueries({ queryKey: ['profile'] })
+            invalidate('queues', 'profile')
         }
 
         const handleUrgent = (data) => {
@@ -62,25 +78,56 @@ export function WebSocketProvider({ children }) {
             }
 
             // Invalidate relevant queries
-            queryClient.invalidateQueries({ queryKey: ['opportunities'] })
-            queryClient.invalidateQueries({ queryKey: ['queues'] })
-            queryClient.invalidateQueries({ queryKey: ['profile'] })
+            invalidate('queues', 'profile')
         }
 
         const handleQueueUpdate = (data) => {
-            // Invalidate queue queries to refetch
-            queryClient.invalidateQueries({ queryKey: ['queues'] })
-            queryClient.invalidateQueries({ queryKey: ['companies'] })
-            queryClient.invalidateQueries({ queryKey: ['dashboard'] })
-            queryClient.invalidateQueries({ queryKey: ['opportunities'] })
-            queryClient.invalidateQueries({ queryKey: ['admin-stats'] })
+            // Invalidate queue queries to refetch (the company list follows
+            // live metrics instead, see pages/student/Companies)
+            invalidate('queues', 'dashboard', 'admin-stats')
         }
 
         const handleStatusChange = (data) => {
             // Invalidate profile queries
-            queryClient.invalidateQueries({ queryKey: ['profile'] })
-            queryClient.invalidateQueries({ queryKey: ['opportunities'] })
-            queryClient.invalidateQueries({ queryKey: ['admin-stats'] })
+            invalidate('profile', 'admin-stats')
+        }
+
+        // Opportunities are pushed whenever they change (no refetch); a
+        // snapshot older than the one applied (lower seq) is ignored
+        const handleOpportunities = ({ data, seq }) => {
+            if (typeof seq === 'number') {
+                if (seq <= snapshotSeqRef.current) return
+                snapshotSeqRef.current = seq
+            }
+            queryClient.setQueryData(['opportunities'], data)
+        }
+
+        // Sent on each connection; after missed events (resync: replay gap,
+        // or a server too far behind), only the views whose version changed
+        // are refetched, after the server's random delay (no refetch storm)
+        const handleCatchUp = ({ versions, resync, delay }) => {
+            const previous = versionsRef.current
+            versionsRef.current = versions
+            if (!resync) return
+            const names = Object.keys(versions)
+            const refetch = () => {
+                if (!previous || names.length === 0) {
+                    queryClient.invalidateQueries()
+                    return
+                }
+                const changed = new Set([...Object.keys(previous), ...names])
+                changed.forEach((name) => {
+                    if (previous[name] && previous[name] === versions[name]) changed.delete(name)
+                })
+                invalidate(...changed)
+            }
+            if (delay) setTimeout(refetch, delay * 1000)
+            else refetch()
+        }
+
+        // A command got no ack: it may have run, refetch what it could change
+        const handleCommandUnconfirmed = () => {
+            queryClient.invalidateQueries()
         }
 
         // Visibility change listener for auto-reconnect
@@ -100,6 +147,9 @@ export function WebSocketProvider({ children }) {
         wsClient.on('status_change', handleStatusChange)
         wsClient.on('interview_started', handleQueueUpdate)
         wsClient.on('interview_completed', handleQueueUpdate)
+        wsClient.on('opportunities_snapshot', handleOpportunities)
+        wsClient.on('catch_up', handleCatchUp)
+        wsClient.on('command_unconfirmed', handleCommandUnconfirmed)
 
         document.addEventListener('visibilitychange', handleVisibilityChange)
 
@@ -110,6 +160,9 @@ export function WebSocketProvider({ children }) {
             wsClient.off('can_start', handleUrgent)
             wsClient.off('queue_update', handleQueueUpdate)
             wsClient.off('status_change', handleStatusChange)
+            wsClient.off('opportunities_snapshot', handleOpportunities)
+            wsClient.off('catch_up', handleCatchUp)
+            wsClient.off('command_unconfirmed', handleCommandUnconfirmed)
             document.removeEventListener('visibilitychange', handleVisibilityChange)
         }
     }, [queryClient, showToast])
@@ -16,6 +16,7 @@ export default function AdminDashboard() {
     const queryClient = useQueryClient()
     const { isConnected } = useWebSocket()
     const [activityFeed, setActivityFeed] = useState([])
+    const [streamLevel, setStreamLevel] = useState('summary')
 
     // Fetch stats form API
     const { data: stats, isLoading } = useQuery({
@@ -24,6 +25,13 @@ export default function AdminDashboard() {
         refetchInterval: 60000,
     })
 
+    // Idle students are paginated server-side
+    const { data: idleStudents } = useQuery({
+        queryKey: ['admin-stats', 'idle-students'],
+        queryFn: () => adminAPI.getIdleStudents().then(res => res.data),
+        refetchInterval: 60000,
+    })
+
     // Listen to WebSocket events for real-time updates
     useEffect(() => {
         const handleUpdate = (event) => {
@@ -40,10 +48,33 @@ export default function AdminDashboard() {
             setActivityFeed(prev => [newActivity, ...prev].slice(0, 10))
         }
 
+        // Summary level: counters are applied in place, no refetch
+        const handleSummary = ({ data: summary }) => {
+            queryClient.setQueryData(['admin-stats'], (old) => old && {
+                ...old,
+                ...summary.counters,
+                ...(summary.idle_companies && { idle_companies: summary.idle_companies }),
+                ...(summary.presence && { presence: summary.presence }),
+            })
+            if (summary.deltas.idle_students_count) {
+                queryClient.invalidateQueries({ queryKey: ['admin-stats', 'idle-students'] })
+            }
+
+            const timestamp = new Date().toLocaleTimeString()
+            const activities = summary.activity.map((activity, i) => ({
+                id: `${Date.now()}-${i}`,
+                type: activity.notification_type,
+                message: activity.message || 'Nouvelle activité',
+                timestamp,
+            }))
+            setActivityFeed(prev => [...activities.reverse(), ...prev].slice(0, 10))
+        }
+
         const ws = import('../../services/websocket').then(({ wsClient }) => {
             wsClient.on('queue_update', handleUpdate)
             wsClient.on('status_change', handleUpdate)
             wsClient.on('notification', handleUpdate)
+            wsClient.on('admin_summary', handleSummary)
         })
 
         return () => {
@@ -51,10 +82,17 @@ export default function AdminDashboard() {
                 wsClient.off('queue_update', handleUpdate)
                 wsClient.off('status_change', handleUpdate)
                 wsClient.off('notification', handleUpdate)
+                wsClient.off('admin_summary', handleSummary)
             })
         }
     }, [queryClient])
 
+    const toggleStreamLevel = () => {
+        const level = streamLevel === 'summary' ? 'firehose' : 'summary'
+        setStreamLevel(level)
+        import('../../services/websocket').then(({ wsClient }) => wsClient.setAdminLevel(level))
+    }
+
     if (isLoading) {
         return (
             <div className="flex items-center justify-center min-h-[400px]">
@@ -69,8 +107,20 @@ export default function AdminDashboard() {
                 <div>
                     <h1 className="text-2xl font-bold text-neutral-900">Administration</h1>
                     <p className="text-neutral-500 mt-1">Vue d&apos;ensemble du forum</p>
+                    {stats?.presence && (
+                        <p className="text-sm text-neutral-400">
+                            En ligne : {stats.presence.students} étudiants, {stats.presence.companies} entreprises
+                        </p>
+                    )}
                 </div>
                 <div className="flex items-center gap-2 text-sm text-neutral-500">
+                    <button
+                        onClick={toggleStreamLevel}
+                        className="text-primary-600 hover:text-primary-700 font-medium mr-2"
+                        title="Résumé chaque seconde ou chaque événement"
+                    >
+                        {streamLevel === 'summary' ? 'Flux : résumé' : 'Flux : détaillé'}
+                    </button>
                     <div className={`w-2 h-2 rounded-full ${isConnected ? 'bg-success-500' : 'bg-neutral-400'}`} />
                     {isConnected ? 'Connecté au live' : (
                         <div className="flex items-center gap-2">
@@ -170,14 +220,14 @@ export default function AdminDashboard() {
                     <Card>
                         <CardTitle className="flex items-center gap-2 text-neutral-500">
                             <Users size={20} />
-                            Étudiants sans file d'attente ({stats?.idle_students?.length || 0})
+                            Étudiants sans file d'attente ({stats?.idle_students_count || 0})
                         </CardTitle>
                         <div className="mt-4 max-h-48 overflow-y-auto">
-                            {!stats?.idle_students?.length ? (
+                            {!idleStudents?.results?.length ? (
                                 <p className="text-neutral-400 text-sm">Tous les étudiants sont inscrits</p>
                             ) : (
                                 <ul className="space-y-2">
-                                    {stats.idle_students.map(s => (
+                                    {idleStudents.results.map(s => (
                                         <li
                                             key={s.id}
                                             className="text-sm flex justify-between items-center bg-neutral-50 p-2 rounded cursor-pointer hover:bg-neutral-100 transition-colors"
@@ -189,6 +239,9 @@ export default function AdminDashboard() {
                                             </span>
                                         </li>
                                     ))}
+                                    {idleStudents.count > idleStudents.results.length && (
+                                        <p className="text-xs text-center text-neutral-400 pt-2">Et {idleStudents.count - idleStudents.results.length} autres...</p>
+                                    )}
                                 </ul>
                             )}
                         </div>
@@ -13,6 +13,45 @@ import { StatusBadge } from '../../components/ui/Badge'
 import LogoLoader from '../../components/ui/LogoLoader'
 import { Play, Pause, UserCheck, Clock, Users, Check, Settings } from 'lucide-react'
 
+const SECTIONS = ['in_interview', 'waiting', 'completed']
+const COMPLETED_LIMIT = 20
+
+const byPosition = (a, b) => a.position - b.position
+// Latest first, entries without timestamp last (same order as the server)
+const byCompletedDesc = (a, b) => {
+    if (!a.completed_at !== !b.completed_at) return a.completed_at ? -1 : 1
+    if (a.completed_at !== b.completed_at) return a.completed_at < b.completed_at ? 1 : -1
+    return b.id - a.id
+}
+
+/**
+ * Apply a dashboard_delta (added/moved/updated/removed rows, company) to a dashboard
+ */
+function applyDashboardDelta(dashboard, delta) {
+    const next = { ...dashboard, seq: delta.seq }
+    SECTIONS.forEach((section) => { next[section] = [...dashboard[section]] })
+    const removeRow = (id) => SECTIONS.forEach((section) => {
+        next[section] = next[section].filter((row) => row.id !== id)
+    })
+
+    delta.ops.forEach((op) => {
+        if (op.op === 'removed') {
+            removeRow(op.id)
+        } else if (op.op === 'company') {
+            next.company = op.company
+            next.stats = op.stats
+        } else {
+            removeRow(op.row.id)
+            next[op.section].push(op.row)
+        }
+    })
+
+    next.in_interview.sort(byPosition)
+    next.waiting.sort(byPosition)
+    next.completed = next.completed.sort(byCompletedDesc).slice(0, COMPLETED_LIMIT)
+    return next
+}
+
 export default function CompanyDashboard() {
     const { token } = useParams()
     const queryClient = useQueryClient()
@@ -26,12 +65,20 @@ export default function CompanyDashboard() {
             setWsConnected(data.status === 'connected')
         }
 
-        const handleQueueUpdate = () => {
-            queryClient.invalidateQueries({ queryKey: ['company-dashboard', token] })
+        // Patches on top of the fetched dashboard; full GET only on a gap
+        const handleDashboardDelta = ({ data: delta }) => {
+            const queryKey = ['company-dashboard', token]
+            const current = queryClient.getQueryData(queryKey)
+            if (current && delta.seq <= current.seq) return
+            if (!current || delta.base !== current.seq) {
+                queryClient.invalidateQueries({ queryKey })
+                return
+            }
+            queryClient.setQueryData(queryKey, applyDashboardDelta(current, delta))
         }
 
         wsClient.on('connection', handleConnection)
-        wsClient.on('queue_update', handleQueueUpdate)
+        wsClient.on('dashboard_delta', handleDashboardDelta)
 
         const handleVisibilityChange = () => {
             if (document.visibilityState === 'visible' && !wsClient.isConnected()) {
@@ -42,7 +89,7 @@ export default function CompanyDashboard() {
 
         return () => {
             wsClient.off('connection', handleConnection)
-            wsClient.off('queue_update', handleQueueUpdate)
+            wsClient.off('dashboard_delta', handleDashboardDelta)
             document.removeEventListener('visibilitychange', handleVisibilityChange)
             wsClient.disconnect()
         }
@@ -55,12 +102,19 @@ export default function CompanyDashboard() {
         refetchInterval: 30000,
     })
 
+    // Changes come back as dashboard deltas while the socket is up
+    const refreshIfOffline = () => {
+        if (!wsClient.isConnected()) {
+            queryClient.invalidateQueries({ queryKey: ['company-dashboard', token] })
+        }
+    }
+
     // Status mutation
     const statusMutation = useMutation({
-        mutationFn: (status) => companyDashboardAPI.updateStatus(token, status),
-        onSuccess: () => {
-            queryClient.invalidateQueries({ queryKey: ['company-dashboard', token] })
-        },
+        mutationFn: (status) => wsClient.command(
+            'set_status', { status }, () => companyDashboardAPI.updateStatus(token, status)
+        ),
+        onSuccess: refreshIfOffline,
     })
 
     // Complete mutation
@@ -85,7 +139,7 @@ export default function CompanyDashboard() {
     const settingsMutation = useMutation({
         mutationFn: (data) => companyDashboardAPI.updateSettings(token, data),
         onSuccess: () => {
-            queryClient.invalidateQueries({ queryKey: ['company-dashboard', token] })
+            refreshIfOffline()
             setIsSettingsOpen(false)
         },
         onError: (err) => {
@@ -95,10 +149,10 @@ export default function CompanyDashboard() {
     })
 
     const completeMutation = useMutation({
-        mutationFn: (queueId) => companyDashboardAPI.completeInterview(token, queueId),
-        onSuccess: () => {
-            queryClient.invalidateQueries({ queryKey: ['company-dashboard', token] })
-        },
+        mutationFn: (queueId) => wsClient.command(
+            'complete_interview', { queue_id: queueId }, () => companyDashboardAPI.completeInterview(token, queueId)
+        ),
+        onSuccess: refreshIfOffline,
     })
 
     if (isLoading) {
@@ -2,6 +2,7 @@
  * Companies Page - Student view
  * List of recruiting companies with join queue option
  */
+import { useEffect, useRef } from 'react'
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
 import { companyAPI, queueAPI } from '../../services/api'
 import Card from '../../components/ui/Card'
@@ -9,6 +10,7 @@ import Button from '../../components/ui/Button'
 import { StatusBadge } from '../../components/ui/Badge'
 import { useToast } from '../../contexts/ToastContext'
 import { useWebSocket } from '../../contexts/WebSocketContext'
+import { wsClient } from '../../services/websocket'
 import LogoLoader from '../../components/ui/LogoLoader'
 import { Building2, Users, Clock, Plus, Check, Zap, MapPin } from 'lucide-react'
 
@@ -29,6 +31,43 @@ export default function StudentCompanies() {
         queryFn: () => queueAPI.list().then(res => res.data),
     })
 
+    // Live metrics of every company seen on this page: one that pauses
+    // leaves the list (R17) but stays followed, so its resume brings it back
+    const followedIds = useRef(new Set())
+
+    useEffect(() => {
+        const before = followedIds.current.size
+        companies?.forEach((company) => followedIds.current.add(company.id))
+        if (followedIds.current.size !== before) {
+            wsClient.subscribeCompanies([...followedIds.current])
+        }
+    }, [companies])
+
+    useEffect(() => {
+        const handleMetrics = ({ data }) => {
+            const { company_id, ...changes } = data
+            const cached = queryClient.getQueryData(['companies'])
+            if (!cached) return
+            if (!cached.some((company) => company.id === company_id)) {
+                // Back to recruiting: fetch its full row
+                if (changes.status === 'recruiting') {
+                    queryClient.invalidateQueries({ queryKey: ['companies'] })
+                }
+                return
+            }
+            queryClient.setQueryData(['companies'], cached
+                .map((company) => (company.id === company_id ? { ...company, ...changes } : company))
+                .filter((company) => company.status === 'recruiting'))
+        }
+
+        wsClient.on('company_metrics', handleMetrics)
+        return () => {
+            wsClient.off('company_metrics', handleMetrics)
+            wsClient.subscribeCompanies([])
+            followedIds.current.clear()
+        }
+    }, [queryClient])
+
     // Join queue mutation
     const joinMutation = useMutation({
         mutationFn: (companyId) => queueAPI.join(companyId),
@@ -11,6 +11,7 @@ import { useToast } from '../../contexts/ToastContext'
 import LogoLoader from '../../components/ui/LogoLoader'
 import { Play, Pause, Clock, Building2, ChevronRight, Zap } from 'lucide-react'
 import { useWebSocket } from '../../contexts/WebSocketContext'
+import { wsClient } from '../../services/websocket'
 
 export default function StudentDashboard() {
     const queryClient = useQueryClient()
@@ -37,7 +38,9 @@ export default function StudentDashboard() {
 
     // Status mutation
     const statusMutation = useMutation({
-        mutationFn: (status) => studentAPI.updateStatus(status),
+        mutationFn: (status) => wsClient.command(
+            'set_status', { status }, () => studentAPI.updateStatus(status)
+        ),
         onSuccess: () => {
             queryClient.invalidateQueries({ queryKey: ['profile'] })
             queryClient.invalidateQueries({ queryKey: ['opportunities'] })
@@ -50,12 +53,14 @@ export default function StudentDashboard() {
 
     // Start interview mutation
     const startMutation = useMutation({
-        mutationFn: (queueId) => queueAPI.startInterview(queueId),
-        onSuccess: (res) => {
+        mutationFn: (queueId) => wsClient.command(
+            'start_interview', { queue_id: queueId }, () => queueAPI.startInterview(queueId)
+        ),
+        onSuccess: (data) => {
             queryClient.invalidateQueries({ queryKey: ['profile'] })
             queryClient.invalidateQueries({ queryKey: ['opportunities'] })
             queryClient.invalidateQueries({ queryKey: ['queues'] })
-            showToast(res.data.message, 'success')
+            showToast(data.message, 'success')
         },
         onError: (err) => {
             showToast(err.response?.data?.detail || 'Erreur', 'error')
@@ -155,6 +155,7 @@ export const adminAPI = {
 
     // Dashboard
     getDashboard: () => api.get('/admin/dashboard/'),
+    getIdleStudents: (page = 1) => api.get('/admin/dashboard/idle-students/', { params: { page } }),
 }
 
 export default api
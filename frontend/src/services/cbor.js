@@ -0,0 +1,95 @@
+/**
+ * Decoder for the compact notification frames ('jobfair.cbor.v1')
+ * Handles the CBOR the server sends (JSON values: numbers, strings,
+ * arrays, maps, booleans, null) and expands the codes with the schema
+ * received in connection_established (see backend notifications/compact.py).
+ * Coded keys are CBOR integers, told apart from JSON keys while decoding.
+ */
+
+const textDecoder = new TextDecoder()
+
+function decodeItem(view, bytes, state, schema) {
+    const initial = view.getUint8(state.offset++)
+    const major = initial >> 5
+    const info = initial & 0x1f
+
+    if (major === 7) {
+        if (info === 20) return false
+        if (info === 21) return true
+        if (info === 22 || info === 23) return null
+        if (info === 25) return decodeHalf(readUint(view, state, 2))
+        if (info === 26) { const value = view.getFloat32(state.offset); state.offset += 4; return value }
+        if (info === 27) { const value = view.getFloat64(state.offset); state.offset += 8; return value }
+        throw new Error(`Unsupported CBOR simple value ${info}`)
+    }
+
+    const length = readLength(view, state, info)
+    switch (major) {
+        case 0: return length
+        case 1: return -1 - length
+        case 2: { const value = bytes.slice(state.offset, state.offset + length); state.offset += length; return value }
+        case 3: {
+            const value = textDecoder.decode(bytes.subarray(state.offset, state.offset + length))
+            state.offset += length
+            return value
+        }
+        case 4: return Array.from({ length }, () => decodeItem(view, bytes, state, schema))
+        case 5: {
+            const value = {}
+            for (let i = 0; i < length; i++) {
+                const key = decodeItem(view, bytes, state, schema)
+                const name = typeof key === 'number' && schema ? schema.fields[key] : key
+                value[name] = decodeItem(view, bytes, state, schema)
+            }
+            return schema ? expandValues(value, schema) : value
+        }
+        default: throw new Error(`Unsupported CBOR major type ${major}`)
+    }
+}
+
+function readLength(view, state, info) {
+    if (info < 24) return info
+    if (info === 24) return readUint(view, state, 1)
+    if (info === 25) return readUint(view, state, 2)
+    if (info === 26) return readUint(view, state, 4)
+    if (info === 27) return Number(view.getBigUint64((state.offset += 8) - 8))
+    throw new Error('Indefinite CBOR lengths are not supported')
+}
+
+function readUint(view, state, size) {
+    const offset = state.offset
+    state.offset += size
+    if (size === 1) return view.getUint8(offset)
+    if (size === 2) return view.getUint16(offset)
+    return view.getUint32(offset)
+}
+
+function decodeHalf(half) {
+    const exponent = (half >> 10) & 0x1f
+    const fraction = half & 0x3ff
+    const sign = half & 0x8000 ? -1 : 1
+    if (exponent === 0) return sign * 2 ** -14 * (fraction / 1024)
+    if (exponent === 31) return fraction ? NaN : sign * Infinity
+    return sign * 2 ** (exponent - 15) * (1 + fraction / 1024)
+}
+
+// Coded words and message templates of a map (keys already expanded)
+function expandValues(value, schema) {
+    schema.value_fields.forEach((name) => {
+        if (typeof value[name] === 'number') value[name] = schema.words[value[name]]
+    })
+    if (typeof value.message === 'number') {
+        value.message = schema.templates[value.message].replace(/\{(\w+)\}/g, (_, field) => value[field])
+    }
+    return value
+}
+
+/**
+ * Client frame of a CBOR frame
+ * @param {ArrayBuffer} buffer
+ * @param {object} schema - Code tables (null for plain frames)
+ */
+export function decodeCbor(buffer, schema = null) {
+    const bytes = new Uint8Array(buffer)
+    return decodeItem(new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength), bytes, { offset: 0 }, schema)
+}
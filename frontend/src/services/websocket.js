@@ -1,6 +1,8 @@
 /**
  * WebSocket client for real-time notifications
  */
+import { decodeCbor } from './cbor'
+import { getAccessToken } from './api'
 
 // Helper to determine WebSocket URL from API URL
 const getWebSocketUrl = () => {
@@ -24,6 +26,15 @@ const getWebSocketUrl = () => {
 
 const WS_URL = getWebSocketUrl()
 
+// Opt-in compact binary frames (smaller on congested Wi-Fi); JSON otherwise
+const COMPACT_PROTOCOL = 'jobfair.cbor.v1'
+
+// Ack code of a command refused because the socket's JWT expired
+const SESSION_EXPIRED = 'session_expired'
+// Result of a command sent but never acked (it may have run)
+const UNCONFIRMED = { unconfirmed: true, message: 'Action envoyée, mise à jour en cours' }
+const USE_COMPACT = import.meta.env.VITE_WS_COMPACT === 'true'
+
 class WebSocketClient {
     constructor() {
         this.socket = null
@@ -34,6 +45,22 @@ class WebSocketClient {
         this.isConnecting = false
         this.authToken = null
         this.companyToken = null
+        // Last personal event seq received (sent back as resume_from)
+        this.lastSeq = null
+        // Admin stream level: 'summary' (server default) or 'firehose'
+        this.adminLevel = 'summary'
+        // Companies whose live metrics are followed (resent on reconnect)
+        this.companySubscriptions = []
+        // Commands waiting for their ack: request_id -> { type, resolve, reject, timer, fallback }
+        this.pendingCommands = new Map()
+        this.commandCounter = 0
+        this.commandTimeout = 10000
+        // Delay suggested by the server when it refused the handshake (ms)
+        this.retryAfter = null
+        // Pings proving the socket is alive (interval given by the server)
+        this.heartbeatTimer = null
+        // Code tables of compact frames (from connection_established)
+        this.schema = null
     }
 
     /**
@@ -52,6 +79,10 @@ class WebSocketClient {
             return
         }
 
+        if (authToken !== this.authToken || companyToken !== this.companyToken) {
+            // Different identity, different event stream
+            this.lastSeq = null
+        }
         this.authToken = authToken
         this.companyToken = companyToken
         this.isConnecting = true
@@ -61,23 +92,37 @@ class WebSocketClient {
         const params = []
         if (authToken) params.push(`token=${authToken}`)
         if (companyToken) params.push(`company_token=${companyToken}`)
+        if (this.lastSeq !== null) params.push(`resume_from=${this.lastSeq}`)
         if (params.length > 0) {
             url += '?' + params.join('&')
         }
 
         try {
-            this.socket = new WebSocket(url)
+            this.socket = USE_COMPACT ? new WebSocket(url, COMPACT_PROTOCOL) : new WebSocket(url)
+            this.socket.binaryType = 'arraybuffer'
+            this.schema = null
 
             this.socket.onopen = () => {
                 console.log('WebSocket connected')
                 this.isConnecting = false
                 this.reconnectAttempts = 0
+                if (this.adminLevel !== 'summary') {
+                    this.send({ type: 'subscribe', level: this.adminLevel })
+                }
+                if (this.companySubscriptions.length > 0) {
+                    this.send({ type: 'subscribe', companies: this.companySubscriptions })
+                }
                 this._emit('connection', { status: 'connected' })
             }
 
             this.socket.onmessage = (event) => {
                 try {
-                    const data = JSON.parse(event.data)
+                    const data = typeof event.data === 'string'
+                        ? JSON.parse(event.data)
+                        : decodeCbor(event.data, this.schema)
+                    if (data.type === 'connection_established' && data.schema) {
+                        this.schema = data.schema
+                    }
                     this._handleMessage(data)
                 } catch (error) {
                     console.error('WebSocket message parse error:', error)
@@ -87,7 +132,15 @@ class WebSocketClient {
             this.socket.onclose = (event) => {
                 console.log('WebSocket closed:', event.code, event.reason)
                 this.isConnecting = false
+                this._stopHeartbeat()
+                this._unconfirmPendingCommands()
                 this._emit('connection', { status: 'disconnected' })
+                if (event.code === 4429 && this.retryAfter !== null) {
+                    // Server busy (reconnection storm): come back when told
+                    this._scheduleReconnect(this.retryAfter)
+                    this.retryAfter = null
+                    return
+                }
                 this._attemptReconnect()
             }
 
@@ -106,6 +159,7 @@ class WebSocketClient {
      * Disconnect WebSocket
      */
     disconnect() {
+        this._stopHeartbeat()
         if (this.socket) {
             this.socket.close()
             this.socket = null
@@ -124,14 +178,49 @@ class WebSocketClient {
         }
 
         this.reconnectAttempts++
-        const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1)
-        console.log(`Reconnecting in ${delay}ms (attempt ${this.reconnectAttempts})`)
+        // Jitter spreads the clients of a restarted server
+        const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1) * (0.5 + Math.random())
+        console.log(`Reconnecting in ${Math.round(delay)}ms (attempt ${this.reconnectAttempts})`)
+        this._scheduleReconnect(delay)
+    }
 
+    _startHeartbeat(interval) {
+        this._stopHeartbeat()
+        this.heartbeatTimer = setInterval(() => this.ping(), interval)
+    }
+
+    _stopHeartbeat() {
+        if (this.heartbeatTimer) {
+            clearInterval(this.heartbeatTimer)
+            this.heartbeatTimer = null
+        }
+    }
+
+    _scheduleReconnect(delay) {
         this.reconnectTimer = setTimeout(() => {
             this.connect(this.authToken, this.companyToken)
         }, delay)
     }
 
+    /**
+     * Reopen the socket with a refreshed JWT, resuming the same event
+     * stream (missed events are replayed)
+     * @param {string} authToken
+     */
+    renewToken(authToken) {
+        if (!authToken || authToken === this.authToken) return
+        if (this.socket) {
+            // Replaced, not lost: no disconnected status nor reconnection
+            this.socket.onclose = null
+            this.socket.close()
+            this.socket = null
+        }
+        this._stopHeartbeat()
+        this.isConnecting = false
+        this.authToken = authToken
+        this.reconnect()
+    }
+
     /**
      * Manual reconnection trigger
      */
@@ -150,6 +239,32 @@ class WebSocketClient {
     _handleMessage(data) {
         const { type, ...payload } = data
 
+        // Events of one server request for this client: handled together
+        if (type === 'batch') {
+            payload.events.forEach((event) => this._handleMessage(event))
+            return
+        }
+
+        if (type === 'retry') {
+            this.retryAfter = payload.retry_after * 1000
+            return
+        }
+
+        if (type === 'ack') {
+            this._settleCommand(payload)
+            return
+        }
+
+        if (type === 'connection_established' && payload.heartbeat) {
+            // Silent sockets are closed by the server (code 4408)
+            this._startHeartbeat(payload.heartbeat * 1000)
+        }
+
+        // Track position in the personal event stream (replay on reconnect)
+        if (typeof data.seq === 'number') {
+            this.lastSeq = data.seq
+        }
+
         // Emit specific event type
         this._emit(type, payload)
 
@@ -213,6 +328,87 @@ class WebSocketClient {
         }
     }
 
+    /**
+     * Choose the admin stream level (kept across reconnections)
+     * @param {string} level - 'summary' (one aggregate per tick) or 'firehose' (every event)
+     */
+    setAdminLevel(level) {
+        this.adminLevel = level
+        this.send({ type: 'subscribe', level })
+    }
+
+    /**
+     * Run an interview action on the socket (start_interview,
+     * complete_interview, set_status), or through fallback() when not
+     * connected. Resolves with the HTTP view's response data either way;
+     * errors are shaped like axios ones (err.response.data.detail).
+     * When the socket's JWT has expired, the command goes through
+     * fallback() (which refreshes the token) and the socket reopens with
+     * the new one. Without an ack (timeout, socket lost) the command may
+     * have run: it resolves with { unconfirmed: true, message } and a
+     * 'command_unconfirmed' event makes the views refetch.
+     * @param {string} type - Command type
+     * @param {Object} payload - Command fields (queue_id, status)
+     * @param {Function} fallback - HTTP call returning an axios promise
+     */
+    command(type, payload, fallback) {
+        if (!this.isConnected()) {
+            return fallback().then((res) => res.data)
+        }
+        const requestId = `${Date.now()}-${++this.commandCounter}`
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => this._unconfirmCommand(requestId), this.commandTimeout)
+            this.pendingCommands.set(requestId, { type, resolve, reject, timer, fallback })
+            this.send({ type, request_id: requestId, ...payload })
+        })
+    }
+
+    _settleCommand({ request_id, ok, data, error, code }) {
+        const pending = this.pendingCommands.get(request_id)
+        if (!pending) return
+        this.pendingCommands.delete(request_id)
+        clearTimeout(pending.timer)
+        if (code === SESSION_EXPIRED) {
+            pending.fallback().then((res) => {
+                pending.resolve(res.data)
+                this.renewToken(getAccessToken())
+            }, pending.reject)
+            return
+        }
+        if (ok) {
+            pending.resolve(data)
+        } else {
+            const err = new Error(error)
+            err.response = { data: { detail: error } }
+            pending.reject(err)
+        }
+    }
+
+    _unconfirmCommand(requestId) {
+        const pending = this.pendingCommands.get(requestId)
+        if (!pending) return
+        this.pendingCommands.delete(requestId)
+        clearTimeout(pending.timer)
+        pending.resolve(UNCONFIRMED)
+        this._emit('command_unconfirmed', { type: pending.type })
+    }
+
+    _unconfirmPendingCommands() {
+        Array.from(this.pendingCommands.keys()).forEach((requestId) => this._unconfirmCommand(requestId))
+    }
+
+    /**
+     * Follow the live metrics (queue_length, available_slots, status) of
+     * exactly these companies, as 'company_metrics' events ([] stops)
+     * @param {number[]} companyIds
+     */
+    subscribeCompanies(companyIds) {
+        this.companySubscriptions = companyIds
+        if (this.isConnected()) {
+            this.send({ type: 'subscribe', companies: companyIds })
+        }
+    }
+
     /**
      * Send ping to keep connection alive
      */